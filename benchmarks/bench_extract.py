@@ -0,0 +1,42 @@
+"""
+Compares the BeautifulSoup extraction path against the raw-text scanner on large synthetic pages.
+
+    python -m benchmarks.bench_extract
+"""
+import argparse
+import timeit
+
+from bs4 import BeautifulSoup
+
+from benchmarks.synthetic import build_page
+from locationRetriever import LocationRetriever
+from scriptExtractor import extract_script_data
+
+
+def soup_extract(page):
+    retriever = LocationRetriever()
+    script_tags = BeautifulSoup(page, 'html.parser').find_all('script')
+    return retriever.find_location(script_tags), retriever.find_time(script_tags)
+
+
+def fast_extract(page):
+    return extract_script_data(page)
+
+
+def run(sizes, repeat):
+    print(f"{'locations':>10} {'page KB':>8} {'soup ms':>10} {'fast ms':>10} {'speedup':>8}")
+    for locations, filler_kb in sizes:
+        page = build_page(locations=locations, filler_kb=filler_kb)
+        if soup_extract(page) != fast_extract(page):
+            raise AssertionError(f"Extractors disagree for {locations} locations")
+        soup_time = min(timeit.repeat(lambda: soup_extract(page), number=1, repeat=repeat))
+        fast_time = min(timeit.repeat(lambda: fast_extract(page), number=1, repeat=repeat))
+        print(f"{locations:>10} {len(page) // 1024:>8} {soup_time * 1000:>10.2f} {fast_time * 1000:>10.3f} "
+              f"{soup_time / fast_time:>7.0f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark soup vs fast extraction of locationData/timeData")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions per page (best time is reported)")
+    args = parser.parse_args()
+    run([(40, 100), (40, 1000), (500, 1000), (2000, 4000)], args.repeat)
@@ -0,0 +1,79 @@
+"""
+Time and memory needed to turn 1k parsed location/time dicts into Location objects, before (plain object, validation and
+strptime on every poll) and after (slotted Location, static field cache and memoized FirstOpenSlot parsing).
+
+    python -m benchmarks.bench_location
+"""
+import argparse
+import gc
+import timeit
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.synthetic import build_data
+from model import Location
+
+
+class LegacyLocation:
+    """Copy of the original Location model, kept as the "before" reference."""
+    def __init__(self, name, street, city, state, zip_code, phone, appointments, next_appointment_date):
+        self.name = name
+        self.street = street
+        self.city = city
+        self.state = state
+        self.zip_code = zip_code
+        self.phone = phone
+        self.appointments = appointments
+        self.next_appointment_date = next_appointment_date
+
+    @classmethod
+    def create_location(cls, loc_dict, date_obj):
+        def valid(key, default):
+            value = loc_dict.get(key, "").strip()
+            return value if value else default
+
+        zip_code = loc_dict.get('Zip', "N/A")
+        phone = loc_dict.get('PhoneNumber', "N/A")
+        appointment_str = date_obj.get("FirstOpenSlot")
+        return cls(valid('Name', "Unknown Location"), valid('Street1', "Unknown Street"), valid('City', "Unknown City"),
+                   valid('State', "Unknown State"),
+                   str(zip_code) if zip_code and str(zip_code).isdigit() else "N/A",
+                   phone if phone and phone.replace(" ", "").replace("-", "").isdigit() else "N/A",
+                   int(appointment_str.split(" ")[0]),
+                   datetime.strptime(appointment_str.split("Next Available: ")[1], "%m/%d/%Y %I:%M %p"))
+
+
+def build_all(model, pairs):
+    return [model.create_location(loc_dict, time_dict) for loc_dict, time_dict in pairs]
+
+
+def retained_bytes(model, pairs):
+    """Bytes still allocated after building the list, i.e. the memory a snapshot keeps alive."""
+    gc.collect()
+    tracemalloc.start()
+    locations = build_all(model, pairs)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del locations
+    return current, peak
+
+
+def run(count, repeat):
+    location_data, time_data = build_data(count, available_ratio=1)
+    pairs = list(zip(location_data, time_data))
+    build_all(Location, pairs)  # warm the caches like a second poll would
+
+    print(f"{'model':>8} {'ms / 1k':>10} {'retained KB / 1k':>17} {'peak KB / 1k':>13}")
+    for label, model in (("before", LegacyLocation), ("after", Location)):
+        seconds = min(timeit.repeat(lambda: build_all(model, pairs), number=1, repeat=repeat))
+        current, peak = retained_bytes(model, pairs)
+        scale = 1000 / count
+        print(f"{label:>8} {seconds * 1000 * scale:>10.3f} {current / 1024 * scale:>17.1f} {peak / 1024 * scale:>13.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Location construction")
+    parser.add_argument("--count", type=int, default=1000, help="Number of locations per snapshot")
+    parser.add_argument("--repeat", type=int, default=20, help="Repetitions (best time is reported)")
+    args = parser.parse_args()
+    run(args.count, args.repeat)
@@ -0,0 +1,51 @@
+"""
+Compares the previous two-pass search (find_location then find_time, each re-serializing every tag with str() and
+recompiling its pattern from the regex cache) against the single-pass find_script_data scanner on pages with many
+script tags.
+
+    python -m benchmarks.bench_scanner
+"""
+import argparse
+import re
+import timeit
+
+from bs4 import BeautifulSoup
+
+from benchmarks.synthetic import build_page
+from locationRetriever import LocationRetriever
+
+
+def legacy_find(script_tags):
+    location_data = time_data = None
+    for script_tag in script_tags:
+        match = re.search(r'var locationData\s*=\s*(\[\{.*?\}\]);', str(script_tag), re.DOTALL)
+        if match and match.group(1):
+            location_data = match.group(1)
+            break
+    for script_tag in script_tags:
+        match = re.search(r'var timeData = (\[.*?\])', str(script_tag), re.DOTALL)
+        if match and match.group(1):
+            time_data = match.group(1)
+            break
+    return location_data, time_data
+
+
+def run(sizes, repeat):
+    retriever = LocationRetriever()
+    print(f"{'scripts':>8} {'locations':>10} {'two-pass ms':>12} {'single ms':>10} {'speedup':>8}")
+    for filler_scripts, locations in sizes:
+        page = build_page(locations=locations, filler_scripts=filler_scripts, filler_kb=10)
+        script_tags = BeautifulSoup(page, 'html.parser').find_all('script')
+        if legacy_find(script_tags) != retriever.find_script_data(script_tags):
+            raise AssertionError(f"Scanners disagree for {filler_scripts} scripts")
+        legacy_time = min(timeit.repeat(lambda: legacy_find(script_tags), number=1, repeat=repeat))
+        single_time = min(timeit.repeat(lambda: retriever.find_script_data(script_tags), number=1, repeat=repeat))
+        print(f"{filler_scripts:>8} {locations:>10} {legacy_time * 1000:>12.3f} {single_time * 1000:>10.3f} "
+              f"{legacy_time / single_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark two-pass vs single-pass locationData/timeData search")
+    parser.add_argument("--repeat", type=int, default=20, help="Repetitions per page (best time is reported)")
+    args = parser.parse_args()
+    run([(20, 40), (200, 40), (1000, 40), (1000, 2000)], args.repeat)
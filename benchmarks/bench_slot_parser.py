@@ -0,0 +1,36 @@
+"""
+datetime.strptime against the fixed-format FirstOpenSlot parser, one string at a time and in batch.
+
+    python -m benchmarks.bench_slot_parser
+"""
+import argparse
+import timeit
+from datetime import datetime
+
+from benchmarks.synthetic import build_data
+from slotParser import SLOT_FORMAT, NEXT_AVAILABLE, parse_slot_date, parse_time_data
+
+
+def run(count, repeat):
+    _, time_data = build_data(count, available_ratio=1)
+    texts = [obj["FirstOpenSlot"].split(NEXT_AVAILABLE)[1] for obj in time_data]
+
+    cases = [
+        ("strptime", lambda: [datetime.strptime(text, SLOT_FORMAT) for text in texts]),
+        ("parse_slot_date", lambda: [parse_slot_date(text) for text in texts]),
+        ("parse_time_data", lambda: parse_time_data(time_data)),
+    ]
+    baseline = None
+    print(f"{'parser':>16} {'us / string':>12} {'speedup':>8}")
+    for label, case in cases:
+        seconds = min(timeit.repeat(case, number=1, repeat=repeat)) / count
+        baseline = baseline or seconds
+        print(f"{label:>16} {seconds * 1e6:>12.3f} {baseline / seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark FirstOpenSlot date parsing")
+    parser.add_argument("--count", type=int, default=10000, help="Number of timeData entries")
+    parser.add_argument("--repeat", type=int, default=10, help="Repetitions (best time is reported)")
+    args = parser.parse_args()
+    run(args.count, args.repeat)
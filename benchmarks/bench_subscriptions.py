@@ -0,0 +1,71 @@
+"""
+Time to match 10k watch rules against one snapshot: one day-window scan per rule (what running a Filter per
+subscriber amounts to) against the indexed SubscriptionEngine.
+
+    python -m benchmarks.bench_subscriptions
+"""
+import argparse
+import random
+import timeit
+from datetime import datetime, timedelta
+
+from benchmarks.synthetic import CITIES, build_data
+from locationRetriever import TimeIndex
+from model import Location
+from subscriptionEngine import Subscription, SubscriptionEngine
+
+NOW = datetime(2024, 3, 4, 8, 0)
+
+
+def build_snapshot(locations):
+    location_data, time_data = build_data(locations, available_ratio=1.0, start=NOW)
+    snapshot = [Location.create_location(loc_dict, date_obj) for loc_dict, date_obj in zip(location_data, time_data)]
+    return [location for location in snapshot if location is not None]
+
+
+def build_subscriptions(count, zips, seed=0):
+    rng = random.Random(seed)
+    subscriptions = []
+    for subscriber in range(count):
+        kind = rng.random()
+        cities = tuple(rng.sample(CITIES, rng.randint(1, 3))) if kind < 0.6 else ()
+        zip_codes = tuple(rng.sample(zips, 2)) if 0.6 <= kind < 0.8 else ()
+        subscriptions.append(Subscription(subscriber, rng.choice((1, 3, 7, 14, 30)), cities, zip_codes,
+                                          rng.choice((1, 1, 1, 5, 10))))
+    return subscriptions
+
+
+def per_rule_match(subscriptions, snapshot, now):
+    """Reference: every rule scans its own day window."""
+    index = TimeIndex(snapshot)
+    results = {}
+    for subscription in subscriptions:
+        cities = {city.lower() for city in subscription.cities}
+        for location in index.window(now, now + timedelta(days=subscription.days)):
+            if (cities or subscription.zips) and location.city.lower() not in cities and location.zip_code not in subscription.zips:
+                continue
+            if location.appointments < subscription.min_appointments:
+                continue
+            results.setdefault(subscription.subscriber, []).append((None, location))
+    return results
+
+
+def run(sizes, repeat):
+    print(f"{'rules':>7} {'locations':>10} {'per-rule ms':>12} {'engine ms':>10} {'speedup':>8}")
+    for rules, locations in sizes:
+        snapshot = build_snapshot(locations)
+        subscriptions = build_subscriptions(rules, [location.zip_code for location in snapshot])
+        engine = SubscriptionEngine(subscriptions)
+        if per_rule_match(subscriptions, snapshot, NOW) != engine.match(snapshot, NOW):
+            raise AssertionError(f"Matchers disagree for {rules} rules")
+        per_rule_time = min(timeit.repeat(lambda: per_rule_match(subscriptions, snapshot, NOW), number=1, repeat=repeat))
+        engine_time = min(timeit.repeat(lambda: engine.match(snapshot, NOW), number=1, repeat=repeat))
+        print(f"{rules:>7} {locations:>10} {per_rule_time * 1000:>12.3f} {engine_time * 1000:>10.3f} "
+              f"{per_rule_time / engine_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark per-rule filtering vs the indexed subscription engine")
+    parser.add_argument("--repeat", type=int, default=10, help="Repetitions per size (best time is reported)")
+    args = parser.parse_args()
+    run([(1000, 40), (10000, 40), (10000, 200)], args.repeat)
@@ -0,0 +1,196 @@
+"""
+Offline benchmark of the whole fetch -> parse -> filter pipeline, stage by stage.
+
+Pages are synthetic pages of increasing size, plus the last page of every url of a capture recorded with --record when
+--capture is given. Each stage is timed separately and reported with p50/p99 latency, throughput and peak memory:
+
+    python -m benchmarks.run                          # report and compare against benchmarks/baseline.json
+    python -m benchmarks.run --update-baseline        # store the current results as the new baseline
+    python -m benchmarks.run --sizes 40 10000         # custom synthetic sizes (number of locations)
+    python -m benchmarks.run --capture capture.jsonl.gz
+
+Timings depend on the machine, so the baseline stores every stage's p50 as a multiple of a fixed reference workload
+timed in the same run. Exits with status 1 when a stage's ratio is higher than the baseline's * --tolerance.
+"""
+import argparse
+import json
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks.synthetic import build_data, build_page
+from locationRetriever import Filter
+from pageCapture import ReplayRetriever, read_capture, service_id
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+BASELINE_PATH = BENCHMARK_DIR / "baseline.json"
+DEFAULT_SIZES = (40, 500, 2000)
+SYNTHETIC_START = datetime(2024, 1, 1, 8, 0)  # fixed so synthetic pages (and the baseline) are reproducible
+
+
+REFERENCE = "reference"  # baseline key of the reference workload's p50 on the machine that wrote the baseline
+
+
+def load_pages(sizes, capture=None):
+    """
+    :param capture:
+        Capture file whose last successful page of every url is benchmarked too.
+    :return:
+        list of (name, page html) with the recorded pages first, then one synthetic page per size
+    """
+    pages = []
+    if capture is not None:
+        recorded = {record.url: record.page for record in read_capture(capture) if record.status == 200 and record.page}
+        pages = [(f"capture_{service_id(url)}", page) for url, page in recorded.items()]
+    pages += [(f"synthetic_{size}", build_page(locations=size, filler_kb=max(100, size // 10), start=SYNTHETIC_START))
+              for size in sizes]
+    return pages
+
+
+def pipeline_stages(page):
+    """
+    Runs the pipeline once to capture every stage's input and returns the stages as (name, callable) pairs.
+    """
+    retriever = ReplayRetriever(page)
+    script_tags = retriever.get_tags(retriever.url)
+    location_data, time_data = retriever.find_script_data(script_tags)
+    location_json, time_dict = retriever.parse_data(location_data, time_data)
+    retriever.locations = retriever.get_locations(location_json, time_dict)
+    retriever.fetched_at = datetime.now()
+
+    stages = [
+        ("get_tags", lambda: retriever.get_tags(retriever.url)),
+        ("find_script_data", lambda: retriever.find_script_data(script_tags)),
+        ("parse_data", lambda: retriever.parse_data(location_data, time_data)),
+        ("get_locations", lambda: retriever.get_locations(location_json, time_dict)),
+        ("Filter.filter", lambda: Filter(30, retriever, clock=lambda: SYNTHETIC_START).filter()),
+    ]
+    return stages, len(location_json)
+
+
+def reference_workload():
+    """
+    Fixed mix of JSON decoding, regex scanning and sorting, timed next to the stages to factor the machine's speed out.
+    """
+    location_data, time_data = build_data(locations=300, start=SYNTHETIC_START)
+    location_text, time_text = json.dumps(location_data), json.dumps(time_data)
+    pattern = re.compile(r'"LocationId": (\d+)')
+
+    def workload():
+        decoded = json.loads(location_text)
+        ids = sorted(int(match) for match in pattern.findall(time_text))
+        return sorted(decoded, key=lambda item: item["Name"]), ids
+    return workload
+
+
+def measure(stage, iterations, budget):
+    """
+    Times a stage at least 3 times, up to iterations runs or budget seconds, then measures its peak memory once.
+    :return:
+        dict with p50, p99 and mean seconds and peak bytes
+    """
+    durations = []
+    deadline = time.perf_counter() + budget
+    while len(durations) < iterations and (len(durations) < 3 or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        stage()
+        durations.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    stage()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    durations.sort()
+    return {
+        "p50": statistics.median(durations),
+        "p99": durations[min(len(durations) - 1, round(0.99 * (len(durations) - 1)))],
+        "mean": statistics.fmean(durations),
+        "peak": peak,
+        "runs": len(durations),
+    }
+
+
+def run(sizes, iterations, budget, capture=None):
+    """
+    :return:
+        dict of "page:stage" -> measurement, plus REFERENCE -> the reference workload's measurement
+    """
+    results = {REFERENCE: measure(reference_workload(), max(iterations, 20), budget)}
+    print(f"{'page':<18} {'stage':<24} {'p50 ms':>9} {'p99 ms':>9} {'loc/s':>11} {'peak KB':>9} {'runs':>5}")
+    print(f"{REFERENCE:<18} {'':<24} {results[REFERENCE]['p50'] * 1000:>9.3f} {results[REFERENCE]['p99'] * 1000:>9.3f}")
+    for name, page in load_pages(sizes, capture):
+        stages, total = pipeline_stages(page)
+        for stage_name, stage in stages:
+            result = measure(stage, iterations, budget)
+            result["throughput"] = total / result["mean"]  # locations handled per second
+            results[f"{name}:{stage_name}"] = result
+            print(f"{name:<18} {stage_name:<24} {result['p50'] * 1000:>9.3f} {result['p99'] * 1000:>9.3f} "
+                  f"{result['throughput']:>11.0f} {result['peak'] / 1024:>9.1f} {result['runs']:>5}")
+    return results
+
+
+def to_baseline(results):
+    """
+    :return:
+        dict of "page:stage" -> p50 divided by the reference workload's p50, plus REFERENCE -> that p50 in seconds
+    """
+    reference = results[REFERENCE]["p50"]
+    baseline = {key: result["p50"] / reference for key, result in results.items() if key != REFERENCE}
+    baseline[REFERENCE] = reference
+    return baseline
+
+
+def compare(results, baseline, tolerance, min_delta=0.001):
+    """
+    Compares every stage's p50, relative to the reference workload of its own run, with the baseline's ratio.
+    :param min_delta:
+        Slowdown in seconds (against the baseline ratio scaled to this machine) below which a stage isn't reported,
+        so sub-millisecond timer noise doesn't fail the run.
+    :return:
+        list of "page:stage" keys whose ratio regressed by more than tolerance against the baseline
+    """
+    reference = results[REFERENCE]["p50"]
+    regressions = []
+    for key, result in results.items():
+        expected_ratio = baseline.get(key) if key != REFERENCE else None
+        if not expected_ratio:
+            continue
+        ratio = result["p50"] / reference
+        expected = expected_ratio * reference  # the baseline's timing scaled to this machine
+        if ratio > expected_ratio * tolerance and result["p50"] - expected > min_delta:
+            print(f"REGRESSION {key}: p50 {result['p50'] * 1000:.3f} ms = {ratio:.3f}x reference "
+                  f"vs baseline {expected_ratio:.3f}x ({expected * 1000:.3f} ms on this machine)")
+            regressions.append(key)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the fetch -> parse -> filter pipeline on recorded pages")
+    parser.add_argument("--sizes", type=int, nargs="*", default=DEFAULT_SIZES, help="Synthetic page sizes (locations)")
+    parser.add_argument("--iterations", type=int, default=50, help="Maximum runs per stage")
+    parser.add_argument("--budget", type=float, default=2.0, help="Time budget per stage in seconds (at least 3 runs)")
+    parser.add_argument("--capture", type=Path, help="Also benchmark the pages of this capture recorded with --record")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Allowed slowdown factor before failing")
+    parser.add_argument("--min-delta", type=float, default=1.0, help="Ignore slowdowns smaller than this many ms")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="Baseline file")
+    parser.add_argument("--update-baseline", action="store_true", help="Store current p50 ratios as the baseline")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.iterations, args.budget, args.capture)
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(to_baseline(results), indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print("No baseline found, run with --update-baseline to create one.")
+        return 0
+    return 1 if compare(results, json.loads(args.baseline.read_text()), args.tolerance, args.min_delta / 1000) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
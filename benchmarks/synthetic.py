@@ -0,0 +1,72 @@
+import json
+import random
+from datetime import datetime, timedelta
+
+CITIES = ["Edison", "Bayonne", "Lodi", "Newark", "Rahway", "Freehold", "Wayne", "Oakland", "Randolph", "Trenton",
+          "Camden", "Vineland", "Toms River", "Flemington", "Eatontown", "Salem", "Cardiff", "Delanco"]
+
+
+def build_data(locations=40, seed=0, available_ratio=0.7, start=None):
+    """
+    Builds locationData/timeData lists shaped like the ones embedded in the AppointmentWizard page.
+    :param locations:
+        Number of locations to generate.
+    :param available_ratio:
+        Fraction of locations that get an open slot (the others report "No Appointments Available").
+    :return:
+        tuple (location_data, time_data) of python lists
+    """
+    rng = random.Random(seed)
+    start = start or datetime.now().replace(second=0, microsecond=0)
+    location_data = []
+    time_data = []
+    for i in range(locations):
+        location_id = 100 + i
+        city = CITIES[i % len(CITIES)]
+        location_data.append({
+            "Id": 5000 + i,
+            "Name": f"{city} {i}",
+            "Street1": f"{rng.randint(1, 999)} Route {rng.randint(1, 99)}",
+            "Street2": "",
+            "City": city,
+            "State": "NJ",
+            "Zip": f"0{rng.randint(7001, 8999)}",
+            "PhoneNumber": f"{rng.randint(201, 973)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}",
+            "Lat": round(rng.uniform(39.0, 41.2), 6),
+            "Long": round(rng.uniform(-75.4, -73.9), 6),
+            "LocAppointments": [{"LocationId": location_id, "AppointmentTypeId": 12, "Active": True}],
+        })
+        if rng.random() < available_ratio:
+            slot = start + timedelta(days=rng.randint(0, 60), minutes=20 * rng.randint(0, 30))
+            first_open = f"{rng.randint(1, 40)} Appointments Available <br/> Next Available: {slot.strftime('%m/%d/%Y %I:%M %p')}"
+        else:
+            first_open = "No Appointments Available"
+        time_data.append({"LocationId": location_id, "FirstOpenSlot": first_open})
+    return location_data, time_data
+
+
+def build_page(locations=40, filler_scripts=20, filler_kb=200, seed=0, **kwargs):
+    """
+    Builds a full html page embedding the generated data the same way the portal does, padded with unrelated
+    markup and script tags so parsing cost resembles a real (large) saved page.
+    :param filler_scripts:
+        Number of unrelated <script> tags placed around the data scripts.
+    :param filler_kb:
+        Approximate amount of unrelated markup, in kilobytes, added after the data scripts.
+    """
+    location_data, time_data = build_data(locations, seed=seed, **kwargs)
+    scripts = [f"<script>var config{i} = {{\"id\": {i}, \"items\": [1, 2, 3]}}; function f{i}() {{ return {i}; }}</script>"
+               for i in range(filler_scripts)]
+    half = len(scripts) // 2
+    row = "<div class=\"row\"><span class=\"label\">Lorem ipsum dolor sit amet</span><a href=\"#\">link</a></div>\n"
+    filler = row * max(1, filler_kb * 1024 // len(row))
+    return (
+        "<!DOCTYPE html><html><head><title>Appointment Wizard</title>\n"
+        + "\n".join(scripts[:half])
+        + "</head><body>\n"
+        + f"<script>\nvar locationData = {json.dumps(location_data)};\n"
+        + f"var timeData = {json.dumps(time_data)};\n</script>\n"
+        + filler
+        + "\n".join(scripts[half:])
+        + "</body></html>"
+    )
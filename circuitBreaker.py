@@ -0,0 +1,81 @@
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Stops requesting an endpoint that keeps failing.
+
+    - closed: requests go through; failure_threshold consecutive failures open the circuit.
+    - open: every request is refused without touching the network, for reset_timeout seconds (or Retry-After, if longer).
+    - half-open: once the timeout is over, a single probe request is let through. Success closes the circuit, failure
+      opens it again with the timeout doubled (up to max_reset_timeout).
+    """
+    def __init__(self, failure_threshold=3, reset_timeout=30, max_reset_timeout=600, clock=time.monotonic):
+        """
+        :param failure_threshold:
+            Consecutive failures that open the circuit.
+        :param reset_timeout:
+            Seconds the circuit stays open before the first probe.
+        :param max_reset_timeout:
+            Longest time the circuit stays open after repeated failed probes.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.timeout = reset_timeout  # current open period, doubled after every failed probe
+        self.open_until = None
+        self.probing = False  # a half-open probe is in flight
+        self.opened = 0  # number of times the circuit opened
+
+    def allow(self):
+        """
+        :return:
+            True if a request may be made now (a closed circuit, or the single probe of a half-open one)
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self.clock() >= self.open_until:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def retry_in(self):
+        """Seconds until the next request may be made (0 if it may be made now)."""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.open_until - self.clock())
+
+    def record_success(self):
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.timeout = self.reset_timeout
+            self.probing = False
+
+    def record_failure(self, retry_after=None):
+        """
+        :param retry_after:
+            Seconds the server asked to wait (Retry-After); the circuit stays open at least that long.
+        """
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                self.timeout = min(self.timeout * 2, self.max_reset_timeout)
+            elif self.failures < self.failure_threshold:
+                return
+            self.state = OPEN
+            self.probing = False
+            self.opened += 1
+            self.open_until = self.clock() + max(self.timeout, retry_after or 0)
@@ -0,0 +1,32 @@
+class RetrieverError(ValueError):
+    """
+    Base of the errors raised by LocationRetriever.fetch_locations, one subclass per stage.
+    Subclasses ValueError, which fetch_locations raised for every failure before, so existing handlers keep working.
+    """
+    stage = None
+
+    def __init__(self, message, url=None, status=None, retry_after=None):
+        super().__init__(message)
+        self.url = url
+        self.status = status  # HTTP status of the failed response, if any
+        self.retry_after = retry_after  # seconds the caller should wait before trying again, if known
+
+
+class FetchError(RetrieverError):
+    """The request failed: connection error, timeout or an HTTP error status."""
+    stage = "network"
+
+
+class ExtractError(RetrieverError):
+    """The page was downloaded but locationData/timeData weren't found in it (e.g. a maintenance page)."""
+    stage = "extract"
+
+
+class DecodeError(RetrieverError):
+    """locationData/timeData were found but aren't valid JSON, or don't have the expected shape."""
+    stage = "json"
+
+
+class CircuitOpenError(RetrieverError):
+    """The url failed repeatedly and its circuit breaker is open: no request was made."""
+    stage = "circuit"
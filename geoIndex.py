@@ -0,0 +1,211 @@
+import argparse
+import csv
+import math
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from heapq import merge
+from pathlib import Path
+
+from locationRetriever import Filter, TimeIndex
+from slotParser import portal_now
+
+ZIP_TABLE_PATH = Path(__file__).resolve().parent / "data" / "nj_zip_centroids.csv"
+EARTH_RADIUS_MILES = 3958.8
+ORDERS = ("date", "distance", "score")
+
+
+@lru_cache(maxsize=4)
+def load_zip_centroids(path=ZIP_TABLE_PATH):
+    """
+    Reads the bundled zip-centroid table ('#' lines are comments).
+    :return:
+        dict of 5-digit zip code -> (latitude, longitude)
+    """
+    with open(path, newline="", encoding="utf-8") as file:
+        rows = csv.DictReader(line for line in file if not line.startswith("#"))
+        return {row["zip"]: (float(row["latitude"]), float(row["longitude"])) for row in rows}
+
+
+def haversine_miles(origin, destination):
+    lat1, lon1 = map(math.radians, origin)
+    lat2, lon2 = map(math.radians, destination)
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+
+
+def parse_origin(origin, centroids=None):
+    """
+    :param origin:
+        zip code ("08817"), "latitude,longitude" string or (latitude, longitude) tuple.
+    :return:
+        (latitude, longitude)
+    """
+    if isinstance(origin, tuple):
+        return origin
+    origin = str(origin).strip()
+    if "," in origin:
+        latitude, longitude = (float(part) for part in origin.split(",", 1))
+        return latitude, longitude
+    centroids = centroids if centroids is not None else load_zip_centroids()
+    zip_code = origin.zfill(5)
+    if zip_code not in centroids:
+        raise ValueError(f"Unknown zip code {origin}; pass coordinates as 'latitude,longitude' instead.")
+    return centroids[zip_code]
+
+
+class DistanceCache:
+    """
+    Distances from one origin to location zip codes. A location's zip never changes between polls, so each distance is computed once per process.
+    """
+    def __init__(self, origin, centroids=None):
+        self.centroids = centroids if centroids is not None else load_zip_centroids()
+        self.origin = parse_origin(origin, self.centroids)
+        self.miles = {}  # zip code -> miles from origin (None if the zip isn't in the table)
+
+    def distance(self, location):
+        zip_code = location.zip_code
+        try:
+            return self.miles[zip_code]
+        except KeyError:
+            pass
+        centroid = self.centroids.get(str(zip_code).zfill(5))  # "N/A" zips have no centroid
+        miles = haversine_miles(self.origin, centroid) if centroid else None
+        self.miles[zip_code] = miles
+        return miles
+
+
+@lru_cache(maxsize=16)
+def distance_cache(origin):
+    """Shared DistanceCache per origin, so filters built on every poll reuse the same distances."""
+    return DistanceCache(origin)
+
+
+class OrderedIndex(TimeIndex):
+    """
+    TimeIndex whose windows come back sorted by another key (distance or score) instead of by date, without sorting at
+    query time.
+
+    A window is a contiguous slice of the date-sorted locations. A segment tree over that list keeps every node's
+    locations pre-sorted by key (built once per snapshot, O(n log n)), so a window is covered by O(log n) nodes found with
+    the two binary searches of TimeIndex, and their sorted lists are merged in key order.
+    """
+    def __init__(self, locations, key):
+        super().__init__(locations)
+        self.size = 1
+        while self.size < len(self.locations):
+            self.size *= 2
+        self.tree = [()] * (2 * self.size)
+        for position, location in enumerate(self.locations):
+            # the date position breaks ties, so equal keys keep date order
+            self.tree[self.size + position] = ((key(location), position, location),)
+        for node in range(self.size - 1, 0, -1):
+            self.tree[node] = tuple(merge(self.tree[2 * node], self.tree[2 * node + 1]))
+
+    def slice(self, first, last):
+        """Locations at date positions [first, last), sorted by key."""
+        parts = []
+        first += self.size
+        last += self.size
+        while first < last:
+            if first & 1:
+                parts.append(self.tree[first])
+                first += 1
+            if last & 1:
+                last -= 1
+                parts.append(self.tree[last])
+            first //= 2
+            last //= 2
+        return [entry[2] for entry in merge(*parts)]
+
+    def window(self, start, end):
+        """Returns the locations with start <= next_appointment_date <= end, sorted by key."""
+        return self.slice(bisect_left(self.dates, start), bisect_right(self.dates, end))
+
+    def windows(self, start, ends):
+        first = bisect_left(self.dates, start)
+        return [self.slice(first, bisect_right(self.dates, end, first)) for end in ends]
+
+
+class GeoFilter(Filter):
+    """
+    Filter restricted to the locations within radius miles of an origin (zip code or coordinates).
+    The in-radius index is built once per snapshot from cached distances, so windows stay binary searches in every
+    order. Locations whose zip code isn't in the centroid table are kept, since they may be near: their distance is
+    unknown, so they come last in the distance and score orders.
+
+    order:
+        "date": soonest first (same as Filter),
+        "distance": nearest first,
+        "score": next_appointment_date pushed back one day for every miles_per_day miles, lowest first.
+    """
+    def __init__(self, days, retriever=None, origin=None, radius=25, order="date", miles_per_day=10, clock=portal_now,
+                 distances=None):
+        """
+        :param origin:
+            zip code, "latitude,longitude" string or (latitude, longitude) tuple.
+        :param radius:
+            Maximum distance in miles (None for no limit, e.g. to only rank by distance).
+        :param distances:
+            DistanceCache to use (defaults to the shared one for origin).
+        """
+        if order not in ORDERS:
+            raise ValueError(f"Unknown order: {order}")
+        self.distances = distances or distance_cache(origin)
+        self.radius = radius
+        self.order = order
+        self.miles_per_day = miles_per_day
+        super().__init__(days, retriever, clock=clock)
+
+    def within_radius(self, location):
+        miles = self.distances.distance(location)
+        return miles is None or self.radius is None or miles <= self.radius
+
+    def get_index(self, service, locations):
+        """
+        Returns the index of the in-radius locations (a TimeIndex, or an OrderedIndex for the distance and score orders),
+        rebuilding it only when the snapshot list changed.
+        """
+        cached = self.indexes.get(service)
+        if cached is None or cached[0] is not locations:
+            in_radius = [location for location in locations or [] if self.within_radius(location)]
+            index = TimeIndex(in_radius) if self.order == "date" else OrderedIndex(in_radius, self.sort_key())
+            cached = (locations, index)
+            self.indexes[service] = cached
+        return cached[1]
+
+    def sort_key(self):
+        distance = self.distances.distance
+        if self.order == "distance":
+            return lambda location: math.inf if distance(location) is None else distance(location)
+        seconds_per_mile = 86400 / self.miles_per_day
+        return lambda location: (math.inf if distance(location) is None else
+                                 location.next_appointment_date.timestamp() + distance(location) * seconds_per_mile)
+
+
+def convert_gazetteer(source, destination=ZIP_TABLE_PATH):
+    """
+    Writes the New Jersey rows (zip codes 07001-08999) of a Census ZCTA Gazetteer file as the centroid table.
+    :return:
+        number of zip codes written
+    """
+    with open(source, newline="", encoding="utf-8") as file:
+        reader = csv.reader(file, delimiter="\t")
+        header = [column.strip() for column in next(reader)]
+        geoid, latitude, longitude = header.index("GEOID"), header.index("INTPTLAT"), header.index("INTPTLONG")
+        rows = [(row[geoid].strip(), row[latitude].strip(), row[longitude].strip()) for row in reader
+                if "07001" <= row[geoid].strip() <= "08999"]
+    with open(destination, "w", newline="", encoding="utf-8") as file:
+        file.write(f"# New Jersey ZCTA internal points from the Census Gazetteer file {Path(source).name}\n")
+        writer = csv.writer(file)
+        writer.writerow(["zip", "latitude", "longitude", "name"])
+        writer.writerows((zip_code, lat, lon, "") for zip_code, lat, lon in rows)
+    load_zip_centroids.cache_clear()
+    return len(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the bundled NJ zip-centroid table")
+    parser.add_argument("--gazetteer", required=True, help="Census ZCTA Gazetteer file (tab separated)")
+    parser.add_argument("--output", default=str(ZIP_TABLE_PATH), help="Table to write (default: the bundled one)")
+    args = parser.parse_args()
+    print(f"Wrote {convert_gazetteer(args.gazetteer, args.output)} zip codes to {args.output}")
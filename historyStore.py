@@ -0,0 +1,221 @@
+import queue
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime
+
+from metrics import DISABLED
+
+OPENED = "opened"  # location showed up with slots
+MORE = "more"  # number of appointments increased
+FEWER = "fewer"  # number of appointments decreased
+MOVED = "moved"  # same number of appointments, different next date
+CLOSED = "closed"  # location left the snapshot (no slots left)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    id INTEGER PRIMARY KEY,
+    observed_at TEXT NOT NULL,
+    service INTEGER,
+    location_id INTEGER,
+    name TEXT NOT NULL,
+    city TEXT,
+    appointments INTEGER,
+    next_date TEXT,
+    change TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS observations_location ON observations (location_id, observed_at);
+CREATE INDEX IF NOT EXISTS observations_city ON observations (city COLLATE NOCASE, observed_at);
+CREATE INDEX IF NOT EXISTS observations_time ON observations (observed_at);
+"""
+INSERT = ("INSERT INTO observations (observed_at, service, location_id, name, city, appointments, next_date, change) "
+          "VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+STOP = object()
+
+
+def format_date(date):
+    return date.isoformat(sep=" ", timespec="seconds") if isinstance(date, datetime) else None
+
+
+def read_changes(path):
+    """
+    Iterates over every row of a history database in insertion order.
+    :return:
+        generator of (observed_at datetime, service, location_id, name, appointments, change)
+    """
+    with closing(sqlite3.connect(path, timeout=10)) as connection:
+        try:
+            rows = connection.execute(
+                "SELECT observed_at, service, location_id, name, appointments, change FROM observations ORDER BY id")
+        except sqlite3.OperationalError:
+            return  # new database, nothing recorded yet
+        for observed_at, service, location_id, name, appointments, change in rows:
+            yield datetime.fromisoformat(observed_at), service, location_id, name, appointments, change
+
+
+class HistoryStore:
+    """
+    Records every snapshot's per-location (appointments, next date) in a SQLite database, writing only the locations that changed since the previous snapshot.
+    record() only enqueues the snapshot: a background thread owns the connection and writes whole batches with executemany, so the poll loop never waits on disk.
+    """
+    def __init__(self, path, max_queue=64, metrics=DISABLED):
+        """
+        :param path:
+            SQLite database file (created if missing).
+        :raises sqlite3.Error:
+            if the database can't be opened
+        :param max_queue:
+            Snapshots that may wait for the writer; when the queue is full new snapshots are dropped (and counted) instead of blocking.
+        :param metrics:
+            Metrics registry receiving the history_rows and history_dropped counters.
+        """
+        self.path = path
+        self.metrics = metrics
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.last = {}  # (service, location key) -> ((appointments, next date), (location_id, name, city)) as last written; only touched by the writer
+        self.dropped = 0
+        self.error = None  # exception that kept the writer from opening the database
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=10)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def record(self, locations, observed_at=None):
+        """
+        Queues a snapshot for writing.
+        :param locations:
+            list of locations, or dict of service id -> list (multi-service retrievers)
+        :return:
+            False if the queue was full and the snapshot was dropped
+        """
+        try:
+            self.queue.put_nowait((observed_at or datetime.now(), locations))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            self.metrics.increment("history_dropped")
+            return False
+
+    def flush(self):
+        """Blocks until every queued snapshot has been written."""
+        self.queue.join()
+
+    def close(self):
+        """Writes the remaining snapshots and stops the writer thread."""
+        if self.thread.is_alive():
+            self.queue.put(STOP)
+            self.thread.join()
+
+    def run(self):
+        connection = None
+        try:
+            connection = self.connect()
+            connection.executescript(SCHEMA)
+            self.load_last(connection)
+        except Exception as e:
+            self.error = e  # re-raised by __init__
+            if connection is not None:
+                connection.close()
+            return
+        finally:
+            self.ready.set()
+        with closing(connection):
+            stopping = False
+            while not stopping:
+                batch = [self.queue.get()]
+                while True:  # write everything that piled up in one transaction
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                rows = []
+                for item in batch:
+                    if item is STOP:
+                        stopping = True
+                    else:
+                        rows.extend(self.changed_rows(*item))
+                try:
+                    if rows:
+                        with connection:
+                            connection.executemany(INSERT, rows)
+                        self.metrics.increment("history_rows", len(rows))
+                except sqlite3.Error as e:
+                    print(f"Error writing history: {e}")
+                finally:
+                    for _ in batch:
+                        self.queue.task_done()
+
+    def load_last(self, connection):
+        """Restores the last written state of every location so a restart doesn't rewrite unchanged rows."""
+        rows = connection.execute(
+            "SELECT service, location_id, name, city, appointments, next_date, change FROM observations "
+            "WHERE id IN (SELECT MAX(id) FROM observations GROUP BY service, location_id, name)")
+        for service, location_id, name, city, appointments, next_date, change in rows:
+            if change != CLOSED:
+                key = (service, location_id if location_id is not None else name)
+                self.last[key] = ((appointments, next_date), (location_id, name, city))
+
+    def changed_rows(self, observed_at, locations):
+        """
+        :return:
+            list of INSERT parameter tuples for the locations that differ from the last written state (plus CLOSED rows for the ones that left)
+        """
+        grouped = locations if isinstance(locations, dict) else {None: locations}
+        timestamp = format_date(observed_at)
+        seen = set()
+        rows = []
+        for service, service_locations in grouped.items():
+            for location in service_locations:
+                location_id = location.location_id
+                key = (service, location_id if location_id is not None else location.name)
+                seen.add(key)
+                state = (location.appointments, format_date(location.next_appointment_date))
+                previous = self.last.get(key)
+                if previous is not None and previous[0] == state:
+                    continue
+                if previous is None:
+                    change = OPENED
+                elif (state[0] or 0) > (previous[0][0] or 0):
+                    change = MORE
+                elif (state[0] or 0) < (previous[0][0] or 0):
+                    change = FEWER
+                else:
+                    change = MOVED
+                self.last[key] = (state, (location_id, location.name, location.city))
+                rows.append((timestamp, service, location_id, location.name, location.city, state[0], state[1], change))
+
+        for key in [key for key in self.last if key not in seen]:
+            location_id, name, city = self.last.pop(key)[1]
+            rows.append((timestamp, key[0], location_id, name, city, 0, None, CLOSED))
+        return rows
+
+    def opening_times(self, city=None, location_id=None, service=None):
+        """
+        When slots usually open: openings (OPENED or MORE rows) counted per weekday and hour, e.g. opening_times(city="Edison").
+        :return:
+            list of (weekday (0 = Monday), hour, number of openings), most frequent first
+        """
+        query = ("SELECT (CAST(strftime('%w', observed_at) AS INTEGER) + 6) % 7 AS weekday, "
+                 "CAST(strftime('%H', observed_at) AS INTEGER) AS hour, COUNT(*) AS openings "
+                 "FROM observations WHERE change IN (?, ?)")
+        params = [OPENED, MORE]
+        if city is not None:
+            query += " AND city = ? COLLATE NOCASE"
+            params.append(city)
+        if location_id is not None:
+            query += " AND location_id = ?"
+            params.append(location_id)
+        if service is not None:
+            query += " AND service = ?"
+            params.append(service)
+        query += " GROUP BY weekday, hour ORDER BY openings DESC, weekday, hour"
+        with closing(self.connect()) as connection:
+            return connection.execute(query, params).fetchall()
@@ -0,0 +1,117 @@
+import json
+from typing import Any, List, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+class StdlibDecoder:
+    """
+    Decodes locationData/timeData with the standard json module. Always available.
+    """
+    name = "stdlib"
+    typed = False  # True when decode_records() builds typed records instead of dicts
+    errors = (json.JSONDecodeError,)
+
+    @staticmethod
+    def loads(text):
+        return json.loads(text)
+
+
+class OrjsonDecoder(StdlibDecoder):
+    """Same output as StdlibDecoder, decoded by orjson (needs `pip install orjson`)."""
+    name = "orjson"
+    errors = (orjson.JSONDecodeError,) if orjson else ()
+
+    @staticmethod
+    def loads(text):
+        return orjson.loads(text)
+
+
+if msgspec:
+    class LocAppointmentRecord(msgspec.Struct):
+        LocationId: Any = None
+
+    class LocationRecord(msgspec.Struct):
+        """One locationData entry. Fields the app doesn't use (Lat, Long, Id, ...) are skipped while decoding."""
+        Name: str = ""
+        Street1: str = ""
+        City: str = ""
+        State: str = ""
+        Zip: Any = None
+        PhoneNumber: Any = None
+        LocAppointments: List[LocAppointmentRecord] = []
+
+    class TimeRecord(msgspec.Struct):
+        LocationId: Any = None
+        FirstOpenSlot: Optional[str] = None
+
+
+class MsgspecDecoder(StdlibDecoder):
+    """
+    Decodes with msgspec (needs `pip install msgspec`). decode_records() goes straight from the json text to
+    LocationRecord/TimeRecord structs, skipping the intermediate dicts and any field the app doesn't read; the records
+    are turned into Location objects by Location.from_record.
+    """
+    name = "msgspec"
+    typed = True
+    errors = (msgspec.DecodeError,) if msgspec else ()
+
+    def __init__(self):
+        self.location_decoder = msgspec.json.Decoder(List[LocationRecord])
+        self.time_decoder = msgspec.json.Decoder(List[TimeRecord])
+
+    @staticmethod
+    def loads(text):
+        return msgspec.json.decode(text)
+
+    def decode_records(self, location_data, time_data):
+        """
+        :return:
+            tuple (list of LocationRecord, dict of LocationId -> TimeRecord), or (None, None) if a timeData entry has no LocationId
+        """
+        records = self.location_decoder.decode(location_data)
+        time_dict = self.decode_time(time_data)
+        if time_dict is None:
+            return None, None
+        return records, time_dict
+
+    def decode_time(self, time_data):
+        """
+        Decodes timeData alone into TimeRecord structs.
+        :return:
+            dict of LocationId -> TimeRecord, or None if an entry has no LocationId
+        """
+        time_dict = {}
+        for record in self.time_decoder.decode(time_data):
+            if not record.LocationId:
+                return None
+            time_dict[record.LocationId] = record
+        return time_dict
+
+
+DECODERS = {"stdlib": StdlibDecoder, "orjson": OrjsonDecoder, "msgspec": MsgspecDecoder}
+AVAILABLE = {"stdlib": True, "orjson": orjson is not None, "msgspec": msgspec is not None}
+PREFERENCE = ("msgspec", "orjson", "stdlib")
+
+
+def get_decoder(name="auto"):
+    """
+    Returns a decoder instance.
+    :param name:
+        "stdlib", "orjson", "msgspec", or "auto" for the fastest installed one (msgspec, then orjson, then stdlib).
+    """
+    if name == "auto":
+        name = next(backend for backend in PREFERENCE if AVAILABLE[backend])
+    if name not in DECODERS:
+        raise ValueError(f"Unknown JSON decoder: {name}")
+    if not AVAILABLE[name]:
+        raise ValueError(f"JSON decoder {name} is not installed")
+    return DECODERS[name]()
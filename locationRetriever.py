@@ -1,64 +1,395 @@
 from bs4 import BeautifulSoup, ResultSet
-import requests,re,json
+import requests,re,hashlib,codecs
+from requests.adapters import HTTPAdapter
+from requests.utils import DEFAULT_ACCEPT_ENCODING
 from datetime import datetime,timedelta
+from bisect import bisect_left, bisect_right
 
 from model import Location
+from slotParser import portal_now
+from scriptExtractor import ScriptDataExtractor, extract_script_data
+from scheduler import parse_retry_after
+from metrics import DISABLED
+from jsonDecoder import get_decoder
+from circuitBreaker import CircuitBreaker, OPEN
+from errors import CircuitOpenError, DecodeError, ExtractError, FetchError
+
+APPOINTMENT_WIZARD_BASE_URL = 'https://telegov.njportal.com/njmvc/AppointmentWizard/'
+DEFAULT_SERVICE = 12
+APPOINTMENT_WIZARD_URL = APPOINTMENT_WIZARD_BASE_URL + str(DEFAULT_SERVICE)
+# Regular expressions to extract locationData and timeData, compiled once
+LOCATION_PATTERN = re.compile(r'var locationData\s*=\s*(\[\{.*?\}\]);', re.DOTALL)
+TIME_PATTERN = re.compile(r'var timeData = (\[.*?\])', re.DOTALL)
+SCRIPT_DATA_PATTERN = re.compile(LOCATION_PATTERN.pattern + '|' + TIME_PATTERN.pattern, re.DOTALL)
+NOT_MODIFIED = object()  # returned by get_page when the page didn't change since the last successful parse
+FETCH_MODES = ("soup", "fast", "stream")
+STREAM_CHUNK_SIZE = 16 * 1024  # bytes read from the socket at a time in stream mode
+NO_APPOINTMENTS = "No Appointments Available"  # FirstOpenSlot of a location without free slots
+
+def payload_hash(text):
+    """Digest of an extracted script variable (None when it wasn't found)."""
+    return hashlib.blake2b(text.encode(), digest_size=16).digest() if text else None
+
 
 class LocationRetriever:
     """
     This class will only contain one attribute (locations) that will be set automatically upon instantiation. The attribute itself is a list of location objects with available appointments (regardless of date).
+    A single retriever keeps one pooled HTTP session alive between fetches and remembers the page validators (ETag, Last-Modified and body hash) so unchanged pages are never parsed twice.
+    Past the body hash, the extracted locationData and timeData are hashed too: a page that only differs outside them keeps the previous locations without any JSON decoding,
+    and a page where only timeData changed reuses the decoded locationData and the Location objects whose slot didn't change.
+    Failures raise a RetrieverError subclass naming the stage that failed and keep the last good locations; after repeated failures the url's circuit breaker
+    refuses further fetches (CircuitOpenError, without any request) until a probe succeeds.
     """
-    def __init__(self):
+    def __init__(self, session=None, url=APPOINTMENT_WIZARD_URL, metrics=DISABLED, decoder=None, capture=None, mode="soup",
+                 breaker=None):
+        """
+        :param url:
+            AppointmentWizard page to scrape (see wizard_url() for other appointment types).
+        :param mode:
+            Default extraction mode of fetch_locations() ("soup", "fast" or "stream").
+        :param breaker:
+            CircuitBreaker guarding the url (a new one by default; retrievers polling the same url may share one).
+        :param decoder:
+            JSON decoder from jsonDecoder.get_decoder() (defaults to the fastest one installed).
+        :param capture:
+            Optional pageCapture.CaptureWriter recording every page received, for replaying it offline.
+        :param metrics:
+            Metrics registry receiving per-stage timings and counters (instrumentation is off by default).
+        """
+        if mode not in FETCH_MODES:
+            raise ValueError(f"Unknown fetch mode: {mode}")
+        self.url = url
+        self.mode = mode
+        self.metrics = metrics
+        self.decoder = decoder or get_decoder()
+        self.capture = capture
         self.locations = []
+        self.session = session or self.create_session()
+        self.validators = {}  # url -> validators of the last page that was parsed successfully
+        self.pending_validators = None
+        self.payload = None  # (locationData hash, timeData hash, decoded locationData) of the last successful parse
+        self.slots = {}  # LocationId -> (FirstOpenSlot, Location) of the last successful parse
+        self.fetched_at = None  # time of the last successful fetch: locations are as old as this while fetches fail
+        self.last_error = None  # RetrieverError of the last fetch, None if it succeeded
+        self.breaker = breaker or CircuitBreaker()
+        self.last_status = None  # HTTP status of the last response (None if the request itself failed)
+        self.retry_after = None  # seconds requested by the last response's Retry-After header
+
+    @staticmethod
+    def create_session():
+        """
+        Creates a keep-alive session with a small connection pool that asks for compressed responses (gzip/deflate, plus br when brotli is installed).
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers["Accept-Encoding"] = DEFAULT_ACCEPT_ENCODING
+        return session
+
+    @staticmethod
+    def wizard_url(service_id):
+        """Returns the AppointmentWizard url for an appointment type (e.g. 12 for the default service)."""
+        return f"{APPOINTMENT_WIZARD_BASE_URL}{service_id}"
 
-    def fetch_locations(self):
+    def fetch_locations(self, mode=None):
         """
         Handles all functions providing the necessary parameters (following the chain logic from the methods) and assign the final value to locations attribute.
+        :param mode:
+            "soup" builds a BeautifulSoup of the page and searches its script tags, "fast" scans the raw page text once for both variables without parsing the html,
+            "stream" scans the response while it downloads and closes it as soon as both variables are captured (see stream_script_data). Defaults to the retriever's mode.
+        :return:
+            True if locations were rebuilt, False if the page didn't change (locations are kept as they were)
+        :raises:
+            FetchError, ExtractError or DecodeError for the stage that failed, CircuitOpenError while the url's circuit is open
         """
-        script_tags = self.get_tags('https://telegov.njportal.com/njmvc/AppointmentWizard/12')
-        location_data_str = self.find_location(script_tags)
-        time_data_str = self.find_time(script_tags)
+        mode = mode or self.mode
+        if mode not in FETCH_MODES:
+            raise ValueError(f"Unknown fetch mode: {mode}")
+        if not self.breaker.allow():
+            self.metrics.increment("circuit_rejections")
+            retry_in = self.breaker.retry_in()
+            self.last_error = CircuitOpenError(f"Circuit open for {self.url}, next attempt in {retry_in:.0f} seconds.",
+                                               self.url, retry_after=retry_in)
+            raise self.last_error
+        try:
+            changed = self.fetch_snapshot(mode)
+        except Exception as e:
+            self.last_error = e
+            self.breaker.record_failure(retry_after=getattr(e, "retry_after", None))
+            if self.breaker.state == OPEN:
+                self.metrics.increment("circuit_open")
+            raise
+        self.last_error = None
+        self.breaker.record_success()
+        return changed
 
-        location_json,time_dict = self.parse_data(location_data_str, time_data_str)
+    def staleness(self, now=None):
+        """Seconds since the locations were last fetched successfully (None if they never were)."""
+        if self.fetched_at is None:
+            return None
+        return ((now or datetime.now()) - self.fetched_at).total_seconds()
 
-        if not location_json or not time_dict:
-            raise ValueError("Couldn't find data.")
+    def fetch_snapshot(self, mode):
+        """
+        Body of fetch_locations, without the circuit breaker.
+        :raises ExtractError:
+            when the data can't be found, or (fast and stream modes) a variable is larger than the extractor's max_payload
+        """
+        metrics = self.metrics
+        with metrics.stage("network"):
+            page = self.stream_script_data(self.url) if mode == "stream" else self.get_page(self.url)
+        if page is None:
+            raise FetchError(f"Couldn't fetch {self.url}.", self.url, status=self.last_status, retry_after=self.retry_after)
+        if page is NOT_MODIFIED:
+            self.fetched_at = datetime.now()
+            return False
 
-        self.locations = self.get_locations(location_json,time_dict)
+        if mode == "stream":
+            location_data_str, time_data_str = page or (None, None)  # extracted while downloading
+        elif mode == "fast":
+            with metrics.stage("extract"):
+                try:
+                    location_data_str, time_data_str = extract_script_data(page) if page else (None, None)
+                except ValueError as e:  # a variable larger than the extractor's max_payload
+                    metrics.increment("parse_failures")
+                    raise ExtractError(str(e), self.url, status=self.last_status) from e
+        else:
+            with metrics.stage("soup"):
+                script_tags = self.get_script_tags(page)
+            with metrics.stage("extract"):
+                location_data_str, time_data_str = self.find_script_data(script_tags)
 
+        if not location_data_str or not time_data_str:
+            metrics.increment("parse_failures")
+            raise ExtractError("Couldn't find data.", self.url, status=self.last_status)
 
-    def get_tags(self,url: str):
+        location_hash, time_hash = payload_hash(location_data_str), payload_hash(time_data_str)
+        previous = self.payload
+        static_hit = previous is not None and previous[0] == location_hash
+        if static_hit and previous[1] == time_hash:
+            metrics.increment("payload_hits")  # body changed outside the data (tokens, timestamps...)
+            self.fetched_at = datetime.now()
+            self.commit_validators()
+            return False
+
+        with metrics.stage("json"):
+            if static_hit:
+                location_json, time_dict = previous[2], self.decode_time(time_data_str)
+            else:
+                location_json, time_dict = self.decode_data(location_data_str, time_data_str)
+        if not location_json or not time_dict:
+            metrics.increment("parse_failures")
+            raise DecodeError("Couldn't decode locationData/timeData.", self.url, status=self.last_status)
+        metrics.increment("static_hits" if static_hit else "payload_misses")
+
+        with metrics.stage("model"):
+            slots = {}
+            self.locations = self.get_locations(location_json, time_dict, previous_slots=self.slots if static_hit else {},
+                                                slots=slots)
+        metrics.increment("locations_parsed", len(self.locations))
+        self.payload = (location_hash, time_hash, location_json)
+        self.slots = slots
+        self.fetched_at = datetime.now()
+        self.commit_validators()
+        return True
+
+    def get_page(self, url: str, conditional=True):
         """
-        Creates the soup from the appointmentWizard website using requests library and filters all the script tags in the document.
+        Downloads the appointmentWizard website through the retriever's session.
+        :param conditional:
+            When True, sends If-None-Match/If-Modified-Since from the last successfully parsed page and compares body hashes, so unchanged pages can be skipped.
         :return:
-            bs4 resultSet with all script tags found
+            IF SUCCESSFUL: page html as string
+            IF UNCHANGED (304 or same body hash): NOT_MODIFIED
+            IF REQUEST FAILED: None
         """
+        previous = self.validators.get(url) if conditional else None
+        self.last_status = None
+        self.retry_after = None
         try:
-            req = requests.get(url, timeout=10)
+            req = self.session.get(url, headers=self.conditional_headers(previous), timeout=10)
+            self.last_status = req.status_code
             req.raise_for_status()  # Raises an error for bad responses
+            if self.capture is not None:
+                self.capture.write(url, req.status_code, None if req.status_code == 304 else req.text)
         except requests.RequestException as e:
-            print(f"Error fetching data: {e}")
+            self.request_failed(e)
+            return None
+        self.metrics.increment("fetches")
+        if not conditional:
+            return req.text
+        if req.status_code == 304:
+            self.metrics.increment("not_modified")
+            return NOT_MODIFIED
+        self.metrics.increment("bytes", len(req.content))
+
+        body_hash = hashlib.blake2b(req.content, digest_size=16).digest()
+        if previous and previous["hash"] == body_hash:
+            self.metrics.increment("not_modified")
+            self.metrics.increment("body_hash_hits")
+            return NOT_MODIFIED
+        self.pending_validators = (url, {
+            "etag": req.headers.get("ETag"),
+            "last_modified": req.headers.get("Last-Modified"),
+            "hash": body_hash,
+        })
+        return req.text
+
+    def stream_script_data(self, url, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Streams the page through a ScriptDataExtractor and closes the connection as soon as locationData and timeData are captured,
+        so the rest of the document is never downloaded and at most one chunk plus the variable being captured is held in memory.
+        There is no body hash in this mode (the body is never read whole); unchanged data is caught by the payload hashes instead.
+        When capturing, only the two variables are recorded, wrapped in a minimal page that replays in any mode.
+        :return:
+            IF SUCCESSFUL: tuple (locationData, timeData), with None for a variable that wasn't found
+            IF UNCHANGED (304): NOT_MODIFIED
+            IF REQUEST FAILED: None
+        :raises ExtractError:
+            when a variable is larger than the extractor's max_payload
+        """
+        previous = self.validators.get(url)
+        self.last_status = None
+        self.retry_after = None
+        try:
+            with self.session.get(url, headers=self.conditional_headers(previous), timeout=10, stream=True) as req:
+                self.last_status = req.status_code
+                req.raise_for_status()
+                self.metrics.increment("fetches")
+                if req.status_code == 304:
+                    self.metrics.increment("not_modified")
+                    if self.capture is not None:
+                        self.capture.write(url, 304, None)
+                    return NOT_MODIFIED
+                extractor = ScriptDataExtractor()
+                decoder = codecs.getincrementaldecoder(req.encoding or "utf-8")(errors="replace")
+                received = 0
+                try:
+                    for chunk in req.iter_content(chunk_size):
+                        received += len(chunk)
+                        if extractor.feed(decoder.decode(chunk)):
+                            self.metrics.increment("early_closes")
+                            break
+                except ValueError as e:  # a variable larger than the extractor's max_payload
+                    self.metrics.increment("parse_failures")
+                    raise ExtractError(str(e), url, status=self.last_status) from e
+                finally:
+                    self.metrics.increment("bytes", received)
+                headers = req.headers
+        except requests.RequestException as e:
+            self.request_failed(e)
+            return None
+        self.pending_validators = (url, {
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "hash": None,
+        })
+        data = (extractor.get("locationData"), extractor.get("timeData"))
+        if self.capture is not None:
+            self.capture.write(url, 200, self.data_page(*data))
+        return data
+
+    @staticmethod
+    def data_page(location_data, time_data):
+        """Minimal page declaring the given locationData/timeData literals (None leaves a variable out)."""
+        declarations = "".join(f"var {name} = {value};\n" for name, value in
+                               (("locationData", location_data), ("timeData", time_data)) if value is not None)
+        return f"<html><body><script>\n{declarations}</script></body></html>"
+
+    @staticmethod
+    def conditional_headers(previous):
+        """If-None-Match/If-Modified-Since headers from the validators of the last successfully parsed page."""
+        headers = {}
+        if previous:
+            if previous["etag"]:
+                headers["If-None-Match"] = previous["etag"]
+            if previous["last_modified"]:
+                headers["If-Modified-Since"] = previous["last_modified"]
+        return headers
+
+    def request_failed(self, error):
+        print(f"Error fetching data: {error}")
+        if error.response is not None:
+            self.retry_after = parse_retry_after(error.response.headers.get("Retry-After"))
+
+    def commit_validators(self):
+        """Stores the validators of the page that was just parsed so the next request for it can be conditional."""
+        if self.pending_validators:
+            url, validators = self.pending_validators
+            self.validators[url] = validators
+            self.pending_validators = None
+
+    def get_script_tags(self, page: str):
+        """
+        Creates the soup from the page html and filters all the script tags in the document.
+        :return:
+            bs4 resultSet with all script tags found ([] if there is no page)
+        """
+        if not page:
             return []
-        soup = BeautifulSoup(req.text, 'html.parser')
+        soup = BeautifulSoup(page, 'html.parser')
         return soup.find_all('script')
 
+    def get_tags(self,url: str):
+        """
+        Creates the soup from the appointmentWizard website using requests library and filters all the script tags in the document.
+        :return:
+            bs4 resultSet with all script tags found
+        """
+        return self.get_script_tags(self.get_page(url, conditional=False))
+
+    @staticmethod
+    def script_text(script_tag):
+        """Returns the javascript inside a script tag without re-serializing the tag (falls back to str() for tags with several children)."""
+        text = script_tag.string
+        return text if text is not None else str(script_tag)
+
+    def find_script_data(self, script_tags: ResultSet):
+        """
+        Single pass over the script tags looking for both variables at once with one precompiled pattern.
+        :return:
+            tuple (locationData, timeData) with each value as string, or None for a variable that wasn't found
+        """
+        location_data = time_data = None
+        for script_tag in script_tags:
+            for match in SCRIPT_DATA_PATTERN.finditer(self.script_text(script_tag)):
+                if location_data is None and match.group(1):
+                    location_data = match.group(1)
+                elif time_data is None and match.group(2):
+                    time_data = match.group(2)
+            if location_data is not None and time_data is not None:
+                return location_data, time_data
+
+        # one declaration swallowed by the other's lazy match: look for the missing one on its own
+        if location_data is None and time_data is not None:
+            location_data = self.search_tags(script_tags, LOCATION_PATTERN)
+        elif time_data is None and location_data is not None:
+            time_data = self.search_tags(script_tags, TIME_PATTERN)
+        return location_data, time_data
+
+    def search_tags(self, script_tags, pattern):
+        """Returns the first group of the first tag matching pattern, or None."""
+        for script_tag in script_tags:
+            match = pattern.search(self.script_text(script_tag))
+            if match and match.group(1):
+                return match.group(1)
+        return None
+
     def find_location(self, script_tags: ResultSet):
         """
         Iterates through the result set from getTags and uses regular expressions on the iterables in order to extract the locationData variable value (if existent).
         :return:
             IF FOUND: variable value as string
-            IF NOT FOUND: None
+            IF THERE ARE NO SCRIPT TAGS: None
+        :raises ValueError:
+            if none of the script tags declares locationData
         """
         if script_tags == []:
             return None
-         # Regular expressions to extract locationData
-        location_pattern = r'var locationData\s*=\s*(\[\{.*?\}\]);'
-        for script_tag in script_tags:
-            # Extract locationData
-            location_match = re.search(location_pattern, str(script_tag), re.DOTALL)
-            locationData = location_match.group(1) if location_match else None
-            if locationData:
-                return locationData
+        locationData = self.search_tags(script_tags, LOCATION_PATTERN)
+        if locationData:
+            return locationData
 
         raise ValueError("Couldn't find data.")
 
@@ -67,17 +398,15 @@ class LocationRetriever:
         Iterates through the result set from getTags and uses regular expressions on the iterables in order to extract the timeData variable value (if existent).
         :return:
             IF FOUND: variable value as string
-            IF NOT FOUND: None
+            IF THERE ARE NO SCRIPT TAGS: None
+        :raises ValueError:
+            if none of the script tags declares timeData
         """
         if script_tags == []:
             return None
-        time_pattern = r'var timeData = (\[.*?\])'
-        for script_tag in script_tags:
-            # Extract timeData
-            time_match = re.search(time_pattern, str(script_tag), re.DOTALL)
-            timeData = time_match.group(1) if time_match else None
-            if timeData:
-                return timeData
+        timeData = self.search_tags(script_tags, TIME_PATTERN)
+        if timeData:
+            return timeData
         raise ValueError("Couldn't find data.")
 
     def parse_data(self, locationData: str, timeData: str):
@@ -88,43 +417,121 @@ class LocationRetriever:
         try:
             if not locationData or not timeData:
                 raise ValueError("Couldn't find data.")
-            location_json = json.loads(locationData)
-            time_json = json.loads(timeData)
-            time_dict = {}
-            for obj in time_json:
-                if not obj.get("LocationId"):
-                    return None,None
-                time_dict[obj["LocationId"]] = obj  # Fills a new dictionary with the location id as a key for that dict (linear access)
-            # Basically hashed the dict
+            location_json = self.decoder.loads(locationData)
+            time_dict = self.index_time(self.decoder.loads(timeData))
+            if time_dict is None:
+                return None,None
             return location_json,time_dict
-        except json.decoder.JSONDecodeError as e:
+        except self.decoder.errors as e:
             print("Error: ",e)
             return None,None
 
-    def get_locations(self,location_json: dict,time_dict: dict):
+    @staticmethod
+    def index_time(time_json):
+        """
+        Maps the timeData entries by LocationId (linear access from the locations).
+        :return:
+            dict of LocationId -> entry, or None if an entry has no LocationId
+        """
+        time_dict = {}
+        for obj in time_json:
+            if not obj.get("LocationId"):
+                return None
+            time_dict[obj["LocationId"]] = obj
+        return time_dict
+
+    def decode_time(self, timeData: str):
+        """
+        Decodes timeData alone, for pages whose locationData didn't change.
+        :return:
+            dict of LocationId -> entry, or None if the data is invalid
+        """
+        if not timeData:
+            return None
+        try:
+            if self.decoder.typed:
+                return self.decoder.decode_time(timeData)
+            return self.index_time(self.decoder.loads(timeData))
+        except self.decoder.errors as e:
+            print("Error: ",e)
+            return None
+
+    def decode_data(self, locationData: str, timeData: str):
+        """
+        Same as parse_data, but lets a typed decoder (msgspec) build its records directly instead of dicts.
+        :return:
+            tuple (locations, time_dict) accepted by get_locations, or (None, None) if the data is invalid
+        """
+        if not self.decoder.typed or not locationData or not timeData:
+            return self.parse_data(locationData, timeData)
+        try:
+            return self.decoder.decode_records(locationData, timeData)
+        except self.decoder.errors as e:
+            print("Error: ",e)
+            return None,None
+
+    def get_locations(self,location_json: dict,time_dict: dict, previous_slots=None, slots=None):
         """
         takes both dicts containing location info as parameter and map the ones with available appointments into location objects
+        :param previous_slots:
+            Optional dict LocationId -> (FirstOpenSlot, Location) of the previous snapshot; locations whose FirstOpenSlot didn't change are reused from it.
+        :param slots:
+            Optional dict filled with this snapshot's LocationId -> (FirstOpenSlot, Location).
         :return:
             list of Location objects with available appointments
         """
         if not location_json or not time_dict:
             raise ValueError("Couldn't find data.")
+        if not isinstance(location_json[0], dict):
+            return self.get_record_locations(location_json, time_dict, previous_slots, slots)
 
         locations = []
 
         for obj in location_json:
-            dict = self.get_dict(obj,time_dict)
-            if not dict:
+            time_obj = self.get_dict(obj,time_dict)
+            if not time_obj:
                 continue
-            if dict["FirstOpenSlot"] == "No Appointments Available":
+            if time_obj["FirstOpenSlot"] == NO_APPOINTMENTS:
                 continue #quits the loop if there are no appointments available for the location
 
-            location_obj = self.make_loc_instance(obj,dict)
+            location_id = time_obj.get("LocationId")
+            cached = previous_slots.get(location_id) if previous_slots else None
+            if cached and cached[0] == time_obj["FirstOpenSlot"]:
+                location_obj = cached[1]
+            else:
+                location_obj = self.make_loc_instance(obj,time_obj)
+            if location_obj and slots is not None:
+                slots[location_id] = (time_obj["FirstOpenSlot"], location_obj)
             if location_obj:
                 locations.append(location_obj)
 
         return locations
 
+    @staticmethod
+    def get_record_locations(records, time_dict, previous_slots=None, slots=None):
+        """
+        get_locations for typed records (MsgspecDecoder): Location objects are built by Location.from_record.
+        """
+        locations = []
+        for record in records:
+            if not record.LocAppointments:
+                print("Invalid Location Data.")
+                continue
+            location_id = record.LocAppointments[0].LocationId
+            time_record = time_dict.get(location_id)
+            if time_record is None or time_record.FirstOpenSlot == NO_APPOINTMENTS:
+                continue
+            cached = previous_slots.get(location_id) if previous_slots else None
+            if cached and cached[0] == time_record.FirstOpenSlot:
+                location_obj = cached[1]
+            else:
+                location_obj = Location.from_record(record, time_record)
+            if location_obj:
+                if slots is not None:
+                    slots[location_id] = (time_record.FirstOpenSlot, location_obj)
+                locations.append(location_obj)
+        return locations
+
     def get_dict(self,loc_obj,time_dict):
         """
         Search for the loc_obj's id inside of time_dict
@@ -138,46 +545,100 @@ class LocationRetriever:
         try:
             loc_id = loc_obj["LocAppointments"][0]["LocationId"]
             return time_dict.get(loc_id)
-        except KeyError:
+        except (KeyError, IndexError):
             print("Invalid Location Data.")
             return None
 
     def make_loc_instance(self, loc_obj, time_obj ):
         return Location.create_location(loc_obj, time_obj)
 
+class TimeIndex:
+    """
+    Locations of one snapshot sorted by next_appointment_date, so any day window can be answered with two binary searches and comes back already sorted.
+    Locations without a valid date ('Unknown') are left out, since they can never fall inside a window.
+    """
+    def __init__(self, locations):
+        self.locations = sorted((loc for loc in locations if isinstance(loc.next_appointment_date, datetime)),
+                                key=lambda loc: loc.next_appointment_date)
+        self.dates = [loc.next_appointment_date for loc in self.locations]
+
+    def window(self, start, end):
+        """Returns the locations with start <= next_appointment_date <= end, sorted by date."""
+        return self.locations[bisect_left(self.dates, start):bisect_right(self.dates, end)]
+
+    def windows(self, start, ends):
+        """
+        Answers several windows sharing the same start at once.
+        :return:
+            list with the sorted locations of every [start, end] window, in the order of ends
+        """
+        first = bisect_left(self.dates, start)
+        return [self.locations[first:bisect_right(self.dates, end, first)] for end in ends]
+
+
 class Filter:
-    def __init__(self,days, retriever = None):
+    def __init__(self,days, retriever = None, clock=portal_now):
         """
         Takes the locations from LocationRetriever object and filters it in filter() based on the day range given, returning a new list of location objects which next appointments date match day range given from the current date sorted from most recent to least recent.
+        A TimeIndex is built once per snapshot (i.e. until the retriever's locations list is replaced), so repeated and multi-window queries don't rescan or re-sort.
         :param days:
             Integer representing the range of days from now in which you wish to find an available appointment.
+        :param retriever:
+            Source of the snapshot: a LocationRetriever, a MultiServiceRetriever or a SnapshotCache shared between many filters (which then never fetch on their own).
+        :param clock:
+            Function returning the current datetime the day range starts from, as a naive time in the portal's zone like the
+            slot dates (default: portal_now; replays pass the recorded time).
         """
         self.days = days
+        self.clock = clock
         self.retriever = retriever or LocationRetriever()
-        if not self.retriever.locations:
+        self.indexes = {}  # service id (None for single-service) -> (locations list, TimeIndex built from it)
+        if not self.retriever.locations and self.retriever.fetched_at is None:
             self.retriever.fetch_locations()
 
     def filter(self):
         """
         Filters self.retriever.locations appending those which appointments lie inside the day range to a new array. Returns the array sorted based on date.
+        When the retriever holds several services (dict of service id -> locations), each service is filtered separately.
         :return:
+            sorted list of locations, or dict of service id -> sorted list for multi-service retrievers
         """
-        if not self.retriever.locations:
-            return []
-        filtered_dates = []
-        current_date = datetime.now()
-        range_date = current_date + timedelta(days=self.days)
-        for obj in self.retriever.locations:
-            if range_date >= obj.next_appointment_date >= current_date:
-                filtered_dates.append(obj)
-        return self.sort_locations(filtered_dates)
+        start = self.clock()
+        end = start + timedelta(days=self.days)
+        return self.map_services(lambda index: index.window(start, end))
 
+    def filter_windows(self, days_list):
+        """
+        Answers several day ranges (e.g. [1, 3, 7, 30]) from the same snapshot in one pass.
+        :return:
+            dict of days -> sorted list of locations (per service for multi-service retrievers)
+        """
+        start = self.clock()
+        ends = [start + timedelta(days=days) for days in days_list]
+        return self.map_services(lambda index: dict(zip(days_list, index.windows(start, ends))))
+
+    def map_services(self, query):
+        """
+        Runs query on the TimeIndex of every service. The window bounds are computed once by the caller and shared by
+        every service, so the clock is read (and converted to the portal's zone) once per query, not per location.
+        """
+        locations = self.retriever.locations
+        with getattr(self.retriever, "metrics", DISABLED).stage("filter"):
+            if isinstance(locations, dict):
+                return {service: query(self.get_index(service, service_locations))
+                        for service, service_locations in locations.items()}
+            return query(self.get_index(None, locations))
+
+    def get_index(self, service, locations):
+        """Returns the TimeIndex for locations, rebuilding it only when the snapshot list changed."""
+        cached = self.indexes.get(service)
+        if cached is None or cached[0] is not locations:
+            cached = (locations, TimeIndex(locations or []))
+            self.indexes[service] = cached
+        return cached[1]
 
     def sort_locations(self,locations):
         """
         Sorts a list of Location objects by their next_appointment_date in ascending order.
         """
         return sorted(locations, key=lambda loc: loc.next_appointment_date)
-
-
-
@@ -1,24 +1,143 @@
 import argparse
 from searcher import continuous_search
+from scheduler import PollScheduler
+from releaseAnalytics import ReleaseAnalytics
+from notifier import create_sink
+
+
+def add_scheduler_arguments(parser, defaults=True):
+    """
+    Adds the polling options shared by the search and the serve command.
+    :param defaults:
+        False for the serve subparser: its options then only set what is given after "serve", so options given before
+        it (e.g. "--interval 5 serve") aren't overridden by the subparser's defaults.
+    """
+    def default(value):
+        return value if defaults else argparse.SUPPRESS
+
+    parser.add_argument(
+        "--interval", type=int, default=default(10), help="Time in seconds between each check of the MVC site (default: 10 seconds)"
+    )
+    parser.add_argument(
+        "--services", type=int, nargs="+", default=default(None), help="AppointmentWizard ids to watch concurrently (default: 12)"
+    )
+    parser.add_argument(
+        "--max-interval", type=int, default=default(None), help="Longest time in seconds between checks when nothing changes or while backing off (default: 10x --interval)"
+    )
+    parser.add_argument(
+        "--predict", action="store_true", default=default(False),
+        help="Learn when slots are released (starting from --history when given) and only poll quickly around those times"
+    )
+    parser.add_argument(
+        "--history", metavar="DATABASE", default=default(None), help="Record every snapshot's changed locations in this SQLite database"
+    )
+    parser.add_argument(
+        "--record", metavar="CAPTURE", default=default(None), help="Append every page received to this compressed capture file (see the replay command)"
+    )
+    parser.add_argument(
+        "--mode", choices=("soup", "fast", "stream"), default=default("soup"),
+        help="How pages are parsed: soup (BeautifulSoup), fast (raw text scan) or stream (scan while downloading and hang up once the data is read) (default: soup)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=default(None),
+        help="Supervisor mode: fetch and parse the services in this many worker processes sharing their snapshots through shared memory (restarted if they crash)"
+    )
+    parser.add_argument(
+        "--burst-times", nargs="+", default=default(()), metavar="HH:MM", help="Times of day when slots are usually released; checks speed up around them"
+    )
+
+
+def build_scheduler(args):
+    analytics = None
+    if args.predict:
+        analytics = ReleaseAnalytics.from_history(args.history) if args.history else ReleaseAnalytics()
+    return PollScheduler(args.interval, max_interval=args.max_interval, burst_times=args.burst_times, analytics=analytics)
+
 
 if __name__ == "__main__":
     # Step 1: Create an argument parser
     parser = argparse.ArgumentParser(description="CLI for continuous appointment search")
     parser.add_argument(
-        "--days", type=int, required=True, help="Number of days to search for available appointments"
+        "--days", type=int, help="Number of days to search for available appointments (required unless a subcommand is used)"
+    )
+    parser.add_argument(
+        "--watch", action="store_true", help="Keep running after appointments are found and only notify about new or earlier slots"
+    )
+    parser.add_argument(
+        "--metrics-file", help="Append per-stage timings and counters to this file as JSON lines after every check"
+    )
+    parser.add_argument(
+        "--notify", nargs="+", type=create_sink, metavar="SINK",
+        help="Where to send notifications: desktop, stdout, file:PATH or webhook:URL (default: desktop)"
     )
     parser.add_argument(
-        "--interval", type=int, default=10, help="Time in seconds between each check (default: 10 seconds)"
+        "--notify-interval", type=float, default=0,
+        help="Minimum seconds between two notifications on the same sink; updates in between are merged (default: 0)"
+    )
+    parser.add_argument(
+        "--near", metavar="ZIP", help="Only report locations near this zip code (or \"LATITUDE,LONGITUDE\")"
+    )
+    parser.add_argument(
+        "--radius", type=float, default=25, help="Maximum distance in miles from --near (default: 25)"
+    )
+    parser.add_argument(
+        "--order", choices=("date", "distance", "score"), default="date",
+        help="Sort locations near --near by date, distance, or date pushed back by distance (default: date)"
+    )
+    add_scheduler_arguments(parser)
+
+    subparsers = parser.add_subparsers(dest="command")
+    serve_parser = subparsers.add_parser("serve", help="Run a local HTTP API serving the current appointments")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    serve_parser.add_argument("--port", type=int, default=8000, help="Port to listen on (default: 8000)")
+    add_scheduler_arguments(serve_parser, defaults=False)
+
+    replay_parser = subparsers.add_parser("replay", help="Run a recorded capture through filtering and change detection offline")
+    replay_parser.add_argument("capture", help="Capture file written with --record")
+    replay_parser.add_argument("--days", type=int, required=True, help="Number of days to search, counted from each recorded page's time")
+    replay_parser.add_argument(
+        "--speed", type=float, help="Replay at the recorded pacing (1), N times faster (N) or as fast as possible (default)"
+    )
+    replay_parser.add_argument("--mode", choices=("fast", "soup", "stream"), default="fast", help="Extraction mode (default: fast)")
+    replay_parser.add_argument(
+        "--notify", nargs="+", type=create_sink, default=argparse.SUPPRESS, metavar="SINK",
+        help="Also send the replayed alerts to these sinks (default: only count them)"
     )
 
     # Step 2: Parse command-line arguments
     args = parser.parse_args()
 
     # Step 3: Validate the --days and --interval arguments
-    if args.days <= 0:
-        print("Error: The value for --days must be greater than 0.")
-    elif args.interval <= 0:
+    if args.interval <= 0:
         print("Error: The value for --interval must be greater than 0.")
+    elif args.max_interval is not None and args.max_interval < args.interval:
+        print("Error: The value for --max-interval must not be lower than --interval.")
+    elif args.workers is not None and (args.workers <= 0 or args.record):
+        print("Error: The value for --workers must be greater than 0, and --record can't be used with it.")
+    elif args.command == "serve":
+        from server import run_server
+        scheduler = build_scheduler(args)
+        run_server(host=args.host, port=args.port, check_interval=args.interval, services=args.services, scheduler=scheduler,
+                   history_path=args.history, record_path=args.record, workers=args.workers, mode=args.mode)
+    elif args.command == "replay":
+        from pageCapture import replay_capture
+        if args.days <= 0 or (args.speed is not None and args.speed <= 0):
+            print("Error: The values for --days and --speed must be greater than 0.")
+        else:
+            stats = replay_capture(args.capture, args.days, speed=args.speed, mode=args.mode, sinks=args.notify or ())
+            print(f"Replayed {stats['snapshots']} snapshots ({stats['errors']} unparseable) in {stats['seconds']:.2f} s "
+                  f"({stats['snapshots_per_second']:.0f}/s): {stats['events']} change events, {stats['alerts']} alerts")
+    elif args.days is None or args.days <= 0:
+        print("Error: The value for --days must be given and greater than 0.")
+    elif args.notify_interval < 0:
+        print("Error: The value for --notify-interval must not be negative.")
+    elif args.radius <= 0:
+        print("Error: The value for --radius must be greater than 0.")
     else:
         # Step 4: Call continuous_search with the specified number of days and interval
-        continuous_search(days=args.days, check_interval=args.interval)
+        scheduler = build_scheduler(args)
+        continuous_search(days=args.days, check_interval=args.interval, services=args.services, watch=args.watch,
+                          scheduler=scheduler, metrics_path=args.metrics_file, history_path=args.history,
+                          sinks=args.notify, notify_interval=args.notify_interval, record_path=args.record,
+                          near=args.near, radius=args.radius, order=args.order, workers=args.workers,
+                          mode=args.mode)
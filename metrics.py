@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+from contextlib import nullcontext
+
+PREFIX = "mvc_"
+
+
+class StageTimer:
+    """Context manager adding its elapsed time to one stage of a Metrics registry."""
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """
+    Per-stage timings (count, sum, max, last) and counters for the poll loop, exportable in Prometheus text format or as JSON lines.
+    """
+    enabled = True
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}  # stage -> [count, total seconds, max seconds, last seconds]
+        self.counters = {}
+
+    def stage(self, name):
+        """Returns a context manager timing the enclosed block as stage name."""
+        return StageTimer(self, name)
+
+    def observe(self, name, seconds):
+        with self.lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                self.stages[name] = [1, seconds, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                stats[2] = max(stats[2], seconds)
+                stats[3] = seconds
+
+    def increment(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self):
+        """Returns a consistent copy of every stage and counter as plain dicts."""
+        with self.lock:
+            return {
+                "stages": {name: {"count": count, "sum": total, "max": longest, "last": last}
+                           for name, (count, total, longest, last) in self.stages.items()},
+                "counters": dict(self.counters),
+            }
+
+    def to_prometheus(self):
+        """Renders the metrics in the Prometheus text exposition format."""
+        data = self.snapshot()
+        lines = [f"# TYPE {PREFIX}stage_seconds summary"]
+        for name, stats in sorted(data["stages"].items()):
+            lines.append(f'{PREFIX}stage_seconds_count{{stage="{name}"}} {stats["count"]}')
+            lines.append(f'{PREFIX}stage_seconds_sum{{stage="{name}"}} {stats["sum"]:.6f}')
+        lines.append(f"# TYPE {PREFIX}stage_seconds_max gauge")
+        for name, stats in sorted(data["stages"].items()):
+            lines.append(f'{PREFIX}stage_seconds_max{{stage="{name}"}} {stats["max"]:.6f}')
+        for name, value in sorted(data["counters"].items()):
+            lines.append(f"# TYPE {PREFIX}{name}_total counter")
+            lines.append(f"{PREFIX}{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def to_json_line(self):
+        """Renders the metrics as one JSON object (with a timestamp) on a single line."""
+        return json.dumps(dict(self.snapshot(), timestamp=time.time()))
+
+    def write_json_line(self, path):
+        with open(path, "a", encoding="utf-8") as file:
+            file.write(self.to_json_line() + "\n")
+
+
+class NullMetrics:
+    """Stand-in used when instrumentation is off: every call is a no-op and stage() returns a shared null context."""
+    enabled = False
+    NULL_STAGE = nullcontext()
+
+    def stage(self, name):
+        return self.NULL_STAGE
+
+    def observe(self, name, seconds):
+        pass
+
+    def increment(self, name, amount=1):
+        pass
+
+
+DISABLED = NullMetrics()
@@ -1,12 +1,24 @@
 from datetime import datetime
+from functools import lru_cache
+
+from slotParser import parse_slot_date, NEXT_AVAILABLE
+
+STATIC_FIELDS = ('Name', 'Street1', 'City', 'State', 'Zip', 'PhoneNumber')
 
 class Location:
-    def __init__(self, name,street,city,state,zip_code,phone,appointments,next_appointment_date):
+    # Slotted: no per-instance __dict__, since a full set of locations is rebuilt on every poll
+    __slots__ = ('name', 'street', 'city', 'state', 'zip_code', 'phone', 'appointments', 'next_appointment_date', 'location_id')
+
+    # LocationId -> (raw static fields, validated static fields). Address/phone rarely change, so they're validated once per process.
+    static_cache = {}
+
+    def __init__(self, name,street,city,state,zip_code,phone,appointments,next_appointment_date,location_id=None):
         """
         Location Model that creates a location object with the basic info (Name, Address, Zip Code, Phone, Number of Appointments, and Next Appointment Date)
         :param loc_dict: Python dictionary that contains 'Name', 'Street1', 'City', 'State', 'Zip', 'PhoneNumber'
         :param appointments: Integer representing the number of available appointments
         :param next_appointment_date: Datetime object representing the next available appointment date
+        :param location_id: LocationId used by the portal for this location (stable between polls)
         """
         self.name = name
         self.street = street
@@ -16,6 +28,7 @@ class Location:
         self.phone = phone
         self.appointments = appointments
         self.next_appointment_date = next_appointment_date
+        self.location_id = location_id
 
     @staticmethod
     def get_valid_field(data, key, default):
@@ -43,20 +56,83 @@ class Location:
         if not loc_dict or not date_obj:
             return None
 
-        name = cls.get_valid_field(loc_dict, 'Name', "Unknown Location")
-        street = cls.get_valid_field(loc_dict, 'Street1', "Unknown Street")
-        city = cls.get_valid_field(loc_dict, 'City', "Unknown City")
-        state = cls.get_valid_field(loc_dict, 'State', "Unknown State")
-        zip_code = cls.get_valid_zip(loc_dict.get('Zip', "N/A"))
-        phone = cls.get_valid_phone(loc_dict.get('PhoneNumber', "N/A"))
-
         appointment_str = date_obj.get("FirstOpenSlot")
         if not appointment_str:
             return None
-        appointments = cls.get_appointment_number(appointment_str)
-        next_appointment = cls.get_next_date(appointment_str)
 
-        return cls(name,street,city,state,zip_code,phone,appointments,cls.get_valid_date(next_appointment))
+        location_id = date_obj.get("LocationId")
+        name, street, city, state, zip_code, phone = cls.get_static_fields(loc_dict, location_id)
+        appointments, next_appointment = cls.parse_first_open_slot(appointment_str)
+
+        return cls(name,street,city,state,zip_code,phone,appointments,next_appointment,location_id)
+
+    @classmethod
+    def from_record(cls, record, time_record):
+        """
+        Builds a Location straight from typed msgspec records (jsonDecoder.LocationRecord and TimeRecord), without the dict
+        lookups of create_location: the schema already fixed every field's name and type, and the static fields are
+        looked up in the same per-LocationId cache with one tuple comparison.
+        """
+        appointment_str = time_record.FirstOpenSlot
+        if not appointment_str:
+            return None
+        location_id = time_record.LocationId
+        raw = (record.Name, record.Street1, record.City, record.State, record.Zip, record.PhoneNumber)
+        cached = cls.static_cache.get(location_id) if location_id is not None else None
+        if cached is None or cached[0] != raw:
+            cached = (raw, cls.validate_static_fields(*raw))
+            if location_id is not None:
+                cls.static_cache[location_id] = cached
+        appointments, next_appointment = cls.parse_first_open_slot(appointment_str)
+        return cls(*cached[1], appointments, next_appointment, location_id)
+
+    @classmethod
+    def get_static_fields(cls, loc_dict, location_id=None):
+        """
+        Returns the validated (name, street, city, state, zip_code, phone) tuple for a location dict.
+        Results are cached by LocationId and only re-validated when one of the raw fields changes.
+        """
+        cached = cls.static_cache.get(location_id) if location_id is not None else None
+        if cached is not None:
+            for key, value in zip(STATIC_FIELDS, cached[0]):
+                if loc_dict.get(key) != value:
+                    break
+            else:
+                return cached[1]
+
+        fields = (
+            cls.get_valid_field(loc_dict, 'Name', "Unknown Location"),
+            cls.get_valid_field(loc_dict, 'Street1', "Unknown Street"),
+            cls.get_valid_field(loc_dict, 'City', "Unknown City"),
+            cls.get_valid_field(loc_dict, 'State', "Unknown State"),
+            cls.get_valid_zip(loc_dict.get('Zip', "N/A")),
+            cls.get_valid_phone(loc_dict.get('PhoneNumber', "N/A")),
+        )
+        if location_id is not None:
+            cls.static_cache[location_id] = (tuple(loc_dict.get(key) for key in STATIC_FIELDS), fields)
+        return fields
+
+    @classmethod
+    def validate_static_fields(cls, name, street, city, state, zip_code, phone):
+        """Same validation as get_static_fields, for raw values read from a typed record."""
+        return (
+            name.strip() or "Unknown Location",
+            street.strip() or "Unknown Street",
+            city.strip() or "Unknown City",
+            state.strip() or "Unknown State",
+            cls.get_valid_zip(zip_code),
+            cls.get_valid_phone(phone),
+        )
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def parse_first_open_slot(appointment_str):
+        """
+        Memoized parse of a FirstOpenSlot string, which mostly repeats between polls.
+        :return:
+            tuple (number of appointments, next appointment date or 'Unknown')
+        """
+        return Location.get_appointment_number(appointment_str), Location.get_valid_date(Location.get_next_date(appointment_str))
 
 
 
@@ -72,15 +148,29 @@ class Location:
     @staticmethod
     def get_next_date(appointment_str):
         try:
-            str_split = appointment_str.split("Next Available: ")
-            date_obj = datetime.strptime(str_split[1],
-                                         "%m/%d/%Y %I:%M %p")  # next free appointment (parse into datetime obj)
+            str_split = appointment_str.split(NEXT_AVAILABLE)
+            date_obj = parse_slot_date(str_split[1])  # next free appointment (parse into datetime obj)
             return date_obj
         except (IndexError,ValueError) as e:
             print(f"Error: {e}")
             return None
 
 
+    def to_dict(self):
+        """Returns the location as a JSON-serializable dict (dates in ISO format)."""
+        date = self.next_appointment_date
+        return {
+            "location_id": self.location_id,
+            "name": self.name,
+            "street": self.street,
+            "city": self.city,
+            "state": self.state,
+            "zip_code": self.zip_code,
+            "phone": self.phone,
+            "appointments": self.appointments,
+            "next_appointment_date": date.isoformat() if isinstance(date, datetime) else date,
+        }
+
     def __str__(self):
         return (
             f"Location Name: {self.name}\n"
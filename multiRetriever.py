@@ -0,0 +1,107 @@
+import asyncio
+
+from errors import CircuitOpenError, FetchError
+from locationRetriever import LocationRetriever
+from metrics import DISABLED
+
+
+class MultiServiceRetriever:
+    """
+    Scrapes several AppointmentWizard services (knowledge test, road test, renewal...) concurrently from one event loop.
+    Its locations attribute is a dict of service id -> list of Location objects, which Filter understands directly.
+    Each service keeps its own LocationRetriever (and therefore its own pooled session and page validators); the blocking
+    requests calls run in worker threads, at most max_concurrency at a time, so a cycle takes about as long as the slowest service.
+    """
+    def __init__(self, service_ids, max_concurrency=4, mode="soup", metrics=DISABLED, capture=None):
+        """
+        :param service_ids:
+            AppointmentWizard ids to watch.
+        :param max_concurrency:
+            Maximum number of services fetched and parsed at the same time.
+        :param mode:
+            Extraction mode passed to LocationRetriever.fetch_locations ("soup", "fast" or "stream").
+        :param metrics:
+            Metrics registry shared by every service's retriever.
+        :param capture:
+            Optional pageCapture.CaptureWriter shared by every service's retriever.
+        """
+        if max_concurrency <= 0:
+            raise ValueError("max_concurrency must be greater than 0.")
+        self.metrics = metrics
+        self.retrievers = {service_id: LocationRetriever(url=LocationRetriever.wizard_url(service_id), metrics=metrics,
+                                                              capture=capture)
+                           for service_id in service_ids}
+        self.max_concurrency = max_concurrency
+        self.mode = mode
+        self.locations = {}
+        self.errors = {}  # service id -> exception raised during the last fetch
+        self.fetched_at = None
+        self.loop = None
+
+    async def fetch_service(self, service_id, semaphore):
+        async with semaphore:
+            return await asyncio.to_thread(self.retrievers[service_id].fetch_locations, self.mode)
+
+    async def fetch_all(self):
+        """
+        Fetches and parses every service concurrently. A failing service doesn't affect the others: it's recorded in errors and keeps its previous locations.
+        :return:
+            dict of service id -> True/False (whether the locations changed) for the services that succeeded
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        service_ids = list(self.retrievers)
+        results = await asyncio.gather(*(self.fetch_service(service_id, semaphore) for service_id in service_ids),
+                                       return_exceptions=True)
+        changed = {}
+        self.errors = {}
+        for service_id, result in zip(service_ids, results):
+            if isinstance(result, Exception):
+                print(f"Error fetching service {service_id}: {result}")
+                self.errors[service_id] = result
+            else:
+                changed[service_id] = result
+        self.locations = {service_id: retriever.locations for service_id, retriever in self.retrievers.items()}
+        self.fetched_at = max((retriever.fetched_at for retriever in self.retrievers.values() if retriever.fetched_at),
+                              default=None)
+        return changed
+
+    @property
+    def last_status(self):
+        """Worst HTTP status among the services that failed in the last cycle (None if none failed with a status)."""
+        statuses = [self.retrievers[service_id].last_status for service_id in self.errors]
+        return max((status for status in statuses if status is not None), default=None)
+
+    @property
+    def retry_after(self):
+        """Longest Retry-After requested by any service in the last cycle."""
+        return max((retriever.retry_after for retriever in self.retrievers.values() if retriever.retry_after is not None),
+                   default=None)
+
+    def fetch_locations(self):
+        """
+        Synchronous entry point with the same shape as LocationRetriever.fetch_locations. The event loop is kept between calls so its worker threads are reused.
+        :return:
+            True if any service's locations changed
+        """
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        changed = self.loop.run_until_complete(self.fetch_all())
+        if len(self.errors) == len(self.retrievers):
+            if all(isinstance(error, CircuitOpenError) for error in self.errors.values()):
+                retry_in = min(error.retry_after for error in self.errors.values())
+                raise CircuitOpenError(f"Every service's circuit is open, next attempt in {retry_in:.0f} seconds.",
+                                       retry_after=retry_in)
+            raise FetchError("Couldn't fetch any service.", status=self.last_status, retry_after=self.retry_after)
+        return any(changed.values())
+
+    def staleness(self, now=None):
+        """Seconds since the oldest service was last fetched successfully (None if one never was)."""
+        ages = [retriever.staleness(now) for retriever in self.retrievers.values()]
+        return None if None in ages else max(ages, default=None)
+
+    def close(self):
+        if self.loop is not None:
+            self.loop.close()
+            self.loop = None
+        for retriever in self.retrievers.values():
+            retriever.session.close()
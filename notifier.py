@@ -0,0 +1,234 @@
+import json
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import NamedTuple
+
+import requests
+
+from metrics import DISABLED
+from snapshotDiff import EARLIER, GONE, NEW
+
+DESKTOP_MESSAGE_LIMIT = 256  # longest message some desktop backends (e.g. Windows balloons) accept
+STOP = object()
+
+
+class Alert(NamedTuple):
+    title: str
+    location: object
+    service: object = None  # AppointmentWizard id for multi-service searches
+
+
+def event_alert(event):
+    """
+    Turns a SnapshotDiffer event into an Alert.
+    :return:
+        Alert for new locations, earlier dates and more slots, None for GONE events
+    """
+    location = event.location
+    if event.kind == GONE:
+        return None
+    if event.kind == NEW:
+        title = f"🎉 Appointment Found at {location.name}!"
+    elif event.kind == EARLIER:
+        title = f"⏩ Earlier Appointment at {location.name}!"
+    else:
+        title = f"➕ More Appointments at {location.name}!"
+    service = event.key[0] if isinstance(event.key, tuple) else None
+    return Alert(title, location, service)
+
+
+class Digest:
+    """
+    Every alert of one poll cycle (or of several, when a channel was rate limited) folded into a single notification.
+    """
+    def __init__(self, alerts):
+        self.alerts = list(alerts)
+        self.created_at = datetime.now()
+
+    def merge(self, other):
+        self.alerts.extend(other.alerts)
+        return self
+
+    @property
+    def title(self):
+        if len(self.alerts) == 1:
+            return self.alerts[0].title
+        return f"🎉 {len(self.alerts)} appointment updates!"
+
+    @property
+    def message(self):
+        return "\n".join(f"{alert.location.name}: {format_date(alert.location.next_appointment_date)}"
+                         for alert in self.alerts)
+
+    def to_dict(self):
+        return {
+            "title": self.title,
+            "created_at": self.created_at.isoformat(timespec="seconds"),
+            "alerts": [dict(alert.location.to_dict(), title=alert.title, service=alert.service) for alert in self.alerts],
+        }
+
+
+def format_date(date):
+    return date.strftime('%m/%d/%Y %I:%M %p') if isinstance(date, datetime) else str(date)
+
+
+class DesktopSink:
+    """Desktop notification through plyer."""
+    name = "desktop"
+
+    def send(self, digest):
+        from plyer import notification
+        message = digest.message
+        if len(message) > DESKTOP_MESSAGE_LIMIT:
+            message = message[:DESKTOP_MESSAGE_LIMIT - 1] + "…"
+        notification.notify(title=digest.title, message=message, timeout=10)
+
+
+class StdoutSink:
+    """One JSON object per digest on standard output (or any other stream)."""
+    name = "stdout"
+
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def send(self, digest):
+        stream = self.stream or sys.stdout
+        stream.write(json.dumps(digest.to_dict(), ensure_ascii=False) + "\n")
+        stream.flush()
+
+
+class FileSink:
+    """Appends one JSON line per digest to a file."""
+    def __init__(self, path):
+        self.path = path
+        self.name = f"file:{path}"
+
+    def send(self, digest):
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(digest.to_dict(), ensure_ascii=False) + "\n")
+
+
+class WebhookSink:
+    """POSTs each digest as JSON to an HTTP endpoint (e.g. a local automation server)."""
+    def __init__(self, url, timeout=5, session=None):
+        self.url = url
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.name = f"webhook:{url}"
+
+    def send(self, digest):
+        self.session.post(self.url, json=digest.to_dict(), timeout=self.timeout).raise_for_status()
+
+
+def create_sink(spec):
+    """
+    Builds a sink from its command line form: "desktop", "stdout", "file:PATH" or "webhook:URL".
+    """
+    kind, _, target = spec.partition(":")
+    if kind == "desktop" and not target:
+        return DesktopSink()
+    if kind == "stdout" and not target:
+        return StdoutSink()
+    if kind == "file" and target:
+        return FileSink(target)
+    if kind == "webhook" and target:
+        return WebhookSink(target)
+    raise ValueError(f"Unknown notification sink: {spec}")
+
+
+class NotificationDispatcher:
+    """
+    Delivers alerts from a background worker so a slow or broken sink never delays the poll loop.
+
+    submit() queues the alerts of one cycle without blocking; the worker folds them into one Digest and hands it to every sink.
+    Each sink is rate limited to one notification per min_interval seconds: digests arriving sooner are merged and sent when the sink is allowed again.
+    """
+    def __init__(self, sinks, min_interval=0, max_queue=100, metrics=DISABLED):
+        """
+        :param sinks:
+            Objects with a name attribute and a send(digest) method.
+        :param min_interval:
+            Seconds between two notifications of the same sink, or a dict of sink name -> seconds.
+        :param max_queue:
+            Cycles that may wait for the worker; alerts submitted while the queue is full are dropped (and counted).
+        """
+        self.sinks = list(sinks)
+        self.min_interval = min_interval
+        self.metrics = metrics
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.pending = {}  # sink name -> Digest held back by the rate limit
+        self.last_sent = {}  # sink name -> time.monotonic() of its last notification
+        self.dropped = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def interval_for(self, sink):
+        if isinstance(self.min_interval, dict):
+            return self.min_interval.get(sink.name, 0)
+        return self.min_interval
+
+    def submit(self, alerts):
+        """
+        Queues the alerts of one cycle (no-op when empty).
+        :return:
+            False if the queue was full and the alerts were dropped
+        """
+        if not alerts:
+            return True
+        try:
+            self.queue.put_nowait(Digest(alerts))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            self.metrics.increment("notifications_dropped")
+            return False
+
+    def close(self, timeout=10):
+        """Sends everything still queued or held back (ignoring rate limits) and stops the worker."""
+        if self.thread.is_alive():
+            self.queue.put(STOP)
+            self.thread.join(timeout)
+
+    def run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=self.next_wakeup())
+            except queue.Empty:
+                item = None
+            if item is STOP:
+                break
+            if item is not None:
+                for sink in self.sinks:
+                    pending = self.pending.get(sink.name)
+                    self.pending[sink.name] = pending.merge(Digest(item.alerts)) if pending else Digest(item.alerts)
+            self.deliver()
+        self.deliver(force=True)
+
+    def next_wakeup(self):
+        """Seconds until the earliest held-back digest may be sent (None to wait for the next cycle)."""
+        if not self.pending:
+            return None
+        now = time.monotonic()
+        waits = [self.last_sent.get(sink.name, float("-inf")) + self.interval_for(sink) - now
+                 for sink in self.sinks if sink.name in self.pending]
+        return max(0.0, min(waits))
+
+    def deliver(self, force=False):
+        now = time.monotonic()
+        for sink in self.sinks:
+            digest = self.pending.get(sink.name)
+            if digest is None:
+                continue
+            if not force and now - self.last_sent.get(sink.name, float("-inf")) < self.interval_for(sink):
+                continue
+            del self.pending[sink.name]
+            self.last_sent[sink.name] = now
+            try:
+                sink.send(digest)
+                self.metrics.increment("notifications_sent")
+            except Exception as e:
+                print(f"Error sending {sink.name} notification: {e}")
+                self.metrics.increment("notification_errors")
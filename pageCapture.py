@@ -0,0 +1,190 @@
+import gzip
+import json
+import threading
+import time
+from datetime import datetime
+from typing import NamedTuple
+
+from circuitBreaker import CircuitBreaker
+from errors import ExtractError
+from locationRetriever import APPOINTMENT_WIZARD_URL, Filter, LocationRetriever, NOT_MODIFIED, STREAM_CHUNK_SIZE
+from scriptExtractor import ScriptDataExtractor
+from snapshotDiff import SnapshotDiffer
+from slotParser import portal_now
+from notifier import NotificationDispatcher, event_alert
+
+
+class CaptureRecord(NamedTuple):
+    timestamp: float  # time.time() when the page was received
+    url: str
+    status: int
+    page: object  # page html, or None for a 304 answer
+
+
+class CaptureWriter:
+    """
+    Appends every page a retriever receives to a gzip-compressed JSON lines file, so polls can be replayed offline later.
+    The stream is flushed after each record, so a capture cut short by a crash stays readable up to its last page.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = gzip.open(path, "at", encoding="utf-8")
+        self.lock = threading.Lock()  # services of a MultiServiceRetriever record from several threads
+        self.records = 0
+
+    def write(self, url, status, page, timestamp=None):
+        line = json.dumps({"t": timestamp if timestamp is not None else time.time(), "url": url, "status": status,
+                           "page": page})
+        with self.lock:
+            self.file.write(line + "\n")
+            self.file.flush()
+            self.records += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def read_capture(path):
+    """
+    Iterates over the records of a capture file in the order they were written.
+    :return:
+        generator of CaptureRecord
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        try:
+            for line in file:
+                if not line.endswith("\n"):
+                    break  # last record was cut short
+                data = json.loads(line)
+                yield CaptureRecord(data["t"], data["url"], data["status"], data["page"])
+        except (EOFError, gzip.BadGzipFile):
+            pass  # capture of a process that didn't close it: everything flushed so far was read
+
+
+class ReplayRetriever(LocationRetriever):
+    """LocationRetriever serving a recorded page instead of requesting the portal."""
+    def __init__(self, page=None, url=APPOINTMENT_WIZARD_URL, **kwargs):
+        kwargs.setdefault("breaker", CircuitBreaker(failure_threshold=float("inf")))  # recorded failures never stop a replay
+        super().__init__(url=url, **kwargs)
+        self.page = page
+
+    def get_page(self, url, conditional=True):
+        return self.page
+
+    def stream_script_data(self, url, chunk_size=STREAM_CHUNK_SIZE):
+        """Feeds the recorded page to a ScriptDataExtractor chunk by chunk, like a streamed response, without any request."""
+        page = self.page
+        if page is None or page is NOT_MODIFIED:
+            return page
+        extractor = ScriptDataExtractor()
+        try:
+            for start in range(0, len(page), chunk_size):
+                if extractor.feed(page[start:start + chunk_size]):
+                    break
+        except ValueError as e:  # a variable larger than the extractor's max_payload
+            raise ExtractError(str(e), url) from e
+        return extractor.get("locationData"), extractor.get("timeData")
+
+
+def service_id(url):
+    """AppointmentWizard id at the end of a wizard url (the url itself if it doesn't end with one)."""
+    last = url.rstrip("/").rsplit("/", 1)[-1]
+    return int(last) if last.isdigit() else url
+
+
+class Snapshot(NamedTuple):
+    record: CaptureRecord
+    changed: bool  # whether the record's page changed its service's locations
+    locations: dict  # service id -> list of locations, for every service replayed so far
+
+
+class CaptureReplayer:
+    """
+    Feeds recorded pages through the normal fetch -> parse pipeline, one page per fetch.
+    """
+    def __init__(self, path, speed=None, mode="fast", sleep=time.sleep):
+        """
+        :param speed:
+            None to replay as fast as possible, 1 for the recorded pacing, 2 for twice as fast, etc.
+        :param mode:
+            Extraction mode passed to fetch_locations ("soup", "fast" or "stream").
+        """
+        self.path = path
+        self.speed = speed
+        self.mode = mode
+        self.sleep = sleep
+        self.retrievers = {}  # url -> ReplayRetriever
+        self.errors = 0
+
+    def snapshots(self):
+        """
+        :return:
+            generator of Snapshot, one per record (records whose page fails to parse are counted in errors and skipped)
+        """
+        previous = None
+        for record in read_capture(self.path):
+            if self.speed and previous is not None:
+                self.sleep(max(0.0, (record.timestamp - previous) / self.speed))
+            previous = record.timestamp
+
+            retriever = self.retrievers.get(record.url)
+            if retriever is None:
+                retriever = self.retrievers[record.url] = ReplayRetriever(url=record.url)
+            retriever.page = NOT_MODIFIED if record.status == 304 else record.page
+            try:
+                changed = retriever.fetch_locations(self.mode)
+            except ValueError as e:
+                print(f"Skipping recorded page from {record.url}: {e}")
+                self.errors += 1
+                continue
+            yield Snapshot(record, changed, {service_id(url): replay.locations for url, replay in self.retrievers.items()})
+
+
+class SnapshotSource:
+    """Minimal retriever stand-in handing the replayed snapshots to Filter."""
+    def __init__(self):
+        self.locations = {}
+        self.fetched_at = None
+
+    def fetch_locations(self):
+        return False  # snapshots are pushed in by replay_capture
+
+
+def replay_capture(path, days, speed=None, mode="fast", sinks=()):
+    """
+    Replays a capture through Filter and the change detection/notification path, with "now" set to each record's time.
+    :param sinks:
+        Notification sinks receiving the alerts (none by default, alerts are only counted).
+    :return:
+        dict with the number of snapshots, parse errors, change events and alerts, the elapsed seconds and snapshots per second
+    """
+    replayer = CaptureReplayer(path, speed=speed, mode=mode)
+    source = SnapshotSource()
+    filter_instance = Filter(days, source, clock=lambda: portal_now(source.fetched_at))
+    differ = SnapshotDiffer()
+    dispatcher = NotificationDispatcher(sinks) if sinks else None
+    snapshots = events = alerts = 0
+    start = time.perf_counter()
+    for snapshot in replayer.snapshots():
+        source.locations = snapshot.locations
+        source.fetched_at = datetime.fromtimestamp(snapshot.record.timestamp)
+        results = filter_instance.filter()
+        changes = differ.update(results)
+        snapshot_alerts = [alert for alert in map(event_alert, changes) if alert is not None]
+        if dispatcher is not None:
+            dispatcher.submit(snapshot_alerts)
+        snapshots += 1
+        events += len(changes)
+        alerts += len(snapshot_alerts)
+    if dispatcher is not None:
+        dispatcher.close()
+    elapsed = time.perf_counter() - start
+    return {
+        "snapshots": snapshots,
+        "errors": replayer.errors,
+        "events": events,
+        "alerts": alerts,
+        "seconds": elapsed,
+        "snapshots_per_second": snapshots / elapsed if elapsed else 0.0,
+    }
@@ -0,0 +1,187 @@
+from datetime import datetime, timedelta
+
+from historyStore import CLOSED, MORE, OPENED, read_changes
+from snapshotDiff import SnapshotDiffer
+
+
+class BucketStats:
+    """Release statistics of one (location, weekday, hour) bucket."""
+    __slots__ = ("releases", "days", "last_day", "duration_total", "durations")
+
+    def __init__(self):
+        self.releases = 0  # slot releases seen in this bucket
+        self.days = 0  # distinct days with at least one release
+        self.last_day = None
+        self.duration_total = 0.0  # seconds released slots stayed available before being taken
+        self.durations = 0
+
+
+class ReleaseAnalytics:
+    """
+    Learns when slots are released, per location and per weekday/hour, and how long they last before being taken.
+    Statistics are updated incrementally from each snapshot (or each history row), so nothing is ever rescanned.
+
+    Every release is counted in its (weekday, hour) and in a daily (None, hour) bucket, both per location and for all locations.
+    An hour is a predicted release window when either bucket saw releases on at least min_rate of the days that hour was polled,
+    so daily patterns are picked up after a few days and weekday-specific ones after a few weeks.
+    """
+    def __init__(self, min_days=7, min_rate=0.25, min_releases=2):
+        """
+        :param min_days:
+            Days of observations needed before predictions are trusted (see ready).
+        :param min_rate:
+            Fraction of polled days with a release for an hour to count as a release window.
+        :param min_releases:
+            Minimum number of releases seen in an hour for it to count as a release window.
+        """
+        self.min_days = min_days
+        self.min_rate = min_rate
+        self.min_releases = min_releases
+        self.snapshot = None  # location key -> appointments in the last snapshot
+        self.opened_at = {}  # location key -> datetime its current slots were released
+        self.buckets = {}  # (location key or None for all locations, weekday or None for every day, hour) -> BucketStats
+        self.samples = {}  # (weekday or None, hour) -> number of days polled during that hour
+        self.last_sample = None  # (date, hour) of the last poll
+        self.days_observed = 0
+
+    @property
+    def ready(self):
+        return self.days_observed >= self.min_days
+
+    def sample(self, now):
+        """Counts the poll at now towards the (weekday, hour) it falls in, once per day and hour."""
+        sample = (now.date(), now.hour)
+        if sample == self.last_sample:
+            return
+        if self.last_sample is None or sample[0] != self.last_sample[0]:
+            self.days_observed += 1
+        self.last_sample = sample
+        for bucket in ((now.weekday(), now.hour), (None, now.hour)):
+            self.samples[bucket] = self.samples.get(bucket, 0) + 1
+
+    @staticmethod
+    def bucket_keys(key, moment):
+        weekday, hour = moment.weekday(), moment.hour
+        return (key, weekday, hour), (key, None, hour), (None, weekday, hour), (None, None, hour)
+
+    def update(self, locations, now=None):
+        """
+        Adds one snapshot.
+        :param locations:
+            list of locations, or dict of service id -> list (multi-service retrievers)
+        """
+        now = now or datetime.now()
+        self.sample(now)
+        current = {key: location.appointments or 0 for key, location in SnapshotDiffer.key_locations(locations).items()}
+        previous = self.snapshot
+        if previous is not None:  # the first snapshot only tells what is open, not when it was released
+            for key, appointments in current.items():
+                old = previous.get(key)
+                if old is None or appointments > old:
+                    self.record_release(key, now)
+            for key in previous:
+                if key not in current:
+                    self.record_taken(key, now)
+        self.snapshot = current
+
+    def record_release(self, key, now):
+        self.opened_at.setdefault(key, now)
+        day = now.date()
+        for bucket_key in self.bucket_keys(key, now):
+            stats = self.buckets.get(bucket_key)
+            if stats is None:
+                stats = self.buckets[bucket_key] = BucketStats()
+            stats.releases += 1
+            if stats.last_day != day:
+                stats.last_day = day
+                stats.days += 1
+
+    def record_taken(self, key, now):
+        opened = self.opened_at.pop(key, None)
+        if opened is None:
+            return
+        seconds = (now - opened).total_seconds()
+        for bucket_key in self.bucket_keys(key, opened):
+            stats = self.buckets.get(bucket_key)
+            if stats is not None:
+                stats.duration_total += seconds
+                stats.durations += 1
+
+    def release_rate(self, weekday, hour, key=None):
+        """
+        :param weekday:
+            0 (Monday) to 6, or None for the hour on any day.
+        :return:
+            fraction of the polled days on which slots were released during that weekday/hour (0.0 when never polled)
+        """
+        stats = self.buckets.get((key, weekday, hour))
+        samples = self.samples.get((weekday, hour))
+        if stats is None or not samples:
+            return 0.0
+        return min(1.0, stats.days / samples)
+
+    def mean_duration(self, weekday, hour, key=None):
+        """
+        :return:
+            average seconds slots released during that weekday/hour stayed available, or None if none was taken yet
+        """
+        stats = self.buckets.get((key, weekday, hour))
+        if stats is None or not stats.durations:
+            return None
+        return stats.duration_total / stats.durations
+
+    def is_window(self, weekday, hour, key=None):
+        """Whether that exact bucket ((None, hour) for the daily one) qualifies as a release window."""
+        stats = self.buckets.get((key, weekday, hour))
+        return (stats is not None and stats.releases >= self.min_releases
+                and self.release_rate(weekday, hour, key) >= self.min_rate)
+
+    def is_predicted(self, weekday, hour, key=None):
+        """Whether slots are expected during hour on weekday, from its weekday bucket or its daily one."""
+        return self.is_window(weekday, hour, key) or self.is_window(None, hour, key)
+
+    def predicted_windows(self, key=None):
+        """
+        :return:
+            list of (weekday (0 = Monday, None for every day), hour) release windows for one location key (None for all locations), daily ones first
+        """
+        return sorted(((weekday, hour) for bucket_key, weekday, hour in self.buckets
+                       if bucket_key == key and self.is_window(weekday, hour, key)),
+                      key=lambda window: (-1 if window[0] is None else window[0], window[1]))
+
+    def is_release_window(self, now=None, margin=timedelta(minutes=5)):
+        """Whether now is inside, or within margin of, a predicted release window."""
+        now = now or datetime.now()
+        return any(self.is_predicted(moment.weekday(), moment.hour) for moment in (now - margin, now, now + margin))
+
+    @classmethod
+    def from_history(cls, path, **kwargs):
+        """
+        Builds the statistics from a HistoryStore database in a single pass over its rows.
+        Only changes are stored there, so the poller is assumed to have been running continuously between the first and last row.
+        """
+        analytics = cls(**kwargs)
+        first = last = None
+        state = {}
+        for observed_at, service, location_id, name, appointments, change in read_changes(path):
+            key = location_id if location_id is not None else name
+            if service is not None:
+                key = (service, key)
+            if first is None:
+                first = observed_at
+            last = observed_at
+            if change == CLOSED:
+                state.pop(key, None)
+                analytics.record_taken(key, observed_at)
+                continue
+            if observed_at != first and (change == OPENED or change == MORE):
+                analytics.record_release(key, observed_at)
+            state[key] = appointments or 0
+
+        if first is not None:
+            moment = first.replace(minute=0, second=0, microsecond=0)
+            while moment <= last:
+                analytics.sample(moment)
+                moment += timedelta(hours=1)
+            analytics.snapshot = state
+        return analytics
@@ -0,0 +1,177 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+
+from slotParser import portal_now
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def parse_retry_after(value):
+    """
+    Parses a Retry-After header, given either as seconds or as an HTTP date.
+    :return:
+        seconds to wait (float) or None if missing/invalid
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+class PollScheduler:
+    """
+    Decides how long to wait before the next poll instead of sleeping a fixed interval:
+
+    - failures (network errors, 429/5xx) back off exponentially with jitter, never sooner than Retry-After;
+    - quiet periods relax the interval gradually up to max_interval;
+    - burst mode polls at burst_interval for a few cycles after slots were seen or changed, and around known release times;
+    - with release analytics, polls stay at max_interval except around the predicted release windows (where they run at interval).
+
+    Delays are counted on a monotonic clock from the start of each poll (start_poll/next_wait), so the time spent fetching
+    doesn't stretch the interval and wall-clock changes don't affect it.
+    """
+    def __init__(self, interval, min_interval=None, max_interval=None, burst_interval=None, backoff_factor=2.0,
+                 relax_factor=1.25, relax_after=3, burst_cycles=6, burst_times=(), burst_window=5, jitter=0.1, rng=None,
+                 analytics=None, clock=time.monotonic):
+        """
+        :param interval:
+            Normal time in seconds between polls.
+        :param max_interval:
+            Longest wait when relaxing or backing off (default: 10x interval).
+        :param burst_interval:
+            Time between polls in burst mode (default: interval / 4, at least min_interval).
+        :param relax_after:
+            Number of consecutive unchanged polls before the interval starts growing by relax_factor.
+        :param burst_cycles:
+            Number of polls kept in burst mode after slots were seen or changed.
+        :param burst_times:
+            Times of day ("HH:MM" strings or datetime.time) around which slots are known to be released.
+        :param burst_window:
+            Minutes before and after each burst time during which burst mode is on.
+        :param jitter:
+            Fraction of the delay randomized to avoid synchronized polling.
+        :param analytics:
+            ReleaseAnalytics fed by the poll loop. Once it's ready, polls run at interval around its predicted release windows and at max_interval otherwise.
+        :param clock:
+            Monotonic clock the poll deadlines are measured on.
+        """
+        self.interval = interval
+        self.min_interval = min_interval if min_interval is not None else min(1.0, interval)
+        self.max_interval = max_interval if max_interval is not None else interval * 10
+        self.burst_interval = max(self.min_interval, burst_interval if burst_interval is not None else interval / 4)
+        self.backoff_factor = backoff_factor
+        self.relax_factor = relax_factor
+        self.relax_after = relax_after
+        self.burst_cycles = burst_cycles
+        self.burst_times = [self.parse_time(value) for value in burst_times]
+        self.burst_window = timedelta(minutes=burst_window)
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+        self.analytics = analytics
+        self.failures = 0
+        self.unchanged = 0
+        self.burst_remaining = 0
+        self.retry_after = None
+        self.clock = clock
+        self.started = None  # clock() at the start of the current poll
+        self.deadline = None  # clock() at which the next poll is due
+
+    @staticmethod
+    def parse_time(value):
+        if isinstance(value, str):
+            return datetime.strptime(value, "%H:%M").time()
+        return value
+
+    def record_success(self, changed=False, found=False):
+        """
+        Registers a successful poll.
+        :param changed: Whether the snapshot changed since the previous poll.
+        :param found: Whether matching appointments were seen.
+        """
+        self.failures = 0
+        self.retry_after = None
+        if changed or found:
+            self.burst_remaining = self.burst_cycles
+        if changed:
+            self.unchanged = 0
+        else:
+            self.unchanged += 1
+
+    def record_failure(self, status=None, retry_after=None):
+        """
+        Registers a failed poll.
+        :param status: HTTP status of the failed response, if any.
+        :param retry_after: Seconds requested by the server's Retry-After header, if any.
+        """
+        self.failures += 1
+        self.burst_remaining = 0
+        self.retry_after = retry_after
+        if status is not None and status not in RETRY_STATUSES and status >= 400:
+            self.failures = max(self.failures, 3)  # client errors won't fix themselves soon
+
+    def predictive(self):
+        return self.analytics is not None and self.analytics.ready
+
+    def start_poll(self):
+        """
+        Marks the start of a poll; the next delay is counted from here. A poll started (slightly late) for its deadline
+        is anchored on the deadline itself, so the sleep's own overshoot doesn't add up from poll to poll.
+        :return:
+            the start time on the scheduler's clock
+        """
+        now = self.clock()
+        on_time = self.deadline is not None and 0 <= now - self.deadline < self.min_interval
+        self.started = self.deadline if on_time else now
+        return self.started
+
+    def next_wait(self, now=None):
+        """
+        Returns the number of seconds left to sleep until the next poll is due: next_delay() counted from the start of
+        the current poll, minus the time it took (0 if it took longer than the delay).
+        """
+        delay = self.next_delay(now)
+        current = self.clock()
+        self.deadline = (self.started if self.started is not None else current) + delay
+        return max(0.0, self.deadline - current)
+
+    def in_release_window(self, now=None):
+        """Whether now (default: the current time in the portal's zone) is within burst_window of a burst time."""
+        now = now or portal_now()
+        for release in self.burst_times:
+            release_at = datetime.combine(now.date(), release)
+            for day in (-1, 0, 1):  # windows crossing midnight
+                if abs(now - (release_at + timedelta(days=day))) <= self.burst_window:
+                    return True
+        return False
+
+    def next_delay(self, now=None):
+        """
+        Returns the number of seconds to wait before the next poll.
+        """
+        if self.failures:
+            delay = min(self.max_interval, self.interval * self.backoff_factor ** self.failures)
+            delay = self.rng.uniform(delay / 2, delay)  # jittered backoff
+            if self.retry_after is not None:
+                delay = max(delay, self.retry_after)
+            return delay
+
+        if self.burst_remaining > 0 or self.in_release_window(now):
+            self.burst_remaining = max(0, self.burst_remaining - 1)
+            delay = self.burst_interval
+        elif self.predictive():
+            # the base interval inside predicted release windows, the longest one everywhere else
+            delay = self.interval if self.analytics.is_release_window(now, self.burst_window) else self.max_interval
+        else:
+            delay = self.interval * self.relax_factor ** max(0, self.unchanged - self.relax_after)
+        delay = min(self.max_interval, max(self.min_interval, delay))
+        return delay * self.rng.uniform(1 - self.jitter, 1 + self.jitter)
@@ -0,0 +1,127 @@
+import re
+
+# Matches the start of an inline array assignment such as `var locationData = [`
+VAR_PATTERN = re.compile(r'var\s+(\w+)\s*=\s*\[')
+# Next character that matters for bracket matching outside / inside a JSON string
+STRUCTURE_PATTERN = re.compile(r'[\[\]"]')
+STRING_PATTERN = re.compile(r'["\\]')
+
+# Longest tail kept between chunks while no variable is being captured, enough to hold a split `var ... = [`
+SCAN_TAIL = 128
+# Upper bound for a single captured payload (in characters)
+MAX_PAYLOAD = 8 * 1024 * 1024
+
+
+class ScriptDataExtractor:
+    """
+    Incremental scanner that pulls inline `var <name> = [...]` array literals straight out of the raw AppointmentWizard html, without building a soup.
+    Text can be fed all at once or chunk by chunk (e.g. from a streamed response); scanning stops as soon as every requested variable has been captured.
+    """
+    def __init__(self, names=("locationData", "timeData"), max_payload=MAX_PAYLOAD):
+        """
+        :param names:
+            Names of the javascript variables to capture.
+        :param max_payload:
+            Maximum number of characters a single captured array may take before giving up.
+        """
+        self.names = tuple(names)
+        self.max_payload = max_payload
+        self.results = {}
+        self._buffer = ""
+        self._capturing = None  # name of the variable currently being captured
+        self._pos = 0  # scan position inside the buffer while capturing
+        self._depth = 0
+        self._in_string = False
+
+    @property
+    def done(self):
+        return len(self.results) == len(self.names)
+
+    def feed(self, chunk: str):
+        """
+        Scans a new piece of the page.
+        :return:
+            True once every variable has been found (further chunks are then ignored), False otherwise.
+        """
+        if self.done:
+            return True
+        self._buffer += chunk
+        while not self.done:
+            if self._capturing is None:
+                if not self._find_start():
+                    return False
+            elif not self._find_end():
+                return False
+        self._buffer = ""
+        return True
+
+    def get(self, name):
+        """Returns the captured array literal for name or None if it wasn't found."""
+        return self.results.get(name)
+
+    def _find_start(self):
+        """Looks for the next wanted assignment in the buffer, dropping everything before it."""
+        for match in VAR_PATTERN.finditer(self._buffer):
+            name = match.group(1)
+            if name in self.names and name not in self.results:
+                self._capturing = name
+                self._buffer = self._buffer[match.end() - 1:]  # keep the opening bracket
+                self._pos = 0
+                self._depth = 0
+                self._in_string = False
+                return True
+        self._buffer = self._buffer[-SCAN_TAIL:]
+        return False
+
+    def _find_end(self):
+        """Bracket-matches the array being captured, skipping over brackets inside JSON strings."""
+        buffer = self._buffer
+        pos = self._pos
+        while True:
+            if self._in_string:
+                match = STRING_PATTERN.search(buffer, pos)
+                if not match:
+                    break
+                if match.group() == "\\":
+                    if match.end() >= len(buffer):
+                        pos = match.start()  # escape sequence split between chunks
+                        break
+                    pos = match.end() + 1
+                    continue
+                self._in_string = False
+                pos = match.end()
+                continue
+
+            match = STRUCTURE_PATTERN.search(buffer, pos)
+            if not match:
+                pos = len(buffer)
+                break
+            char = match.group()
+            pos = match.end()
+            if char == '"':
+                self._in_string = True
+            elif char == "[":
+                self._depth += 1
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.results[self._capturing] = buffer[:pos]
+                    self._capturing = None
+                    self._buffer = buffer[pos:]
+                    return True
+
+        self._pos = pos
+        if len(buffer) > self.max_payload:
+            raise ValueError(f"{self._capturing} exceeds {self.max_payload} characters.")
+        return False
+
+
+def extract_script_data(page: str, names=("locationData", "timeData")):
+    """
+    One-shot helper around ScriptDataExtractor for an already downloaded page.
+    :return:
+        tuple with the captured array literal (or None) for every name, in the given order
+    """
+    extractor = ScriptDataExtractor(names)
+    extractor.feed(page)
+    return tuple(extractor.get(name) for name in names)
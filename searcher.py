@@ -1,41 +1,160 @@
 import time
-from locationRetriever import Filter
-from plyer import notification
+from locationRetriever import DEFAULT_SERVICE, Filter, LocationRetriever
+from multiRetriever import MultiServiceRetriever
+from snapshotDiff import SnapshotDiffer, GONE
+from scheduler import PollScheduler
+from metrics import Metrics, DISABLED
+from historyStore import HistoryStore
+from notifier import Alert, DesktopSink, NotificationDispatcher, event_alert
+from pageCapture import CaptureWriter
+from geoIndex import GeoFilter, distance_cache
+from shardedPoller import ShardedPoller
+from errors import RetrieverError
 
 
-def continuous_search(days, check_interval=10):
+def continuous_search(days, check_interval=10, services=None, watch=False, scheduler=None, metrics_path=None,
+                      history_path=None, sinks=None, notify_interval=0, record_path=None, near=None, radius=25,
+                      order="date", workers=None, mode="soup"):
     """
     Continuously search for available appointments and send a desktop notification when found.
 
     :param days: The day range for filtering appointments.
-    :param check_interval: Time in seconds to wait between each check.
+    :param check_interval: Base time in seconds to wait between each check.
+    :param services: Optional list of AppointmentWizard ids to watch concurrently (defaults to the single default service).
+    :param watch: When True, keeps running after appointments are found and only notifies about changes (new locations, earlier dates, more slots).
+    :param scheduler: PollScheduler deciding the wait between checks (defaults to one built around check_interval).
+    :param metrics_path: When given, per-stage timings and counters are appended to this file as one JSON line per check.
+    :param history_path: When given, every snapshot's changes are recorded in this SQLite database (see HistoryStore).
+    :param sinks: Notification sinks (see notifier.create_sink), desktop notifications by default.
+    :param notify_interval: Minimum seconds between two notifications of the same sink; alerts in between are merged into one digest.
+    :param record_path: When given, every page received is appended to this compressed capture file (see pageCapture; not with workers).
+    :param near: Zip code or "latitude,longitude" to search around; only locations within radius miles are reported (see GeoFilter).
+    :param radius: Maximum distance in miles from near.
+    :param order: How results near an origin are sorted: "date", "distance" or "score" (date pushed back by distance).
+    :param mode: Extraction mode of every fetch: "soup", "fast" or "stream" (see LocationRetriever.fetch_locations).
+    :param workers: When given, the services are fetched and parsed by this many worker processes (see ShardedPoller) and every check reads their shared-memory snapshots.
     """
     print(f"Starting continuous search for appointments within the next {days} days...")
 
+    # one retriever for the whole search so its sessions and validators are reused
+    if workers and record_path:
+        raise ValueError("Pages can't be recorded with workers: they are fetched in other processes.")
+    metrics = Metrics() if metrics_path else DISABLED
+    capture = CaptureWriter(record_path) if record_path else None
+    scheduler = scheduler or PollScheduler(check_interval)
+    if workers:
+        # the workers poll the portal, so they get the scheduler's settings; this loop only reads their snapshots
+        retriever = ShardedPoller(services or [DEFAULT_SERVICE], workers=workers, mode=mode, metrics=metrics,
+                                  scheduler=scheduler).start()
+    elif services:
+        retriever = MultiServiceRetriever(services, mode=mode, metrics=metrics, capture=capture)
+    else:
+        retriever = LocationRetriever(metrics=metrics, capture=capture, mode=mode)
+    differ = SnapshotDiffer() if watch else None
+    history = HistoryStore(history_path, metrics=metrics) if history_path else None
+    dispatcher = NotificationDispatcher(sinks or [DesktopSink()], min_interval=notify_interval, metrics=metrics)
+    if near is not None:
+        distances = distance_cache(near)  # an unknown zip code fails here, before polling starts
+        make_filter = lambda: GeoFilter(days, retriever, radius=radius, order=order, distances=distances)
+    else:
+        make_filter = lambda: Filter(days, retriever)
+    try:
+        poll_loop(days, retriever, differ, scheduler, metrics, metrics_path, history, dispatcher, make_filter)
+    finally:
+        dispatcher.close()
+        if workers:
+            retriever.close()
+        if history is not None:
+            history.close()
+        if capture is not None:
+            capture.close()
+
+
+def poll_loop(days, retriever, differ, scheduler, metrics, metrics_path, history, dispatcher, make_filter=None):
+    """
+    Body of continuous_search: fetch, filter and notify until appointments are found (or forever in watch mode).
+    :param make_filter: Function building the Filter applied to every snapshot (a plain day-range Filter by default).
+        It's called once, after the first successful fetch, so the filter keeps its per-snapshot indexes across polls.
+    """
+    make_filter = make_filter or (lambda: Filter(days, retriever))
+    filter_instance = None
     while True:
+        scheduler.start_poll()
         try:
-            filter_instance = Filter(days)
-            available_locations = filter_instance.filter()
+            changed = retriever.fetch_locations()
+            if history is not None and changed:
+                history.record(retriever.locations)
+            if scheduler.analytics is not None:
+                scheduler.analytics.update(retriever.locations)
+            if filter_instance is None:
+                filter_instance = make_filter()
+            results = filter_instance.filter()
 
-            if available_locations:
+            available_locations = flatten_results(results)
+
+            if differ:
+                events = differ.update(results)
+                dispatcher.submit(report_events(events))
+                scheduler.record_success(changed=changed, found=any(event.kind != GONE for event in events))
+            elif available_locations:
                 print("\nAppointments found!\n")
-                for location in available_locations:
+                alerts = []
+                for service, location in available_locations:
+                    if service is not None:
+                        print(f"Service {service}:")
                     print(location)
-                    # Send a desktop notification for each location found
-                    notification.notify(
-                        title=f"🎉 Appointment Found at {location.name}!",
-                        message=f"Next available: {location.next_appointment_date.strftime('%m/%d/%Y %I:%M %p')}",
-                        timeout=10
-                    )
+                    alerts.append(Alert(f"🎉 Appointment Found at {location.name}!", location, service))
+                dispatcher.submit(alerts)  # one digest for every location found, sent by the dispatcher's worker
+                if metrics_path:
+                    metrics.write_json_line(metrics_path)
                 break  # Exit the loop after finding appointments
 
             else:
-                print(f"No appointments found. Checking again in {check_interval} seconds...")
+                scheduler.record_success(changed=changed)
+            delay = scheduler.next_wait()
+            if not available_locations:
+                print(f"No appointments found. Checking again in {delay:.0f} seconds...")
+
+        except RetrieverError as e:
+            # circuit open: retry_after is the time left before the breaker lets a probe through, so no wake-up is wasted
+            scheduler.record_failure(status=e.status, retry_after=e.retry_after)
+            delay = scheduler.next_wait()
+            print(f"Fetch failed at the {e.stage} stage: {e} Retrying in {delay:.0f} seconds...")
 
         except Exception as e:
-            print(f"An error occurred: {e}. Retrying in {check_interval} seconds...")
+            scheduler.record_failure(status=retriever.last_status, retry_after=retriever.retry_after)
+            delay = scheduler.next_wait()
+            print(f"An error occurred: {e}. Retrying in {delay:.0f} seconds...")
+
+        if metrics_path:
+            metrics.write_json_line(metrics_path)
+        time.sleep(delay)
 
-        time.sleep(check_interval)
+
+def report_events(events):
+    """
+    Prints every change and returns an Alert for the ones that mean a better appointment is available.
+    :return:
+        list of Alert, ready for NotificationDispatcher.submit
+    """
+    alerts = []
+    for event in events:
+        alert = event_alert(event)
+        if alert is None:
+            print(f"No longer available: {event.location.name}")
+            continue
+        print(f"\n{alert.title}\n{event.location}")
+        alerts.append(alert)
+    return alerts
+
+
+def flatten_results(results):
+    """
+    Turns Filter.filter() output into a list of (service id, location) pairs; service id is None for single-service results.
+    """
+    if isinstance(results, dict):
+        return [(service, location) for service, locations in results.items() for location in locations]
+    return [(None, location) for location in results]
 
 
 if __name__ == "__main__":
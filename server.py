@@ -0,0 +1,298 @@
+import json
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from locationRetriever import DEFAULT_SERVICE, LocationRetriever, TimeIndex
+from multiRetriever import MultiServiceRetriever
+from snapshotCache import SnapshotCache
+from snapshotDiff import SnapshotDiffer
+from slotParser import portal_now
+from scheduler import PollScheduler
+from metrics import Metrics
+from historyStore import HistoryStore
+from pageCapture import CaptureWriter
+from shardedPoller import ShardedPoller
+
+MAX_WAIT = 60  # longest a long-poll request may wait, in seconds
+HEARTBEAT = 15  # seconds between keep-alive comments on event streams
+
+
+class AppointmentService:
+    """
+    Runs the poll loop in a background thread and publishes, after every changed snapshot, a per-service TimeIndex and the diff events.
+    HTTP requests only read the published state, so any number of clients can query without triggering a scrape.
+    """
+    def __init__(self, cache, interval=10, max_events=1000, scheduler=None, history=None):
+        """
+        :param cache:
+            SnapshotCache wrapping the retriever to poll.
+        :param interval:
+            Base seconds between polls.
+        :param max_events:
+            Number of past change events kept for clients catching up.
+        :param scheduler:
+            PollScheduler deciding the wait between polls (defaults to one built around interval).
+        :param history:
+            Optional HistoryStore receiving every published snapshot.
+        """
+        self.cache = cache
+        self.scheduler = scheduler or PollScheduler(interval)
+        self.history = history
+        self.indexes = {}  # service id (None for single-service) -> TimeIndex of the published snapshot
+        self.published = None  # locations object the indexes were built from
+        self.updated_at = None
+        self.last_error = None  # error of the last poll; the published snapshot is then the last good one
+        self.differ = SnapshotDiffer()
+        self.events = deque(maxlen=max_events)  # (event id, SlotEvent)
+        self.last_event_id = 0
+        self.condition = threading.Condition()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        with self.condition:
+            self.condition.notify_all()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.scheduler.start_poll()
+            self.poll()
+            self.stopped.wait(self.scheduler.next_wait())
+
+    def poll(self):
+        """Refreshes the snapshot once and publishes it if the retriever produced a new one."""
+        self.cache.refresh()
+        retriever = self.cache.retriever
+        error = self.last_error = self.cache.error
+        if error is not None:
+            # RetrieverErrors carry the status and Retry-After (or the time left on an open circuit)
+            self.scheduler.record_failure(status=getattr(error, "status", None), retry_after=getattr(error, "retry_after", None))
+            return
+        self.updated_at = self.cache.fetched_at
+        if self.scheduler.analytics is not None:
+            self.scheduler.analytics.update(retriever.locations)
+        events = []
+        if retriever.locations is not self.published:
+            events = self.publish(retriever.locations)
+        self.scheduler.record_success(changed=bool(events), found=bool(events))
+
+    def publish(self, locations):
+        grouped = locations if isinstance(locations, dict) else {None: locations}
+        self.indexes = {service: TimeIndex(service_locations) for service, service_locations in grouped.items()}
+        self.published = locations
+        if self.history is not None:
+            self.history.record(locations)
+        events = self.differ.update(locations)
+        with self.condition:
+            for event in events:
+                self.last_event_id += 1
+                self.events.append((self.last_event_id, event))
+            self.condition.notify_all()
+        return events
+
+    def query(self, days=None, city=None, zip_code=None, service=None):
+        """
+        Returns the published locations matching every given criterion, sorted by next appointment date.
+        :return:
+            list of location dicts (with a "service" key)
+        """
+        now = portal_now()
+        end = now + timedelta(days=days) if days is not None else datetime.max
+        city = city.lower() if city else None
+        results = []
+        for service_id, index in self.indexes.items():
+            if service is not None and service_id != service:
+                continue
+            for location in index.window(now, end):
+                if city and location.city.lower() != city:
+                    continue
+                if zip_code and location.zip_code != zip_code:
+                    continue
+                results.append(dict(location.to_dict(), service=service_id))
+        if len(self.indexes) > 1:
+            results.sort(key=lambda location: location["next_appointment_date"])
+        return results
+
+    def events_since(self, since, timeout=0):
+        """
+        Returns the events newer than since, waiting up to timeout seconds for one to arrive (long-poll).
+        :return:
+            tuple (last event id, list of (event id, SlotEvent))
+        """
+        with self.condition:
+            if self.last_event_id <= since and timeout > 0:
+                self.condition.wait_for(lambda: self.last_event_id > since or self.stopped.is_set(), timeout)
+            return self.last_event_id, [(event_id, event) for event_id, event in self.events if event_id > since]
+
+
+def event_to_dict(event_id, event):
+    service, location_id = event.key if isinstance(event.key, tuple) else (None, event.key)
+    return {
+        "id": event_id,
+        "kind": event.kind,
+        "service": service,
+        "location_id": location_id,
+        "location": event.location.to_dict(),
+        "previous": event.previous.to_dict() if event.previous is not None else None,
+    }
+
+
+class AppointmentRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET /appointments?days=&city=&zip=&service=   current locations as JSON
+    GET /events?since=&timeout=                   long-poll for change events
+    GET /events/stream                            change events as server-sent events
+    GET /metrics?format=json                      poll loop metrics (Prometheus text by default)
+    """
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            if url.path == "/appointments":
+                self.get_appointments(params)
+            elif url.path == "/events":
+                self.get_events(params)
+            elif url.path == "/events/stream":
+                self.stream_events()
+            elif url.path == "/metrics":
+                self.get_metrics(params)
+            else:
+                self.send_json({"error": "Not found"}, status=404)
+        except ValueError as e:
+            self.send_json({"error": str(e)}, status=400)
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def get_appointments(self, params):
+        days = int_param(params, "days")
+        if days is not None and days <= 0:
+            raise ValueError("days must be greater than 0")
+        locations = self.service.query(days=days, city=params.get("city"), zip_code=params.get("zip"),
+                                       service=int_param(params, "service"))
+        updated_at = self.service.updated_at
+        error = self.service.last_error
+        self.send_json({
+            "updated_at": updated_at.isoformat() if updated_at else None,
+            "age_seconds": round((datetime.now() - updated_at).total_seconds(), 1) if updated_at else None,
+            "stale": error is not None,  # the last poll failed: these are the last good results
+            "error": str(error) if error is not None else None,
+            "count": len(locations),
+            "locations": locations,
+        })
+
+    def get_events(self, params):
+        since = int_param(params, "since")
+        timeout = min(float(params.get("timeout", 30)), MAX_WAIT)
+        if since is None:  # no cursor yet: return the current position without waiting
+            since, timeout = self.service.last_event_id, 0
+        last_event_id, events = self.service.events_since(since, timeout)
+        self.send_json({"last_id": last_event_id, "events": [event_to_dict(*item) for item in events]})
+
+    def get_metrics(self, params):
+        metrics = self.service.cache.metrics
+        if not metrics.enabled:
+            self.send_json({"error": "Metrics are disabled"}, status=404)
+        elif params.get("format") == "json":
+            self.send_body(metrics.to_json_line().encode(), "application/json")
+        else:
+            self.send_body(metrics.to_prometheus().encode(), "text/plain; version=0.0.4")
+
+    def stream_events(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        last_header = self.headers.get("Last-Event-ID")
+        since = int(last_header) if last_header and last_header.isdigit() else self.service.last_event_id
+        try:
+            while not self.service.stopped.is_set():
+                since, events = self.service.events_since(since, HEARTBEAT)
+                if not events:
+                    self.wfile.write(b": keep-alive\n\n")
+                for event_id, event in events:
+                    data = json.dumps(event_to_dict(event_id, event))
+                    self.wfile.write(f"id: {event_id}\nevent: {event.kind}\ndata: {data}\n\n".encode())
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client went away
+
+    def send_json(self, body, status=200):
+        self.send_body(json.dumps(body).encode(), "application/json", status)
+
+    def send_body(self, payload, content_type, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def int_param(params, name):
+    value = params.get(name)
+    if value is None or value == "":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+
+
+class AppointmentHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        super().__init__(address, AppointmentRequestHandler)
+        self.service = service
+
+
+def run_server(host="127.0.0.1", port=8000, check_interval=10, services=None, scheduler=None, history_path=None,
+               record_path=None, workers=None, mode="soup"):
+    """
+    Starts the background poll loop and serves the current appointments over HTTP until interrupted.
+    :param history_path: When given, every snapshot's changes are recorded in this SQLite database.
+    :param record_path: When given, every page received is appended to this compressed capture file (not with workers).
+    :param mode: Extraction mode of every fetch: "soup", "fast" or "stream".
+    :param workers: When given, the services are fetched and parsed by this many worker processes (see ShardedPoller).
+    """
+    if workers and record_path:
+        raise ValueError("Pages can't be recorded with workers: they are fetched in other processes.")
+    metrics = Metrics()
+    capture = CaptureWriter(record_path) if record_path else None
+    scheduler = scheduler or PollScheduler(check_interval)
+    if workers:
+        # the workers poll the portal, so they get the scheduler's settings; the service only reads their snapshots
+        retriever = ShardedPoller(services or [DEFAULT_SERVICE], workers=workers, mode=mode, metrics=metrics,
+                                  scheduler=scheduler).start()
+    elif services:
+        retriever = MultiServiceRetriever(services, mode=mode, metrics=metrics, capture=capture)
+    else:
+        retriever = LocationRetriever(metrics=metrics, capture=capture, mode=mode)
+    history = HistoryStore(history_path, metrics=metrics) if history_path else None
+    service = AppointmentService(SnapshotCache(retriever, ttl=check_interval), interval=check_interval, scheduler=scheduler,
+                                 history=history)
+    service.start()
+    server = AppointmentHTTPServer((host, port), service)
+    print(f"Serving appointments on http://{host}:{server.server_port} (polling every {check_interval} seconds)...")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+        if workers:
+            retriever.close()
+        if history is not None:
+            history.close()
+        if capture is not None:
+            capture.close()
@@ -0,0 +1,351 @@
+import math
+import multiprocessing
+import random
+import struct
+import threading
+import time
+from datetime import datetime
+from multiprocessing import shared_memory
+
+from errors import FetchError
+from locationRetriever import LocationRetriever
+from metrics import DISABLED
+from model import Location
+from scheduler import PollScheduler
+
+# sequence (odd while a write is in progress), fetched_at timestamp, record count, last error status, retry-after seconds
+HEADER = struct.Struct("<QdIid")
+# location_id, appointments, next appointment timestamp, then the static fields as fixed-width UTF-8
+RECORD = struct.Struct("<qqd64s96s32s4s10s20s")
+STATIC_SLICE = slice(3, None)
+NO_STATUS = 0
+UNKNOWN_ERROR = -1  # status of a failed fetch that didn't get an HTTP status
+
+
+def encode_text(value, width):
+    return str(value).encode("utf-8")[:width]
+
+
+def decode_text(raw):
+    return raw.rstrip(b"\x00").decode("utf-8", errors="ignore")
+
+
+class SnapshotArray:
+    """
+    One service's latest locations, stored as fixed-size binary records in a shared memory block.
+
+    A single worker process writes and any number of processes read, without pickling and without a lock: the writer
+    makes the header's sequence odd while it rewrites the records (seqlock), and readers retry if the sequence was odd
+    or changed while they copied the block.
+    """
+    def __init__(self, name=None, capacity=512, create=False):
+        """
+        :param name:
+            Shared memory name to attach to (or to create, None for a generated one).
+        :param capacity:
+            Maximum number of locations stored; only used when creating the block.
+        """
+        if create:
+            size = HEADER.size + capacity * RECORD.size
+            self.memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+            HEADER.pack_into(self.memory.buf, 0, 0, math.nan, 0, NO_STATUS, math.nan)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.capacity = (self.memory.size - HEADER.size) // RECORD.size
+        self.owner = create
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def header(self):
+        return HEADER.unpack_from(self.memory.buf, 0)
+
+    @property
+    def sequence(self):
+        return self.header()[0]
+
+    def write(self, locations, fetched_at=None):
+        """
+        Replaces the stored snapshot (locations beyond capacity are left out) and clears the error status.
+        :return:
+            number of locations stored
+        """
+        if len(locations) > self.capacity:
+            print(f"Warning: only the first {self.capacity} of {len(locations)} locations fit in shared memory")
+        locations = locations[:self.capacity]
+        buffer = self.memory.buf
+        sequence = self.sequence
+        sequence += sequence % 2  # odd if a previous writer died mid-write: continue from the next even value
+        HEADER.pack_into(buffer, 0, sequence + 1, math.nan, 0, NO_STATUS, math.nan)  # odd: write in progress
+        for position, location in enumerate(locations):
+            date = location.next_appointment_date
+            RECORD.pack_into(
+                buffer, HEADER.size + position * RECORD.size,
+                location.location_id if location.location_id is not None else -1,
+                location.appointments if isinstance(location.appointments, int) else -1,
+                date.timestamp() if isinstance(date, datetime) else math.nan,
+                encode_text(location.name, 64), encode_text(location.street, 96), encode_text(location.city, 32),
+                encode_text(location.state, 4), encode_text(location.zip_code, 10), encode_text(location.phone, 20),
+            )
+        fetched = fetched_at.timestamp() if fetched_at else time.time()
+        HEADER.pack_into(buffer, 0, sequence + 2, fetched, len(locations), NO_STATUS, math.nan)
+        return len(locations)
+
+    def write_error(self, status=None, retry_after=None):
+        """Records a failed fetch, keeping the stored locations."""
+        sequence, fetched_at, count, _, _ = self.header()
+        HEADER.pack_into(self.memory.buf, 0, sequence, fetched_at, count, status or UNKNOWN_ERROR,
+                         math.nan if retry_after is None else retry_after)
+
+    def clear_error(self):
+        """Records a successful fetch that didn't change the stored locations (a write clears the status itself)."""
+        sequence, fetched_at, count, status, _ = self.header()
+        if status != NO_STATUS:
+            HEADER.pack_into(self.memory.buf, 0, sequence, fetched_at, count, NO_STATUS, math.nan)
+
+    def recover(self):
+        """
+        Called before restarting the writer of a dead worker. If it died mid-write (odd sequence), the half-written
+        records are dropped and an empty snapshot is published, so readers don't wait for a write that never ends.
+        :return:
+            True if the array had to be reset
+        """
+        sequence = self.sequence
+        if not sequence % 2:
+            return False
+        HEADER.pack_into(self.memory.buf, 0, sequence + 1, math.nan, 0, NO_STATUS, math.nan)
+        return True
+
+    def read_raw(self):
+        """
+        Consistent copy of the header and records.
+        :return:
+            tuple (sequence, fetched_at timestamp, list of record tuples)
+        """
+        buffer = self.memory.buf
+        while True:
+            sequence, fetched_at, count, _, _ = HEADER.unpack_from(buffer, 0)
+            if sequence % 2:
+                time.sleep(0)  # writer is mid-update
+                continue
+            data = bytes(buffer[HEADER.size:HEADER.size + count * RECORD.size])
+            if HEADER.unpack_from(buffer, 0)[0] == sequence:
+                return sequence, fetched_at, list(RECORD.iter_unpack(data))
+
+    def read(self):
+        """
+        :return:
+            tuple (sequence, fetched_at datetime or None, list of Location)
+        """
+        sequence, fetched_at, records = self.read_raw()
+        return (sequence, None if math.isnan(fetched_at) else datetime.fromtimestamp(fetched_at),
+                [self.to_location(record) for record in records])
+
+    @staticmethod
+    def to_location(record):
+        location_id, appointments, timestamp = record[:3]
+        name, street, city, state, zip_code, phone = (decode_text(raw) for raw in record[STATIC_SLICE])
+        return Location(name, street, city, state, zip_code, phone, appointments if appointments >= 0 else None,
+                        "Unknown" if math.isnan(timestamp) else datetime.fromtimestamp(timestamp),
+                        location_id if location_id >= 0 else None)
+
+    def close(self):
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def default_retriever(service_id):
+    return LocationRetriever(url=LocationRetriever.wizard_url(service_id))
+
+
+def poll_worker(shard, scheduler, mode, stop, retriever_factory=default_retriever):
+    """
+    Body of a worker process: fetches and parses its services in turn and publishes every changed snapshot to that
+    service's SnapshotArray.
+    :param shard:
+        dict of service id -> shared memory name.
+    :param scheduler:
+        PollScheduler (a copy of the supervisor's, with its interval, burst, backoff and analytics settings) pacing the
+        worker's fetches.
+    :param stop:
+        multiprocessing Event set by the supervisor to stop the worker.
+    """
+    arrays = {service_id: SnapshotArray(name) for service_id, name in shard.items()}
+    retrievers = {service_id: retriever_factory(service_id) for service_id in shard}
+    scheduler.rng = random.Random()  # own jitter, so workers copied from the same scheduler don't poll in lockstep
+    try:
+        while not stop.is_set():
+            scheduler.start_poll()
+            changed = failed = False
+            for service_id, retriever in retrievers.items():
+                try:
+                    if retriever.fetch_locations(mode):
+                        arrays[service_id].write(retriever.locations, retriever.fetched_at)
+                        changed = True
+                    else:
+                        arrays[service_id].clear_error()
+                except Exception as e:
+                    print(f"Error fetching service {service_id}: {e}")
+                    status = getattr(e, "status", None) or retriever.last_status
+                    retry_after = getattr(e, "retry_after", None) or retriever.retry_after
+                    arrays[service_id].write_error(status, retry_after)
+                    failed = True
+                    scheduler.record_failure(status=status, retry_after=retry_after)
+            if scheduler.analytics is not None and changed:
+                scheduler.analytics.update({service_id: retriever.locations for service_id, retriever in retrievers.items()})
+            if not failed:
+                scheduler.record_success(changed=changed)
+            stop.wait(scheduler.next_wait())
+    finally:
+        for array in arrays.values():
+            array.memory.close()
+
+
+class ShardedPoller:
+    """
+    Supervisor spreading the fetch and parse work of several AppointmentWizard services over worker processes.
+
+    Every service gets a SnapshotArray in shared memory. Services are dealt round-robin to the workers, and each worker
+    fetches, parses and writes its own services, so soup and JSON parsing run on several cores.
+    This object reads the arrays with the same locations/fetched_at/fetch_locations interface as MultiServiceRetriever,
+    so Filter, SnapshotCache and the HTTP API use it unchanged. Other processes can attach to the arrays by name.
+    A monitor thread restarts any worker that dies.
+    """
+    def __init__(self, service_ids, workers=None, interval=10, mode="soup", capacity=512, restart_delay=1,
+                 retriever_factory=default_retriever, metrics=DISABLED, scheduler=None):
+        """
+        :param workers:
+            Number of worker processes (default: one per service, at most the number of CPUs).
+        :param interval:
+            Base seconds between two fetches of a worker's services, when no scheduler is given.
+        :param scheduler:
+            PollScheduler every worker gets a copy of (its own backoff state and jitter, the same interval, max_interval,
+            burst times and release analytics). Defaults to PollScheduler(interval).
+        :param mode:
+            Extraction mode passed to LocationRetriever.fetch_locations ("soup", "fast" or "stream").
+        :param capacity:
+            Maximum number of locations per service.
+        :param restart_delay:
+            Seconds to wait before restarting a dead worker.
+        :param retriever_factory:
+            Picklable function building a service's retriever from its id, called inside the worker.
+        """
+        service_ids = list(service_ids)
+        workers = workers or min(len(service_ids), multiprocessing.cpu_count())
+        if not service_ids or workers <= 0:
+            raise ValueError("At least one service and one worker are needed.")
+        self.arrays = {service_id: SnapshotArray(capacity=capacity, create=True) for service_id in service_ids}
+        self.shards = [{service_id: self.arrays[service_id].name for service_id in service_ids[index::workers]}
+                       for index in range(min(workers, len(service_ids)))]
+        self.scheduler = scheduler or PollScheduler(interval)
+        self.mode = mode
+        self.restart_delay = restart_delay
+        self.retriever_factory = retriever_factory
+        self.metrics = metrics
+        self.context = multiprocessing.get_context("spawn")
+        self.stop_event = self.context.Event()
+        self.processes = [None] * len(self.shards)
+        self.restarts = 0
+        self.snapshots = {}  # service id -> (sequence, list of Location) last read
+        self.errors = {}  # service id -> error status reported by its worker (UNKNOWN_ERROR without an HTTP status)
+        self.locations = {}
+        self.fetched_at = None
+        self.monitor = None
+        self.stopped = threading.Event()
+
+    @property
+    def names(self):
+        """Shared memory name of every service's array, for readers in other processes."""
+        return {service_id: array.name for service_id, array in self.arrays.items()}
+
+    def start(self):
+        for index in range(len(self.shards)):
+            self.spawn(index)
+        self.monitor = threading.Thread(target=self.supervise, daemon=True)
+        self.monitor.start()
+        return self
+
+    def spawn(self, index):
+        process = self.context.Process(target=poll_worker, daemon=True, name=f"poller-{index}",
+                                       args=(self.shards[index], self.scheduler, self.mode, self.stop_event,
+                                             self.retriever_factory))
+        process.start()
+        self.processes[index] = process
+
+    def supervise(self):
+        while not self.stopped.wait(self.restart_delay):
+            for index, process in enumerate(self.processes):
+                if not process.is_alive() and not self.stopped.is_set():
+                    print(f"Worker {process.name} exited with code {process.exitcode}, restarting it")
+                    process.close()
+                    for service_id in self.shards[index]:
+                        if self.arrays[service_id].recover():
+                            print(f"Dropped the half-written snapshot of service {service_id}")
+                    self.restarts += 1
+                    self.metrics.increment("worker_restarts")
+                    self.spawn(index)
+
+    def fetch_locations(self):
+        """
+        Reads every service's latest snapshot from shared memory; Location objects are only rebuilt for services whose
+        array changed, and the locations dict is only replaced when one did (so Filter and SnapshotCache keep their indexes).
+        Services whose worker reported a failed fetch are listed in errors and keep their last snapshot; FetchError is
+        raised when every service is failing, like MultiServiceRetriever.
+        :return:
+            True if any service's locations changed (False until a worker published its first snapshot)
+        """
+        changed = False
+        fetched = []
+        self.errors = {}
+        for service_id, array in self.arrays.items():
+            status = array.header()[3]
+            if status != NO_STATUS:
+                self.errors[service_id] = status
+            sequence = array.sequence
+            cached = self.snapshots.get(service_id)
+            if cached is None or cached[0] != sequence:
+                sequence, fetched_at, locations = array.read()
+                cached = self.snapshots[service_id] = (sequence, locations, fetched_at)
+                changed = True
+            if cached[2] is not None:
+                fetched.append(cached[2])
+        if changed:
+            self.locations = {service_id: cached[1] for service_id, cached in self.snapshots.items()}
+            self.fetched_at = max(fetched, default=None)
+        if len(self.errors) == len(self.arrays):
+            raise FetchError("Every worker failed to fetch its services.", status=self.last_status,
+                             retry_after=self.retry_after)
+        if self.fetched_at is None:
+            return False  # workers are still starting: not a failure, the services just have no locations yet
+        return changed
+
+    @property
+    def last_status(self):
+        """
+        Worst HTTP status among the failing services of the last fetch_locations (None if none failed with a status;
+        failures without one, e.g. connection errors, are in errors as UNKNOWN_ERROR).
+        """
+        return max((status for status in self.errors.values() if status > 0), default=None)
+
+    @property
+    def retry_after(self):
+        delays = [array.header()[4] for array in self.arrays.values()]
+        return max((delay for delay in delays if not math.isnan(delay)), default=None)
+
+    def close(self, timeout=5):
+        """Stops the workers and frees the shared memory."""
+        self.stopped.set()
+        self.stop_event.set()
+        if self.monitor is not None:
+            self.monitor.join()
+        for process in self.processes:
+            if process is None:
+                continue
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        for array in self.arrays.values():
+            array.close()
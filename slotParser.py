@@ -0,0 +1,93 @@
+from datetime import datetime
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+SLOT_FORMAT = "%m/%d/%Y %I:%M %p"
+NEXT_AVAILABLE = "Next Available: "
+PORTAL_TIMEZONE = "America/New_York"  # the portal's dates are naive wall-clock times in this zone
+
+
+@lru_cache(maxsize=None)
+def portal_zone():
+    """
+    ZoneInfo of the portal, loaded once per process.
+    :return:
+        ZoneInfo, or None when the system has no time zone database (e.g. Windows without the tzdata package)
+    """
+    try:
+        return ZoneInfo(PORTAL_TIMEZONE)
+    except ZoneInfoNotFoundError:
+        return None
+
+
+def portal_now(moment=None):
+    """
+    Current time as a naive datetime in the portal's zone, directly comparable with the parsed slot dates whatever the
+    machine's own time zone is. Falls back to the local time when no time zone database is available.
+    :param moment:
+        Aware or naive local datetime to convert instead of the current time (e.g. a recorded fetch time).
+    """
+    zone = portal_zone()
+    if zone is None:
+        return moment or datetime.now()
+    moment = moment.astimezone(zone) if moment is not None else datetime.now(zone)
+    return moment.replace(tzinfo=None)
+
+
+def parse_slot_date(text: str):
+    """
+    Parses the portal's "MM/DD/YYYY hh:mm AM" dates without going through strptime's locale and regex machinery.
+    Anything that isn't in that exact zero-padded layout is handed to datetime.strptime, so results and raised errors are the same as strptime(text, SLOT_FORMAT).
+    :return:
+        datetime object
+    """
+    if (len(text) == 19 and text.isascii() and text[2] == "/" and text[5] == "/" and text[10] == " "
+            and text[13] == ":" and text[16] == " "):
+        digits = text[0:2] + text[3:5] + text[6:10] + text[11:13] + text[14:16]
+        meridiem = text[17:19].upper()
+        if digits.isdigit() and (meridiem == "AM" or meridiem == "PM"):
+            # one int() call for all fields: MMDDYYYYhhmm
+            value = int(digits)
+            value, minute = divmod(value, 100)
+            value, hour = divmod(value, 100)
+            value, year = divmod(value, 10000)
+            month, day = divmod(value, 100)
+            if 1 <= month <= 12 and 1 <= day <= 31 and 1 <= hour <= 12 and minute <= 59:
+                try:
+                    return datetime(year, month, day, hour % 12 + (12 if meridiem == "PM" else 0), minute)
+                except ValueError:
+                    pass  # e.g. 02/30, let strptime raise its own error
+    return datetime.strptime(text, SLOT_FORMAT)
+
+
+def parse_slot_dates(texts):
+    """
+    Batch version of parse_slot_date. Each distinct string is parsed once.
+    :return:
+        list with a datetime (or None when the string can't be parsed) for every input string, in order
+    """
+    parsed = {}
+    for text in texts:
+        if text not in parsed:
+            try:
+                parsed[text] = parse_slot_date(text)
+            except (TypeError, ValueError):
+                parsed[text] = None
+    return [parsed[text] for text in texts]
+
+
+def parse_time_data(time_data):
+    """
+    Parses the next available date of a whole timeData list at once.
+    :param time_data:
+        list of timeData dicts (with 'LocationId' and 'FirstOpenSlot')
+    :return:
+        dict of LocationId -> datetime, or None for entries without a parseable "Next Available: " date
+    """
+    location_ids = []
+    texts = []
+    for obj in time_data:
+        location_ids.append(obj.get("LocationId"))
+        parts = (obj.get("FirstOpenSlot") or "").split(NEXT_AVAILABLE)
+        texts.append(parts[1] if len(parts) > 1 else "")
+    return dict(zip(location_ids, parse_slot_dates(texts)))
@@ -0,0 +1,116 @@
+import threading
+import time
+
+from locationRetriever import LocationRetriever
+from metrics import DISABLED
+
+
+class SnapshotCache:
+    """
+    Shared holder of the latest parsed locations between a retriever and any number of filters/users.
+    It exposes the same locations/fetched_at/fetch_locations interface as a retriever, so it can be handed to Filter directly.
+
+    - fresh (younger than ttl): served from memory, no request.
+    - stale (within stale_ttl after that): served from memory while a single background refresh runs (stale-while-revalidate).
+    - expired or empty: callers block on a refresh; concurrent callers wait for the same in-flight request instead of starting their own.
+      If that refresh fails, the last good snapshot is still served (see stale and age()); only an empty cache raises the error.
+    """
+    def __init__(self, retriever=None, ttl=10, stale_ttl=60):
+        """
+        :param retriever:
+            LocationRetriever or MultiServiceRetriever that does the actual fetching.
+        :param ttl:
+            Seconds a snapshot is considered fresh.
+        :param stale_ttl:
+            Extra seconds an old snapshot may still be served while it's being revalidated in the background.
+        """
+        self.retriever = retriever or LocationRetriever()
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.lock = threading.Lock()
+        self.in_flight = None  # threading.Event set when the running refresh finishes
+        self.updated_at = None  # time.monotonic() of the last successful refresh
+        self.error = None  # exception raised by the last refresh, if it failed
+        self.fetches = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.fallbacks = 0  # snapshots served after a failed refresh
+
+    @property
+    def locations(self):
+        return self.get()
+
+    @property
+    def metrics(self):
+        return getattr(self.retriever, "metrics", DISABLED)
+
+    @property
+    def fetched_at(self):
+        return self.retriever.fetched_at
+
+    @property
+    def stale(self):
+        """True when the last refresh failed and the snapshot served is the last good one."""
+        return self.error is not None and self.updated_at is not None
+
+    def age(self):
+        """Seconds since the last successful refresh (None if there was none)."""
+        return None if self.updated_at is None else time.monotonic() - self.updated_at
+
+    def get(self):
+        """
+        Returns the current snapshot, refreshing it according to ttl/stale_ttl.
+        :return:
+            list of locations (or dict of service id -> list for multi-service retrievers)
+        """
+        age = self.age()
+        if age is not None and age < self.ttl:
+            self.hits += 1
+            return self.retriever.locations
+        if age is not None and age < self.ttl + self.stale_ttl:
+            self.stale_hits += 1
+            if self.in_flight is None:
+                threading.Thread(target=self.refresh, kwargs={"wait": False}, daemon=True).start()
+            return self.retriever.locations
+
+        self.refresh()
+        if self.error is not None:
+            if self.updated_at is None:
+                raise self.error
+            self.fallbacks += 1
+        return self.retriever.locations
+
+    def fetch_locations(self):
+        """Forces a refresh now (joining one that is already running) and returns whether it succeeded."""
+        self.refresh()
+        if self.error is not None:
+            raise self.error
+        return True
+
+    def refresh(self, wait=True):
+        """
+        Runs retriever.fetch_locations() unless a refresh is already in flight, in which case it waits for that one (if wait is True).
+        """
+        with self.lock:
+            event = self.in_flight
+            leader = event is None
+            if leader:
+                event = self.in_flight = threading.Event()
+
+        if not leader:
+            if wait:
+                event.wait()
+            return
+
+        try:
+            self.fetches += 1
+            self.retriever.fetch_locations()
+            self.updated_at = time.monotonic()
+            self.error = None
+        except Exception as e:
+            print(f"Error refreshing snapshot: {e}")
+            self.error = e
+        finally:
+            with self.lock:
+                self.in_flight = None
+            event.set()
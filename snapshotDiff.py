@@ -0,0 +1,70 @@
+from typing import NamedTuple
+
+NEW = "new"  # location wasn't in the previous snapshot
+EARLIER = "earlier"  # next_appointment_date moved earlier
+MORE_SLOTS = "more_slots"  # number of appointments increased
+GONE = "gone"  # location left the snapshot (slots taken or out of range)
+
+
+class SlotEvent(NamedTuple):
+    kind: str
+    key: object  # LocationId, or (service id, LocationId) for multi-service snapshots
+    location: object  # current Location (last seen one for GONE events)
+    previous: object  # Location from the previous snapshot (None for NEW events)
+
+
+class SnapshotDiffer:
+    """
+    Keeps the last snapshot of locations keyed by LocationId and turns each new snapshot into the list of changes since the previous one.
+    Unchanged locations produce no event, so a long-running search can alert only on newly opened or earlier slots.
+    """
+    def __init__(self):
+        self.snapshot = {}
+
+    @staticmethod
+    def key_locations(locations):
+        """
+        Indexes a snapshot by location key. Accepts a list of locations or a dict of service id -> list (as returned by Filter.filter).
+        """
+        if isinstance(locations, dict):
+            return {(service, SnapshotDiffer.location_key(location)): location
+                    for service, service_locations in locations.items() for location in service_locations}
+        return {SnapshotDiffer.location_key(location): location for location in locations}
+
+    @staticmethod
+    def location_key(location):
+        return location.location_id if location.location_id is not None else location.name
+
+    def update(self, locations):
+        """
+        Replaces the stored snapshot with locations and returns the differences.
+        The diff is linear in the size of the snapshot: every location is keyed and looked up once. Locations reused by
+        the retriever from an unchanged FirstOpenSlot (the same object as last time) are skipped with an identity check,
+        so only changed entries are compared field by field.
+        :return:
+            list of SlotEvent (NEW, EARLIER and MORE_SLOTS first in snapshot order, then GONE)
+        """
+        current = self.key_locations(locations)
+        previous = self.snapshot
+        events = []
+        for key, location in current.items():
+            old = previous.get(key)
+            if old is None:
+                events.append(SlotEvent(NEW, key, location, None))
+            elif old is location:
+                continue  # same object reused from an unchanged page
+            elif self.is_earlier(location, old):
+                events.append(SlotEvent(EARLIER, key, location, old))
+            elif (location.appointments or 0) > (old.appointments or 0):
+                events.append(SlotEvent(MORE_SLOTS, key, location, old))
+        if len(previous) > len(current) - sum(1 for event in events if event.kind == NEW):
+            events.extend(SlotEvent(GONE, key, old, old) for key, old in previous.items() if key not in current)
+        self.snapshot = current
+        return events
+
+    @staticmethod
+    def is_earlier(location, old):
+        try:
+            return location.next_appointment_date < old.next_appointment_date
+        except TypeError:  # "Unknown" dates can't be compared
+            return False
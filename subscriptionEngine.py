@@ -0,0 +1,127 @@
+from bisect import bisect_left
+from datetime import datetime
+from heapq import merge
+from typing import NamedTuple
+
+from locationRetriever import TimeIndex
+from metrics import DISABLED
+from slotParser import portal_now
+
+DAY_SECONDS = 86400
+ANYWHERE = ("any", None)  # place key of subscriptions without city/zip restriction
+
+
+class Subscription(NamedTuple):
+    subscriber: object  # any hashable id (user id, chat id, e-mail...)
+    days: float  # day range counted from the snapshot time, as in Filter
+    cities: tuple = ()  # city names (case insensitive); empty with zips empty means anywhere
+    zips: tuple = ()  # zip codes; a location matches when its city OR its zip is listed
+    min_appointments: int = 1
+    service: object = None  # AppointmentWizard id, None for any service
+
+
+class SubscriptionGroup:
+    """Subscriptions sharing a service, a place and a minimum appointment count, sorted by days."""
+    __slots__ = ('days', 'subscribers')
+
+    def __init__(self, subscriptions):
+        subscriptions = sorted(subscriptions, key=lambda subscription: subscription.days)
+        self.days = [subscription.days for subscription in subscriptions]
+        self.subscribers = [subscription.subscriber for subscription in subscriptions]
+
+    def matching(self, days_away):
+        """Subscribers whose day range reaches a location days_away days from now."""
+        return self.subscribers[bisect_left(self.days, days_away):]
+
+
+class SubscriptionEngine:
+    """
+    Matches many watch rules against one snapshot without running a Filter per rule.
+
+    Subscriptions are indexed by (service, place) -> minimum appointment count -> SubscriptionGroup, where place is a
+    city, a zip code or "anywhere". Each available location of the snapshot then looks up only the groups of its own
+    service, city and zip, and a binary search on days gives the subscribers whose window reaches it.
+    The cost per snapshot is O(locations x places x log subscriptions) plus the size of the output, not
+    O(subscriptions x locations).
+    """
+    def __init__(self, subscriptions=(), metrics=DISABLED):
+        self.subscriptions = {}  # subscriber -> list of Subscription
+        self.metrics = metrics
+        self.index = None  # (service, place) -> list of (min_appointments, SubscriptionGroup), rebuilt lazily
+        for subscription in subscriptions:
+            self.add(subscription)
+
+    def __len__(self):
+        return sum(len(subscriptions) for subscriptions in self.subscriptions.values())
+
+    def add(self, subscription):
+        self.subscriptions.setdefault(subscription.subscriber, []).append(subscription)
+        self.index = None
+
+    def remove(self, subscriber):
+        """Drops every subscription of subscriber."""
+        if self.subscriptions.pop(subscriber, None) is not None:
+            self.index = None
+
+    @staticmethod
+    def places(subscription):
+        if not subscription.cities and not subscription.zips:
+            return [ANYWHERE]
+        return ([("city", city.lower()) for city in subscription.cities]
+                + [("zip", str(zip_code)) for zip_code in subscription.zips])
+
+    def build_index(self):
+        grouped = {}  # (service, place) -> min_appointments -> list of Subscription
+        for subscriptions in self.subscriptions.values():
+            for subscription in subscriptions:
+                for place in self.places(subscription):
+                    levels = grouped.setdefault((subscription.service, place), {})
+                    levels.setdefault(subscription.min_appointments, []).append(subscription)
+        self.index = {key: sorted((minimum, SubscriptionGroup(group)) for minimum, group in levels.items())
+                      for key, levels in grouped.items()}
+        return self.index
+
+    def match(self, locations, now=None):
+        """
+        Finds every subscriber with at least one matching location in the snapshot.
+        :param locations:
+            list of locations, or dict of service id -> list of locations (a retriever's or SnapshotCache's locations).
+            Subscriptions with a service only match the locations of that service in a dict snapshot.
+        :param now:
+            Start of every subscription's day range (defaults to portal_now()).
+        :return:
+            dict of subscriber -> list of (service id, location) sorted by next appointment date
+            (service id is None for single-service snapshots)
+        """
+        with self.metrics.stage("match"):
+            index = self.index if self.index is not None else self.build_index()
+            now = now or portal_now()
+            if not isinstance(locations, dict):
+                locations = {None: locations}
+            results = {}
+            for service, location in self.available(locations, now):
+                days_away = (location.next_appointment_date - now).total_seconds() / DAY_SECONDS
+                appointments = location.appointments if isinstance(location.appointments, int) else 0
+                places = (ANYWHERE, ("city", location.city.lower()), ("zip", str(location.zip_code)))
+                services = (None,) if service is None else (service, None)
+                subscribers = set()
+                for service_key in services:
+                    for place in places:
+                        for minimum, group in index.get((service_key, place), ()):
+                            if minimum > appointments:
+                                break
+                            subscribers.update(group.matching(days_away))
+                pair = (service, location)
+                for subscriber in subscribers:
+                    results.setdefault(subscriber, []).append(pair)
+            self.metrics.increment("subscription_matches", len(results))
+            return results
+
+    @staticmethod
+    def available(locations, now):
+        """(service id, location) of every location with a date from now on, across services in date order."""
+        per_service = [[(service, location) for location in TimeIndex(service_locations or []).window(now, datetime.max)]
+                       for service, service_locations in locations.items()]
+        if len(per_service) == 1:
+            return per_service[0]
+        return merge(*per_service, key=lambda pair: pair[1].next_appointment_date)
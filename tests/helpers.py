@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from benchmarks.bench_subscriptions import NOW
+from model import Location
+
+
+def make_location(location_id=None, appointments=3, days=1, name=None, city="Edison", zip_code="08817", now=NOW,
+                  date=None):
+    """
+    Location for the tests.
+    :param name:
+        Defaults to "<city> <location_id>".
+    :param date:
+        Next appointment date; defaults to days after now.
+    """
+    return Location(name or f"{city} {location_id}", "1 Main St", city, "NJ", zip_code, "732-555-0100", appointments,
+                    date or now + timedelta(days=days), location_id)
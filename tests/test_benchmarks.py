@@ -0,0 +1,41 @@
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from benchmarks.run import REFERENCE, compare, to_baseline
+
+
+def results(reference, **stages):
+    measured = {f"page:{stage}": {"p50": p50} for stage, p50 in stages.items()}
+    measured[REFERENCE] = {"p50": reference}
+    return measured
+
+
+class TestCompare(unittest.TestCase):
+    def setUp(self):
+        self.baseline = to_baseline(results(0.001, parse=0.010, extract=0.0002))
+
+    def compare(self, measured, tolerance=1.5, min_delta=0.001):
+        with redirect_stdout(StringIO()):
+            return compare(measured, self.baseline, tolerance, min_delta)
+
+    def test_baseline_stores_ratios(self):
+        self.assertEqual(self.baseline, {"page:parse": 10.0, "page:extract": 0.2, REFERENCE: 0.001})
+
+    def test_slower_machine_is_not_a_regression(self):
+        """A machine three times slower at everything keeps the same ratios"""
+        self.assertEqual(self.compare(results(0.003, parse=0.030, extract=0.0006)), [])
+
+    def test_slower_stage_is_a_regression(self):
+        self.assertEqual(self.compare(results(0.003, parse=0.060, extract=0.0006)), ["page:parse"])
+
+    def test_small_slowdowns_are_ignored(self):
+        self.assertEqual(self.compare(results(0.001, parse=0.010, extract=0.0008)), [])
+        self.assertEqual(self.compare(results(0.001, parse=0.010, extract=0.0008), min_delta=0), ["page:extract"])
+
+    def test_stages_missing_from_baseline_are_skipped(self):
+        self.assertEqual(self.compare(results(0.001, parse=0.010, new_stage=1.0)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+
+from circuitBreaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, max_reset_timeout=100, clock=self.clock)
+
+    def fail(self, times, retry_after=None):
+        for _ in range(times):
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record_failure(retry_after)
+
+    def test_opens_after_threshold(self):
+        self.fail(2)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.fail(1)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.retry_in(), 30)
+
+    def test_success_resets_count(self):
+        self.fail(2)
+        self.breaker.record_success()
+        self.fail(2)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_single_half_open_probe(self):
+        """Once the timeout is over exactly one probe goes through; its result decides the next state"""
+        self.fail(3)
+        self.clock.now = 30
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertFalse(self.breaker.allow())  # probe still in flight
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_probes_double_the_timeout(self):
+        self.fail(3)
+        for expected in (60, 100, 100):
+            self.clock.now += self.breaker.retry_in()
+            self.assertTrue(self.breaker.allow())
+            self.breaker.record_failure()
+            self.assertEqual(self.breaker.retry_in(), expected)
+        self.assertEqual(self.breaker.opened, 4)
+
+    def test_retry_after_extends_open_period(self):
+        self.fail(3, retry_after=120)
+        self.assertEqual(self.breaker.retry_in(), 120)
+
+
+if __name__ == "__main__":
+    unittest.main()
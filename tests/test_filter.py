@@ -1,7 +1,8 @@
 import unittest
 from unittest.mock import patch, MagicMock
-from locationRetriever import Filter
+from locationRetriever import Filter, LocationRetriever
 from model import Location
+from slotParser import portal_now
 from datetime import datetime, timedelta
 
 class TestFilter(unittest.TestCase):
@@ -16,11 +17,11 @@ class TestFilter(unittest.TestCase):
         """
         mock_locations = [
             Location("Location A", "123 Main St", "Springfield", "IL", "62704", "555-1234", 5,
-                     datetime.now() + timedelta(days=1)),  # Tomorrow
+                     portal_now() + timedelta(days=1)),  # Tomorrow
             Location("Location B", "456 Elm St", "Chicago", "IL", "60601", "312-555-6789", 3,
-                     datetime.now() + timedelta(days=3)),  # 3 days later
+                     portal_now() + timedelta(days=3)),  # 3 days later
             Location("Location C", "789 Oak St", "Naperville", "IL", "60563", "630-555-9876", 1,
-                     datetime.now() + timedelta(days=5))  # 5 days later
+                     portal_now() + timedelta(days=5))  # 5 days later
         ]
 
         filter_instance = Filter(days=3)
@@ -58,11 +59,11 @@ class TestFilter(unittest.TestCase):
         """
         mock_locations = [
             Location("Location A", "123 Main St", "Springfield", "IL", "62704", "555-1234", 5,
-                     datetime.now() + timedelta(days=4)),  # 4 days later
+                     portal_now() + timedelta(days=4)),  # 4 days later
             Location("Location B", "456 Elm St", "Chicago", "IL", "60601", "312-555-6789", 3,
-                     datetime.now() + timedelta(days=7)),  # 7 days later
+                     portal_now() + timedelta(days=7)),  # 7 days later
             Location("Location C", "789 Oak St", "Naperville", "IL", "60563", "630-555-9876", 1,
-                     datetime.now() + timedelta(days=5))  # 5 days later
+                     portal_now() + timedelta(days=5))  # 5 days later
         ]
 
         filter_instance = Filter(days=3)
@@ -72,3 +73,42 @@ class TestFilter(unittest.TestCase):
 
         # Assert that no locations match the 3-day range
         self.assertEqual(filtered_locations, [])
+
+    def make_filter(self, days, locations):
+        """Filter over a retriever that already holds a snapshot (no network access)"""
+        retriever = LocationRetriever()
+        retriever.locations = locations
+        retriever.fetched_at = datetime.now()
+        return Filter(days, retriever)
+
+    def make_locations(self, offsets):
+        return [Location(f"Location {i}", "123 Main St", "Springfield", "IL", "62704", "555-1234", 1,
+                         portal_now() + timedelta(days=offset) if offset is not None else "Unknown", i)
+                for i, offset in enumerate(offsets)]
+
+    def test_filter_uses_index_once_per_snapshot(self):
+        """The sorted index is reused until the retriever's locations list is replaced"""
+        filter_instance = self.make_filter(3, self.make_locations([2.5, 0.5, 1.5, 10]))
+
+        self.assertEqual([loc.location_id for loc in filter_instance.filter()], [1, 2, 0])
+        index = filter_instance.get_index(None, filter_instance.retriever.locations)
+        filter_instance.filter()
+        self.assertIs(filter_instance.get_index(None, filter_instance.retriever.locations), index)
+
+        filter_instance.retriever.locations = self.make_locations([0.5])
+        self.assertEqual([loc.location_id for loc in filter_instance.filter()], [0])
+
+    def test_filter_skips_unknown_dates(self):
+        filter_instance = self.make_filter(3, self.make_locations([None, 1]))
+        self.assertEqual([loc.location_id for loc in filter_instance.filter()], [1])
+
+    def test_filter_windows(self):
+        """Several day ranges are answered from the same snapshot and match individual filters"""
+        locations = self.make_locations([0.5, 2.5, 6.5, 20, 40, -1])
+        filter_instance = self.make_filter(3, locations)
+        windows = filter_instance.filter_windows([1, 3, 7, 30])
+
+        self.assertEqual({days: [loc.location_id for loc in found] for days, found in windows.items()},
+                         {1: [0], 3: [0, 1], 7: [0, 1, 2], 30: [0, 1, 2, 3]})
+        for days, found in windows.items():
+            self.assertEqual(found, self.make_filter(days, locations).filter())
@@ -0,0 +1,118 @@
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+
+from geoIndex import DistanceCache, GeoFilter, OrderedIndex, convert_gazetteer, haversine_miles, load_zip_centroids, parse_origin
+from locationRetriever import TimeIndex
+from pageCapture import SnapshotSource
+from tests.helpers import NOW, make_location
+
+EDISON = "08817"
+
+
+class TestGeoIndex(unittest.TestCase):
+    def setUp(self):
+        self.source = SnapshotSource()
+        self.source.locations = [
+            make_location(1, name="Rahway", zip_code="07065", days=3),  # ~8 miles from Edison
+            make_location(2, name="Newark", zip_code="07102", days=1),  # ~19 miles
+            make_location(3, name="Atlantic City", zip_code="08401", days=0.5),  # ~85 miles
+            make_location(4, name="Somewhere", zip_code="N/A", days=0.5),  # zip unknown
+            make_location(5, name="Edison", zip_code=EDISON, days=5),
+        ]
+
+    def geo_filter(self, **kwargs):
+        return GeoFilter(7, self.source, origin=EDISON, clock=lambda: NOW, **kwargs)
+
+    def test_bundled_table(self):
+        centroids = load_zip_centroids()
+        self.assertIn(EDISON, centroids)
+        self.assertTrue(all(zip_code.startswith(("07", "08")) for zip_code in centroids))
+
+    def test_haversine(self):
+        # Newark to Trenton is about 45 miles in a straight line
+        self.assertAlmostEqual(haversine_miles(parse_origin("07102"), parse_origin("08611")), 45, delta=3)
+
+    def test_parse_origin(self):
+        self.assertEqual(parse_origin("40.5,-74.4"), (40.5, -74.4))
+        self.assertEqual(parse_origin((40.5, -74.4)), (40.5, -74.4))
+        with self.assertRaises(ValueError):
+            parse_origin("99999")
+
+    def test_distances_are_cached(self):
+        cache = DistanceCache(EDISON)
+        location = self.source.locations[0]
+        first = cache.distance(location)
+        cache.centroids = {}  # a second lookup must not need the table anymore
+        self.assertEqual(cache.distance(location), first)
+        self.assertIsNone(DistanceCache(EDISON).distance(self.source.locations[3]))
+
+    def test_radius_and_date_order(self):
+        """Far locations never reach the date window; locations without a known zip are still reported"""
+        results = self.geo_filter(radius=25).filter()
+        self.assertEqual([location.name for location in results], ["Somewhere", "Newark", "Rahway", "Edison"])
+        self.assertEqual([location.name for location in self.geo_filter(radius=10).filter()],
+                         ["Somewhere", "Rahway", "Edison"])
+
+    def test_distance_and_score_order(self):
+        by_distance = self.geo_filter(radius=25, order="distance").filter()
+        self.assertEqual([location.name for location in by_distance], ["Edison", "Rahway", "Newark", "Somewhere"])
+
+        # Newark is 2 days sooner than Rahway but ~11 miles further: 1 day per 10 miles keeps it first, 1 day per 2 miles doesn't
+        self.assertEqual([location.name for location in self.geo_filter(order="score", miles_per_day=10).filter()],
+                         ["Newark", "Rahway", "Edison", "Somewhere"])
+        self.assertEqual([location.name for location in self.geo_filter(order="score", miles_per_day=2).filter()],
+                         ["Edison", "Rahway", "Newark", "Somewhere"])
+
+    def test_ordered_windows_match_sorting(self):
+        """The ordered index answers every window in the same order as sorting the date window would"""
+        locations = [make_location(i, name=f"Loc {i}", zip_code=zip_code, days=(i * 7 % 23) / 3)
+                     for i, zip_code in enumerate(["07065", "07102", "08817", "08611", "07302", "08401", "N/A"] * 5)]
+        self.source.locations = locations
+        days_list = [0, 1, 2.5, 7]
+        for order in ("distance", "score"):
+            geo_filter = self.geo_filter(radius=None, order=order)
+            windows = geo_filter.filter_windows(days_list)
+            key = geo_filter.sort_key()
+            for days in days_list:
+                with self.subTest(order=order, days=days):
+                    date_window = TimeIndex(locations).window(NOW, NOW + timedelta(days=days))
+                    self.assertEqual(windows[days], sorted(date_window, key=key))
+
+    def test_index_built_once_per_snapshot(self):
+        geo_filter = self.geo_filter()
+        geo_filter.filter()
+        index = geo_filter.indexes[None][1]
+        geo_filter.filter()
+        self.assertIs(geo_filter.indexes[None][1], index)
+        self.assertIsInstance(self.geo_filter(order="distance").get_index(None, self.source.locations), OrderedIndex)
+
+        self.source.locations = self.source.locations[:1]
+        self.assertEqual(len(geo_filter.filter()), 1)
+
+    def test_multi_service(self):
+        self.source.locations = {12: self.source.locations[:2], 14: self.source.locations[2:]}
+        results = self.geo_filter().filter()
+        self.assertEqual({service: [location.name for location in locations] for service, locations in results.items()},
+                         {12: ["Newark", "Rahway"], 14: ["Somewhere", "Edison"]})
+
+    def test_unknown_order(self):
+        with self.assertRaises(ValueError):
+            self.geo_filter(order="alphabetical")
+
+    def test_convert_gazetteer(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "gazetteer.txt")
+            destination = os.path.join(directory, "centroids.csv")
+            with open(source, "w", encoding="utf-8") as file:
+                file.write("GEOID\tALAND\tAWATER\tALAND_SQMI\tAWATER_SQMI\tINTPTLAT\tINTPTLONG                                   \n")
+                file.write("06001\t1\t0\t0.1\t0.0\t41.0\t-72.0\n")  # Connecticut
+                file.write("07102\t1\t0\t0.1\t0.0\t40.735\t-74.173\n")
+                file.write("08817\t1\t0\t0.1\t0.0\t40.516\t-74.388\n")
+            self.assertEqual(convert_gazetteer(source, destination), 2)
+            self.assertEqual(load_zip_centroids(destination), {"07102": (40.735, -74.173), "08817": (40.516, -74.388)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+
+from historyStore import CLOSED, FEWER, MORE, MOVED, OPENED, HistoryStore
+from metrics import Metrics
+from tests.helpers import make_location
+
+
+class TestHistoryStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "history.db")
+        self.metrics = Metrics()
+        self.store = HistoryStore(self.path, metrics=self.metrics)
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def rows(self):
+        with sqlite3.connect(self.path) as connection:
+            return connection.execute("SELECT location_id, appointments, change FROM observations ORDER BY id").fetchall()
+
+    def test_only_changes_are_written(self):
+        """Unchanged locations produce no row; every kind of change (and disappearance) produces one"""
+        date = datetime(2024, 3, 15, 9, 0)
+        first = [make_location(1, 3, date=date), make_location(2, 1, date=date)]
+        self.store.record(first)
+        self.store.record(first)
+        self.store.record([make_location(1, 5, date=date), make_location(2, 1, date=datetime(2024, 3, 14, 9, 0))])
+        self.store.record([make_location(1, 2, date=date)])
+        self.store.flush()
+
+        self.assertEqual(self.rows(), [
+            (1, 3, OPENED), (2, 1, OPENED),
+            (1, 5, MORE), (2, 1, MOVED),
+            (1, 2, FEWER), (2, 0, CLOSED),
+        ])
+        self.assertEqual(self.metrics.snapshot()["counters"]["history_rows"], 6)
+
+    def test_wal_and_indexes(self):
+        self.store.flush()
+        with sqlite3.connect(self.path) as connection:
+            self.assertEqual(connection.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            indexes = {row[1] for row in connection.execute("PRAGMA index_list(observations)")}
+        self.assertTrue({"observations_location", "observations_city", "observations_time"} <= indexes)
+
+    def test_restart_keeps_last_state(self):
+        date = datetime(2024, 3, 15, 9, 0)
+        self.store.record([make_location(1, 3, date=date)])
+        self.store.close()
+
+        self.store = HistoryStore(self.path)
+        self.store.record([make_location(1, 3, date=date)])
+        self.store.flush()
+        self.assertEqual(len(self.rows()), 1)
+
+    def test_multi_service_snapshots(self):
+        date = datetime(2024, 3, 15, 9, 0)
+        self.store.record({12: [make_location(1, 3, date=date)], 14: [make_location(1, 3, date=date)]})
+        self.store.flush()
+        with sqlite3.connect(self.path) as connection:
+            services = connection.execute("SELECT service FROM observations ORDER BY service").fetchall()
+        self.assertEqual(services, [(12,), (14,)])
+
+    def test_opening_times(self):
+        """Openings are grouped by weekday/hour of observation and can be narrowed to a city"""
+        date = datetime(2024, 3, 15, 9, 0)
+        monday_8 = datetime(2024, 3, 11, 8, 0)  # a Monday
+        self.store.record([make_location(1, 3, date=date), make_location(2, 3, date=date, city="Newark")],
+                          observed_at=monday_8)
+        self.store.record([], observed_at=datetime(2024, 3, 11, 12, 0))
+        self.store.record([make_location(1, 3, date=date)], observed_at=datetime(2024, 3, 18, 8, 30))
+        self.store.record([make_location(1, 4, date=date)], observed_at=datetime(2024, 3, 19, 7, 0))
+        self.store.flush()
+
+        self.assertEqual(self.store.opening_times(city="edison"), [(0, 8, 2), (1, 7, 1)])
+        self.assertEqual(self.store.opening_times(location_id=2), [(0, 8, 1)])
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        store = HistoryStore(os.path.join(self.directory.name, "small.db"), max_queue=1, metrics=self.metrics)
+        store.close()  # writer stopped: nothing drains the queue any more
+        self.assertTrue(store.record([]))
+        self.assertFalse(store.record([]))
+        self.assertEqual(store.dropped, 1)
+        self.assertEqual(self.metrics.snapshot()["counters"]["history_dropped"], 1)
+
+    def test_unopenable_database_raises(self):
+        with self.assertRaises(sqlite3.OperationalError):
+            HistoryStore(os.path.join(self.directory.name, "missing", "history.db"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from benchmarks.synthetic import build_data, build_page
+from jsonDecoder import AVAILABLE, get_decoder
+from locationRetriever import LocationRetriever
+from model import Location
+from scriptExtractor import extract_script_data
+
+BACKENDS = [name for name, installed in AVAILABLE.items() if installed]
+
+
+def fetch_with(decoder_name, page):
+    retriever = LocationRetriever(decoder=get_decoder(decoder_name))
+    with patch.object(LocationRetriever, "get_page", return_value=page):
+        retriever.fetch_locations(mode="fast")
+    return [location.to_dict() for location in retriever.locations]
+
+
+class TestJSONDecoder(unittest.TestCase):
+    def test_auto_prefers_fastest_installed(self):
+        expected = "msgspec" if AVAILABLE["msgspec"] else "orjson" if AVAILABLE["orjson"] else "stdlib"
+        self.assertEqual(get_decoder().name, expected)
+
+    def test_unknown_or_missing_backend(self):
+        with self.assertRaises(ValueError):
+            get_decoder("simdjson")
+        for name, installed in AVAILABLE.items():
+            if not installed:
+                with self.assertRaises(ValueError):
+                    get_decoder(name)
+
+    def test_loads_matches_stdlib(self):
+        location_data, time_data = extract_script_data(build_page(locations=50, filler_kb=1))
+        expected = get_decoder("stdlib").loads(location_data), get_decoder("stdlib").loads(time_data)
+        for name in BACKENDS:
+            with self.subTest(backend=name):
+                decoder = get_decoder(name)
+                self.assertEqual((decoder.loads(location_data), decoder.loads(time_data)), expected)
+
+    def test_locations_match_stdlib(self):
+        """Every installed backend (typed or not) ends up with exactly the same locations"""
+        page = build_page(locations=200, available_ratio=0.6, filler_kb=1)
+        expected = fetch_with("stdlib", page)
+        self.assertTrue(expected)
+        for name in BACKENDS:
+            with self.subTest(backend=name):
+                self.assertEqual(fetch_with(name, page), expected)
+
+    def test_invalid_json_is_parse_failure(self):
+        for name in BACKENDS:
+            with self.subTest(backend=name):
+                retriever = LocationRetriever(decoder=get_decoder(name))
+                self.assertEqual(retriever.decode_data('[{"Name": ', '[]'), (None, None))
+
+    @unittest.skipUnless(AVAILABLE["msgspec"], "msgspec is not installed (pip install -r requirements-dev.txt)")
+    def test_msgspec_records(self):
+        """Typed decoding keeps only the fields the app reads, and Location.from_record builds the same locations as create_location"""
+        start = datetime(2024, 1, 1, 8, 0)
+        location_data, time_data = build_data(locations=3, available_ratio=1, start=start)
+        retriever = LocationRetriever(decoder=get_decoder("msgspec"))
+        page = build_page(locations=3, available_ratio=1, filler_kb=1, start=start)
+        records, time_dict = retriever.decode_data(*extract_script_data(page))
+
+        self.assertEqual(records[0].Name, location_data[0]["Name"])
+        self.assertFalse(hasattr(records[0], "Lat"))
+        self.assertEqual(records[0].LocAppointments[0].LocationId, time_data[0]["LocationId"])
+        self.assertEqual(time_dict[time_data[0]["LocationId"]].FirstOpenSlot, time_data[0]["FirstOpenSlot"])
+
+        Location.static_cache.clear()
+        typed = Location.from_record(records[0], time_dict[time_data[0]["LocationId"]])
+        Location.static_cache.clear()
+        expected = Location.create_location(location_data[0], time_data[0])
+        self.assertEqual(typed.to_dict(), expected.to_dict())
+
+        with patch.object(Location, "create_location") as create_location:
+            self.assertEqual(len(retriever.get_locations(records, time_dict)), 3)
+        create_location.assert_not_called()
+
+if __name__ == "__main__":
+    unittest.main()
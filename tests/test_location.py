@@ -108,5 +108,39 @@ class TestLocation(unittest.TestCase):
         location_obj = Location.create_location(location_dict, time_dict)
         self.assertIsNone(location_obj)
 
+    def test_location_is_slotted(self):
+        """Location objects don't carry a per-instance __dict__"""
+        location = Location("A", "1 Main St", "Edison", "NJ", "08817", "555-1234", 1, datetime(2024, 3, 15, 9, 0))
+        self.assertFalse(hasattr(location, "__dict__"))
+        with self.assertRaises(AttributeError):
+            location.unknown_field = 1
+
+    def test_static_fields_cached_by_location_id(self):
+        """
+        Static fields are validated once per LocationId and shared between polls, and re-validated when the raw data changes.
+        """
+        Location.static_cache.clear()
+        location_dict = {"Name": " Edison ", "Street1": "1 Main St", "City": "Edison", "State": "NJ",
+                         "Zip": "08817", "PhoneNumber": "555-1234"}
+        time_dict = {"LocationId": 7, "FirstOpenSlot": "5 slots available - Next Available: 03/15/2024 09:00 AM"}
+
+        first = Location.create_location(dict(location_dict), time_dict)
+        second = Location.create_location(dict(location_dict), time_dict)
+        self.assertEqual(first.name, "Edison")
+        self.assertIs(first.name, second.name)
+        self.assertIs(first.next_appointment_date, second.next_appointment_date)
+
+        location_dict["Street1"] = "2 Main St"
+        moved = Location.create_location(location_dict, time_dict)
+        self.assertEqual(moved.street, "2 Main St")
+
+    def test_parse_first_open_slot_memoized(self):
+        Location.parse_first_open_slot.cache_clear()
+        appointment_str = "5 slots available - Next Available: 03/15/2024 09:00 AM"
+        self.assertEqual(Location.parse_first_open_slot(appointment_str), (5, datetime(2024, 3, 15, 9, 0)))
+        Location.parse_first_open_slot(appointment_str)
+        self.assertEqual(Location.parse_first_open_slot.cache_info().hits, 1)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,14 +1,31 @@
+import io
+import json
 import unittest
 from unittest.mock import patch, MagicMock
 
 import requests
 from bs4 import BeautifulSoup
+from benchmarks.synthetic import build_data, build_page
+from circuitBreaker import CircuitBreaker
+from errors import CircuitOpenError, DecodeError, ExtractError, FetchError
 from locationRetriever import LocationRetriever
+from scriptExtractor import ScriptDataExtractor
+from metrics import Metrics
 from model import Location
 from datetime import datetime, timedelta
 
+class CountingStream(io.BytesIO):
+    """Response body remembering how many bytes were read from it"""
+    bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
 class TestLocationRetriever(unittest.TestCase):
-    @patch("locationRetriever.requests.get")  # Mock requests.get()
+    @patch("locationRetriever.requests.Session.get")  # Mock the session used by the retriever
     def test_get_tags_success(self, mock_get):
         """Test get_tags() returns script tags when given a valid HTML response"""
         mock_html = """
@@ -30,7 +47,7 @@ class TestLocationRetriever(unittest.TestCase):
         self.assertIsInstance(script_tags, list)
         self.assertIsInstance(script_tags[0], type(BeautifulSoup().new_tag("script")))  # Check if script tag
 
-    @patch("locationRetriever.requests.get")
+    @patch("locationRetriever.requests.Session.get")
     def test_get_tags_request_failure(self, mock_get):
         """Test get_tags() handles failed requests properly"""
         mock_get.side_effect = requests.RequestException("Network Error")
@@ -40,7 +57,7 @@ class TestLocationRetriever(unittest.TestCase):
 
         self.assertEqual(script_tags, [])  # Should return an empty list
 
-    @patch("locationRetriever.requests.get")
+    @patch("locationRetriever.requests.Session.get")
     def test_get_tags_no_script_tags(self,mock_get):
         """Test get_tags() returns [] when given a HTML with no script tags"""
         mock_html = "<html><head></head><body><p>No scripts here</p></body></html>"
@@ -124,6 +141,25 @@ class TestLocationRetriever(unittest.TestCase):
 
         self.assertEqual(time_data,None)
 
+    def test_find_script_data_matches_separate_finders(self):
+        """The single-pass scanner returns the same payloads as find_location/find_time, in one or separate scripts"""
+        retriever = LocationRetriever()
+        same_script = BeautifulSoup(build_page(locations=5, filler_scripts=10, filler_kb=1), 'html.parser').find_all('script')
+        separate = BeautifulSoup(
+            '<script>var x = 1;</script>'
+            '<script>var timeData = [{"LocationId": 1}]</script>'
+            '<script>var locationData = [{"id": 1}];</script>', 'html.parser').find_all('script')
+
+        for script_tags in (same_script, separate):
+            self.assertEqual(retriever.find_script_data(script_tags),
+                             (retriever.find_location(script_tags), retriever.find_time(script_tags)))
+
+    def test_find_script_data_missing(self):
+        script_tags = [BeautifulSoup('<script>var locationData = [{"id": 1}];</script>', 'html.parser').script]
+        retriever = LocationRetriever()
+        self.assertEqual(retriever.find_script_data(script_tags), ('[{"id": 1}]', None))
+        self.assertEqual(retriever.find_script_data([]), (None, None))
+
     def test_pase_data_valid_data(self):
 
         location_data = '[{"id": 1, "name": "Location A"}]'
@@ -274,6 +310,228 @@ class TestLocationRetriever(unittest.TestCase):
         locations = retriever.get_locations(location_json, time_dict)
         self.assertEqual(locations,[])
 
+    def make_response(self, status_code=200, text="", headers=None):
+        response = MagicMock()
+        response.status_code = status_code
+        response.text = text
+        response.content = text.encode()
+        response.headers = headers or {}
+        return response
+
+    def test_fetch_locations_not_modified(self):
+        """A 304 answer to the conditional request keeps the previous locations without parsing"""
+        page = build_page(locations=10, available_ratio=1)
+        retriever = LocationRetriever()
+        retriever.session.get = MagicMock(return_value=self.make_response(text=page, headers={"ETag": '"v1"'}))
+        self.assertTrue(retriever.fetch_locations())
+        locations = retriever.locations
+
+        retriever.session.get.return_value = self.make_response(status_code=304)
+        with patch.object(LocationRetriever, "parse_data") as mock_parse:
+            self.assertFalse(retriever.fetch_locations())
+        mock_parse.assert_not_called()
+        self.assertIs(retriever.locations, locations)
+        self.assertEqual(retriever.session.get.call_args.kwargs["headers"], {"If-None-Match": '"v1"'})
+
+    def test_fetch_locations_same_body(self):
+        """A 200 with a byte-identical body is short-circuited through the body hash"""
+        page = build_page(locations=10, available_ratio=1)
+        retriever = LocationRetriever()
+        retriever.session.get = MagicMock(return_value=self.make_response(text=page))
+        self.assertTrue(retriever.fetch_locations(mode="fast"))
+        self.assertFalse(retriever.fetch_locations(mode="fast"))
+        self.assertEqual(retriever.session.get.call_args.kwargs["headers"], {})
+
+        retriever.session.get.return_value = self.make_response(text=build_page(locations=12, available_ratio=1))
+        self.assertTrue(retriever.fetch_locations(mode="fast"))
+        self.assertEqual(len(retriever.locations), 12)
+
+    def data_page(self, location_data, time_data, token="a"):
+        return (f"<html><head><meta name=\"csrf\" content=\"{token}\"></head><body><script>\n"
+                f"var locationData = {json.dumps(location_data)};\nvar timeData = {json.dumps(time_data)};\n</script></body></html>")
+
+    def test_fetch_locations_same_payload(self):
+        """A body that only changed outside locationData/timeData keeps the previous locations without decoding"""
+        location_data, time_data = build_data(locations=10, available_ratio=1)
+        metrics = Metrics()
+        retriever = LocationRetriever(metrics=metrics)
+        retriever.session.get = MagicMock(return_value=self.make_response(text=self.data_page(location_data, time_data)))
+        self.assertTrue(retriever.fetch_locations(mode="fast"))
+        locations = retriever.locations
+
+        retriever.session.get.return_value = self.make_response(text=self.data_page(location_data, time_data, token="b"))
+        with patch.object(LocationRetriever, "decode_data") as mock_decode:
+            self.assertFalse(retriever.fetch_locations(mode="fast"))
+        mock_decode.assert_not_called()
+        self.assertIs(retriever.locations, locations)
+        self.assertEqual(metrics.snapshot()["counters"]["payload_hits"], 1)
+
+    def test_fetch_locations_time_data_only(self):
+        """When only timeData changed, locationData isn't decoded again and locations whose slot didn't change are reused"""
+        location_data, time_data = build_data(locations=10, available_ratio=1, start=datetime(2024, 3, 4, 8, 0))
+        metrics = Metrics()
+        retriever = LocationRetriever(metrics=metrics)
+        retriever.session.get = MagicMock(return_value=self.make_response(text=self.data_page(location_data, time_data)))
+        self.assertTrue(retriever.fetch_locations())
+        previous = retriever.locations
+
+        time_data[0] = dict(time_data[0], FirstOpenSlot="1 Appointments Available <br/> Next Available: 03/04/2024 09:00 AM")
+        retriever.session.get.return_value = self.make_response(text=self.data_page(location_data, time_data))
+        with patch.object(LocationRetriever, "decode_data") as mock_decode:
+            self.assertTrue(retriever.fetch_locations())
+        mock_decode.assert_not_called()
+        self.assertEqual(retriever.locations[0].next_appointment_date, datetime(2024, 3, 4, 9, 0))
+        self.assertIsNot(retriever.locations[0], previous[0])
+        for location, old in zip(retriever.locations[1:], previous[1:]):
+            self.assertIs(location, old)
+        counters = metrics.snapshot()["counters"]
+        self.assertEqual((counters["payload_misses"], counters["static_hits"]), (1, 1))
+
+        location_data[0] = dict(location_data[0], Name="Renamed")
+        retriever.session.get.return_value = self.make_response(text=self.data_page(location_data, time_data))
+        self.assertTrue(retriever.fetch_locations())
+        self.assertEqual(retriever.locations[0].name, "Renamed")
+        self.assertEqual(metrics.snapshot()["counters"]["payload_misses"], 2)
+
+    def stream_response(self, body, status_code=200, headers=None):
+        response = requests.Response()
+        response.status_code = status_code
+        response.raw = CountingStream(body.encode())
+        response.headers.update(headers or {"Content-Type": "text/html; charset=utf-8"})
+        return response
+
+    def test_fetch_locations_stream(self):
+        """Stream mode stops reading once both variables are captured and gives the same locations as the soup path"""
+        page = build_page(locations=10, available_ratio=1, filler_kb=500)
+        metrics = Metrics()
+        capture = MagicMock()
+        retriever = LocationRetriever(metrics=metrics, capture=capture, mode="stream")
+        response = self.stream_response(page)
+        retriever.session.get = MagicMock(return_value=response)
+        self.assertTrue(retriever.fetch_locations())
+        self.assertTrue(retriever.session.get.call_args.kwargs["stream"])
+        self.assertLess(response.raw.bytes_read, len(page) // 4)  # the filler after the data was never read
+        self.assertTrue(response.raw.closed)
+        self.assertEqual(metrics.snapshot()["counters"]["early_closes"], 1)
+
+        soup_retriever = LocationRetriever()
+        soup_retriever.session.get = MagicMock(return_value=self.make_response(text=page))
+        soup_retriever.fetch_locations()
+        self.assertEqual([location.to_dict() for location in retriever.locations],
+                         [location.to_dict() for location in soup_retriever.locations])
+
+        # the capture only holds the data, wrapped in a page any mode can replay
+        recorded = capture.write.call_args.args[2]
+        self.assertLess(len(recorded), len(page) // 4)
+        self.assertEqual(LocationRetriever().find_script_data(BeautifulSoup(recorded, "html.parser").find_all("script")),
+                         retriever.find_script_data(BeautifulSoup(page, "html.parser").find_all("script")))
+
+    def test_fetch_locations_stream_not_modified(self):
+        retriever = LocationRetriever(mode="stream")
+        retriever.session.get = MagicMock(return_value=self.stream_response(build_page(locations=5, available_ratio=1),
+                                                                            headers={"ETag": '"v1"'}))
+        self.assertTrue(retriever.fetch_locations())
+        retriever.session.get.return_value = self.stream_response("", status_code=304)
+        self.assertFalse(retriever.fetch_locations())
+        self.assertEqual(retriever.session.get.call_args.kwargs["headers"], {"If-None-Match": '"v1"'})
+
+    def test_stream_missing_data(self):
+        retriever = LocationRetriever()
+        retriever.session.get = MagicMock(return_value=self.stream_response("<html><body>maintenance</body></html>"))
+        with self.assertRaises(ValueError):
+            retriever.fetch_locations(mode="stream")
+        self.assertEqual(retriever.validators, {})
+
+    def test_oversized_payload_is_extract_error(self):
+        """A variable over the extractor's max_payload fails at the extract stage in stream and fast modes"""
+        metrics = Metrics()
+        retriever = LocationRetriever(metrics=metrics)
+        page = build_page(locations=50, available_ratio=1, filler_kb=1)
+        retriever.session.get = MagicMock(return_value=self.stream_response(page))
+        with patch("locationRetriever.ScriptDataExtractor", lambda: ScriptDataExtractor(max_payload=100)):
+            with self.assertRaises(ExtractError) as context:
+                retriever.fetch_locations(mode="stream")
+        self.assertIn("exceeds 100 characters", str(context.exception))
+
+        retriever.session.get = MagicMock(return_value=self.make_response(text=page))
+        with patch("locationRetriever.extract_script_data", side_effect=ValueError("timeData exceeds 100 characters.")):
+            with self.assertRaises(ExtractError):
+                retriever.fetch_locations(mode="fast")
+        self.assertEqual(metrics.snapshot()["counters"]["parse_failures"], 2)
+
+    def test_typed_errors(self):
+        retriever = LocationRetriever()
+        response = requests.Response()
+        response.status_code = 503
+        response.headers["Retry-After"] = "30"
+        retriever.session.get = MagicMock(return_value=response)
+        with self.assertRaises(FetchError) as context:
+            retriever.fetch_locations()
+        self.assertEqual((context.exception.stage, context.exception.status, context.exception.retry_after),
+                         ("network", 503, 30))
+
+        retriever.session.get = MagicMock(return_value=self.make_response(text="<html>maintenance</html>"))
+        with self.assertRaises(ExtractError):
+            retriever.fetch_locations(mode="fast")
+
+        page = "<script>var locationData = [{\"Name\": oops}];\nvar timeData = [{\"LocationId\": 1}];</script>"
+        retriever.session.get = MagicMock(return_value=self.make_response(text=page))
+        with self.assertRaises(DecodeError):
+            retriever.fetch_locations(mode="fast")
+        self.assertIsInstance(retriever.last_error, DecodeError)
+
+    def test_circuit_breaker_stops_requests(self):
+        """After repeated failures no request is made until the breaker lets a probe through; the last good locations stay"""
+        now = [0.0]
+        metrics = Metrics()
+        retriever = LocationRetriever(metrics=metrics, breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60,
+                                                                              clock=lambda: now[0]))
+        retriever.session.get = MagicMock(return_value=self.make_response(text=build_page(locations=5, available_ratio=1)))
+        retriever.fetch_locations()
+        good = retriever.locations
+
+        retriever.session.get = MagicMock(side_effect=requests.ConnectionError("portal down"))
+        for _ in range(2):
+            with self.assertRaises(FetchError):
+                retriever.fetch_locations()
+        with self.assertRaises(CircuitOpenError) as context:
+            retriever.fetch_locations()
+        self.assertEqual(context.exception.retry_after, 60)
+        self.assertEqual(retriever.session.get.call_count, 2)
+        self.assertIs(retriever.locations, good)
+        self.assertIsNotNone(retriever.staleness())
+        self.assertEqual(metrics.snapshot()["counters"]["circuit_rejections"], 1)
+
+        now[0] = 60  # half-open: one probe, which succeeds and closes the circuit
+        retriever.session.get = MagicMock(return_value=self.make_response(text=build_page(locations=7, available_ratio=1)))
+        self.assertTrue(retriever.fetch_locations())
+        self.assertEqual(len(retriever.locations), 7)
+        self.assertIsNone(retriever.last_error)
+
+    def test_failed_parse_keeps_page_unconditional(self):
+        """Validators are only stored after a successful parse, so a bad page is never treated as unchanged"""
+        retriever = LocationRetriever()
+        retriever.session.get = MagicMock(return_value=self.make_response(text="<html></html>", headers={"ETag": '"v1"'}))
+        with self.assertRaises(ValueError):
+            retriever.fetch_locations()
+        self.assertEqual(retriever.validators, {})
+
+    def test_session_asks_for_compression(self):
+        retriever = LocationRetriever()
+        self.assertIn("gzip", retriever.session.headers["Accept-Encoding"])
+
+    def test_get_page_records_retry_after(self):
+        """A 429 answer is reported as a failed request with its status and Retry-After kept on the retriever"""
+        response = requests.Response()
+        response.status_code = 429
+        response.headers["Retry-After"] = "30"
+        retriever = LocationRetriever()
+        retriever.session.get = MagicMock(return_value=response)
+
+        self.assertIsNone(retriever.get_page("https://telegov.njportal.com"))
+        self.assertEqual(retriever.last_status, 429)
+        self.assertEqual(retriever.retry_after, 30)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from benchmarks.synthetic import build_page
+from locationRetriever import Filter, LocationRetriever
+from metrics import DISABLED, Metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def test_stage_and_counters(self):
+        metrics = Metrics()
+        for _ in range(3):
+            with metrics.stage("json"):
+                pass
+        metrics.increment("fetches")
+        metrics.increment("bytes", 1024)
+
+        data = metrics.snapshot()
+        self.assertEqual(data["stages"]["json"]["count"], 3)
+        self.assertGreaterEqual(data["stages"]["json"]["max"], data["stages"]["json"]["last"])
+        self.assertEqual(data["counters"], {"fetches": 1, "bytes": 1024})
+
+    def test_prometheus_format(self):
+        metrics = Metrics()
+        metrics.observe("network", 0.25)
+        metrics.increment("fetches", 2)
+        text = metrics.to_prometheus()
+        self.assertIn('mvc_stage_seconds_count{stage="network"} 1', text)
+        self.assertIn('mvc_stage_seconds_sum{stage="network"} 0.250000', text)
+        self.assertIn("# TYPE mvc_fetches_total counter\nmvc_fetches_total 2", text)
+
+    def test_json_lines(self):
+        metrics = Metrics()
+        metrics.increment("notifications_sent")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metrics.jsonl")
+            metrics.write_json_line(path)
+            metrics.write_json_line(path)
+            with open(path) as file:
+                lines = [json.loads(line) for line in file]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]["counters"], {"notifications_sent": 1})
+
+    def test_disabled_is_noop(self):
+        with DISABLED.stage("network"):
+            DISABLED.increment("fetches")
+        self.assertFalse(DISABLED.enabled)
+        self.assertIs(DISABLED.stage("a"), DISABLED.stage("b"))
+
+    def test_retriever_stages(self):
+        """A fetch records every pipeline stage plus the parsed locations, and Filter records its own stage"""
+        metrics = Metrics()
+        retriever = LocationRetriever(metrics=metrics)
+        with patch.object(LocationRetriever, "get_page", return_value=build_page(locations=20, available_ratio=1)):
+            retriever.fetch_locations()
+        Filter(3, retriever).filter()
+
+        data = metrics.snapshot()
+        self.assertEqual(set(data["stages"]), {"network", "soup", "extract", "json", "model", "filter"})
+        self.assertEqual(data["counters"]["locations_parsed"], 20)
+
+    def test_parse_failure_counted(self):
+        metrics = Metrics()
+        retriever = LocationRetriever(metrics=metrics)
+        with patch.object(LocationRetriever, "get_page", return_value="<html></html>"):
+            with self.assertRaises(ValueError):
+                retriever.fetch_locations(mode="fast")
+        self.assertEqual(metrics.snapshot()["counters"], {"parse_failures": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
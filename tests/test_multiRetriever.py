@@ -0,0 +1,83 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from benchmarks.synthetic import build_page
+from locationRetriever import Filter, LocationRetriever
+from multiRetriever import MultiServiceRetriever
+
+PAGES = {
+    LocationRetriever.wizard_url(12): build_page(locations=5, filler_kb=5, available_ratio=1, seed=1),
+    LocationRetriever.wizard_url(15): build_page(locations=8, filler_kb=5, available_ratio=1, seed=2),
+}
+
+
+class TestMultiServiceRetriever(unittest.TestCase):
+    def test_fetch_all_services(self):
+        """Every service gets its own list of locations, keyed by wizard id"""
+        retriever = MultiServiceRetriever([12, 15])
+        with patch.object(LocationRetriever, "get_page", side_effect=lambda url, conditional=True: PAGES[url]):
+            self.assertTrue(retriever.fetch_locations())
+        retriever.close()
+
+        self.assertEqual(set(retriever.locations), {12, 15})
+        self.assertEqual(len(retriever.locations[12]), 5)
+        self.assertEqual(len(retriever.locations[15]), 8)
+        self.assertEqual(retriever.errors, {})
+
+    def test_concurrency_is_bounded(self):
+        """Services are fetched in parallel but never more than max_concurrency at a time"""
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def slow_page(url, conditional=True):
+            with lock:
+                active.append(url)
+                peak.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.remove(url)
+            return PAGES[LocationRetriever.wizard_url(12)]
+
+        retriever = MultiServiceRetriever(range(1, 7), max_concurrency=3, mode="fast")
+        with patch.object(LocationRetriever, "get_page", side_effect=slow_page):
+            start = time.perf_counter()
+            retriever.fetch_locations()
+            elapsed = time.perf_counter() - start
+        retriever.close()
+
+        self.assertEqual(max(peak), 3)
+        self.assertLess(elapsed, 6 * 0.05)
+
+    def test_failing_service_is_isolated(self):
+        """A service whose page can't be parsed is reported in errors without affecting the others"""
+        pages = {LocationRetriever.wizard_url(12): PAGES[LocationRetriever.wizard_url(12)],
+                 LocationRetriever.wizard_url(99): "<html></html>"}
+        retriever = MultiServiceRetriever([12, 99])
+        with patch.object(LocationRetriever, "get_page", side_effect=lambda url, conditional=True: pages[url]):
+            retriever.fetch_locations()
+        retriever.close()
+
+        self.assertEqual(list(retriever.errors), [99])
+        self.assertEqual(len(retriever.locations[12]), 5)
+        self.assertEqual(retriever.locations[99], [])
+
+    def test_filter_multi_service(self):
+        """Filter returns a dict of service id -> filtered, sorted locations for multi-service retrievers"""
+        retriever = MultiServiceRetriever([12, 15])
+        with patch.object(LocationRetriever, "get_page", side_effect=lambda url, conditional=True: PAGES[url]):
+            retriever.fetch_locations()
+        retriever.close()
+
+        results = Filter(days=365, retriever=retriever).filter()
+        self.assertEqual(set(results), {12, 15})
+        for service, locations in results.items():
+            self.assertEqual(len(locations), len(retriever.locations[service]))
+            dates = [location.next_appointment_date for location in locations]
+            self.assertEqual(dates, sorted(dates))
+
+
+if __name__ == "__main__":
+    unittest.main()
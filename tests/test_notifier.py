@@ -0,0 +1,142 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock
+
+from metrics import Metrics
+from model import Location
+from notifier import (Alert, DesktopSink, Digest, FileSink, NotificationDispatcher, StdoutSink, WebhookSink,
+                      create_sink)
+
+
+def make_alert(location_id):
+    location = Location(f"Edison {location_id}", "1 Main St", "Edison", "NJ", "08817", "732-555-0100", 3,
+                        datetime(2024, 3, 15, 9, 0), location_id)
+    return Alert(f"🎉 Appointment Found at {location.name}!", location)
+
+
+class RecordingSink:
+    def __init__(self, name="recording", delay=0):
+        self.name = name
+        self.delay = delay
+        self.digests = []
+        self.received = threading.Event()
+
+    def send(self, digest):
+        time.sleep(self.delay)
+        self.digests.append(digest)
+        self.received.set()
+
+
+class BrokenSink:
+    name = "broken"
+
+    def send(self, digest):
+        raise OSError("no notification backend")
+
+
+class TestNotificationDispatcher(unittest.TestCase):
+    def test_one_digest_per_cycle(self):
+        sink = RecordingSink()
+        dispatcher = NotificationDispatcher([sink])
+        dispatcher.submit([make_alert(1), make_alert(2), make_alert(3)])
+        dispatcher.submit([])
+        dispatcher.close()
+
+        self.assertEqual(len(sink.digests), 1)
+        digest = sink.digests[0]
+        self.assertEqual(digest.title, "🎉 3 appointment updates!")
+        self.assertEqual(digest.message.splitlines()[0], "Edison 1: 03/15/2024 09:00 AM")
+
+    def test_rate_limited_digests_are_merged(self):
+        """Cycles arriving within min_interval of the last notification are held back and sent as one digest"""
+        sink = RecordingSink()
+        dispatcher = NotificationDispatcher([sink], min_interval=60)
+        dispatcher.submit([make_alert(1)])
+        self.assertTrue(sink.received.wait(2))
+        dispatcher.submit([make_alert(2)])
+        dispatcher.submit([make_alert(3)])
+        time.sleep(0.05)
+        self.assertEqual(len(sink.digests), 1)
+
+        dispatcher.close()  # flushes what the rate limit held back
+        self.assertEqual([len(digest.alerts) for digest in sink.digests], [1, 2])
+
+    def test_rate_limit_per_sink(self):
+        fast, slow = RecordingSink("fast"), RecordingSink("slow")
+        dispatcher = NotificationDispatcher([fast, slow], min_interval={"slow": 60})
+        dispatcher.submit([make_alert(1)])
+        self.assertTrue(slow.received.wait(2))
+        fast.received.clear()
+        dispatcher.submit([make_alert(2)])
+        self.assertTrue(fast.received.wait(2))
+        self.assertEqual((len(fast.digests), len(slow.digests)), (2, 1))
+        dispatcher.close()
+
+    def test_slow_sink_never_blocks_submit(self):
+        sink = RecordingSink(delay=0.3)
+        dispatcher = NotificationDispatcher([sink])
+        start = time.perf_counter()
+        for location_id in range(5):
+            dispatcher.submit([make_alert(location_id)])
+        self.assertLess(time.perf_counter() - start, 0.1)
+        dispatcher.close()
+
+    def test_broken_sink_is_isolated(self):
+        metrics = Metrics()
+        sink = RecordingSink()
+        dispatcher = NotificationDispatcher([BrokenSink(), sink], metrics=metrics)
+        dispatcher.submit([make_alert(1)])
+        dispatcher.close()
+        self.assertEqual(len(sink.digests), 1)
+        self.assertEqual(metrics.snapshot()["counters"], {"notifications_sent": 1, "notification_errors": 1})
+
+    def test_full_queue_drops(self):
+        dispatcher = NotificationDispatcher([RecordingSink()], max_queue=1)
+        dispatcher.close()
+        self.assertTrue(dispatcher.submit([make_alert(1)]))
+        self.assertFalse(dispatcher.submit([make_alert(2)]))
+        self.assertEqual(dispatcher.dropped, 1)
+
+
+class TestSinks(unittest.TestCase):
+    def test_stdout_and_file_write_json_lines(self):
+        digest = Digest([make_alert(1)])
+        stream = io.StringIO()
+        StdoutSink(stream).send(digest)
+        self.assertEqual(json.loads(stream.getvalue())["alerts"][0]["location_id"], 1)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "alerts.jsonl")
+            sink = FileSink(path)
+            sink.send(digest)
+            sink.send(digest)
+            with open(path, encoding="utf-8") as file:
+                lines = [json.loads(line) for line in file]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[0]["title"], "🎉 Appointment Found at Edison 1!")
+
+    def test_webhook_posts_digest(self):
+        session = MagicMock()
+        WebhookSink("http://127.0.0.1:9000/hook", session=session).send(Digest([make_alert(1)]))
+        args, kwargs = session.post.call_args
+        self.assertEqual(args, ("http://127.0.0.1:9000/hook",))
+        self.assertEqual(kwargs["json"]["alerts"][0]["name"], "Edison 1")
+
+    def test_create_sink(self):
+        self.assertIsInstance(create_sink("desktop"), DesktopSink)
+        self.assertIsInstance(create_sink("stdout"), StdoutSink)
+        self.assertEqual(create_sink("file:alerts.jsonl").path, "alerts.jsonl")
+        self.assertEqual(create_sink("webhook:http://localhost:9000/hook").url, "http://localhost:9000/hook")
+        for spec in ("pager", "file:", "desktop:x"):
+            with self.assertRaises(ValueError):
+                create_sink(spec)
+
+
+if __name__ == "__main__":
+    unittest.main()
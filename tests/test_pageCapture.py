@@ -0,0 +1,112 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import MagicMock
+
+import requests
+
+from benchmarks.synthetic import build_page
+from locationRetriever import LocationRetriever
+from notifier import StdoutSink
+from pageCapture import CaptureReplayer, CaptureWriter, read_capture, replay_capture
+
+START = datetime(2024, 3, 4, 8, 0)
+URL_12 = LocationRetriever.wizard_url(12)
+URL_14 = LocationRetriever.wizard_url(14)
+
+
+class TestPageCapture(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "capture.jsonl.gz")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_capture(self, records):
+        writer = CaptureWriter(self.path)
+        for timestamp, url, status, page in records:
+            writer.write(url, status, page, timestamp=timestamp)
+        writer.close()
+
+    def test_round_trip(self):
+        self.write_capture([(1.0, URL_12, 200, "<html>one</html>"), (2.5, URL_12, 304, None)])
+        records = list(read_capture(self.path))
+        self.assertEqual([(record.timestamp, record.status, record.page) for record in records],
+                         [(1.0, 200, "<html>one</html>"), (2.5, 304, None)])
+
+    def test_unclosed_capture_is_readable(self):
+        """A recorder killed before close() leaves a capture readable up to the last flushed page"""
+        writer = CaptureWriter(self.path)
+        writer.write(URL_12, 200, "<html>one</html>", timestamp=1.0)
+        writer.write(URL_12, 200, "<html>two</html>", timestamp=2.0)
+        self.assertEqual([record.page for record in read_capture(self.path)], ["<html>one</html>", "<html>two</html>"])
+        writer.close()
+
+    def test_retriever_records_pages(self):
+        writer = CaptureWriter(self.path)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = build_page(locations=5, filler_kb=1).encode()
+        retriever = LocationRetriever(capture=writer)
+        retriever.session.get = MagicMock(return_value=response)
+        retriever.fetch_locations(mode="fast")
+        writer.close()
+
+        records = list(read_capture(self.path))
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].url, retriever.url)
+        self.assertEqual(records[0].page, response.text)
+
+    def test_replay_pacing(self):
+        self.write_capture([(10.0, URL_12, 200, build_page(locations=3, filler_kb=1)),
+                            (14.0, URL_12, 304, None),
+                            (20.0, URL_12, 200, "<html>broken</html>")])
+        sleeps = []
+        replayer = CaptureReplayer(self.path, speed=2, sleep=sleeps.append)
+        snapshots = list(replayer.snapshots())
+        self.assertEqual(sleeps, [2.0, 3.0])
+        self.assertEqual([snapshot.changed for snapshot in snapshots], [True, False])
+        self.assertEqual(replayer.errors, 1)
+
+        sleeps.clear()
+        list(CaptureReplayer(self.path, sleep=sleeps.append).snapshots())
+        self.assertEqual(sleeps, [])  # as fast as possible
+
+    def test_replay_stream_mode_reads_the_capture(self):
+        """Stream mode extracts from the recorded page, never from the live site"""
+        self.write_capture([(1.0, URL_12, 200, build_page(locations=3, filler_kb=64)), (2.0, URL_12, 304, None)])
+        replayer = CaptureReplayer(self.path, mode="stream")
+        snapshots = list(replayer.snapshots())
+        self.assertEqual([snapshot.changed for snapshot in snapshots], [True, False])
+        self.assertEqual([location.to_dict() for location in snapshots[0].locations[12]],
+                         [location.to_dict() for location in next(CaptureReplayer(self.path).snapshots()).locations[12]])
+        self.assertIsNone(replayer.retrievers[URL_12].last_status)  # no request was sent
+
+    def test_replay_multiple_services(self):
+        self.write_capture([(1.0, URL_12, 200, build_page(locations=3, filler_kb=1)),
+                            (1.1, URL_14, 200, build_page(locations=4, seed=1, filler_kb=1))])
+        snapshots = list(CaptureReplayer(self.path).snapshots())
+        self.assertEqual(list(snapshots[-1].locations), [12, 14])
+
+    def test_replay_capture_uses_recorded_time(self):
+        """Filtering is relative to each page's recorded time, so old captures still produce their original matches"""
+        records = []
+        for index in range(20):
+            page = build_page(locations=30, seed=index % 3, available_ratio=0.5, filler_kb=1, start=START)
+            records.append((START.timestamp() + 60 * index, URL_12, 200, page))
+        self.write_capture(records)
+
+        stats = replay_capture(self.path, days=60)
+        self.assertEqual(stats["snapshots"], 20)
+        self.assertEqual(stats["errors"], 0)
+        self.assertGreater(stats["alerts"], 0)
+        self.assertGreaterEqual(stats["events"], stats["alerts"])
+
+        with open(os.path.join(self.directory.name, "alerts.jsonl"), "w") as stream:
+            self.assertEqual(replay_capture(self.path, days=60, sinks=[StdoutSink(stream)])["alerts"], stats["alerts"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import random
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from historyStore import HistoryStore
+from releaseAnalytics import ReleaseAnalytics
+from scheduler import PollScheduler
+from tests.helpers import make_location
+
+MONDAY = datetime(2024, 3, 4)  # a Monday
+
+
+def simulate(analytics, days, step=timedelta(minutes=15)):
+    """Polls every step for days; location 1 gets slots every day at 08:00 and they're taken at 08:45."""
+    moment = MONDAY
+    while moment < MONDAY + timedelta(days=days):
+        open_now = moment.hour == 8 and moment.minute < 45
+        analytics.update([make_location(1, days=30)] if open_now else [], now=moment)
+        moment += step
+
+
+class TestReleaseAnalytics(unittest.TestCase):
+    def test_learns_release_window_and_duration(self):
+        analytics = ReleaseAnalytics(min_days=7)
+        simulate(analytics, days=7)
+
+        self.assertTrue(analytics.ready)
+        self.assertEqual(analytics.predicted_windows(), [(None, 8)])  # one week: only the daily pattern is reliable
+        self.assertEqual(analytics.predicted_windows(key=1), [(None, 8)])
+        self.assertTrue(analytics.is_predicted(2, 8))
+        self.assertEqual(analytics.release_rate(None, 8), 1.0)
+        self.assertEqual(analytics.release_rate(0, 8), 1.0)
+        self.assertEqual(analytics.release_rate(0, 12), 0.0)
+        self.assertEqual(analytics.mean_duration(0, 8), 45 * 60)
+
+        self.assertTrue(analytics.is_release_window(MONDAY + timedelta(days=7, hours=7, minutes=57)))
+        self.assertFalse(analytics.is_release_window(MONDAY + timedelta(days=7, hours=12)))
+
+    def test_first_snapshot_is_not_a_release(self):
+        analytics = ReleaseAnalytics()
+        analytics.update([make_location(1, days=30)], now=MONDAY)
+        self.assertEqual(analytics.buckets, {})
+        analytics.update([make_location(1, 5, days=30), make_location(2, days=30)], now=MONDAY + timedelta(minutes=10))
+        self.assertEqual(analytics.buckets[(None, 0, 0)].releases, 2)
+        self.assertEqual(analytics.buckets[(1, None, 0)].releases, 1)
+
+    def test_weekday_windows_need_several_weeks(self):
+        analytics = ReleaseAnalytics(min_days=1)
+        moment = MONDAY
+        while moment < MONDAY + timedelta(weeks=3):
+            open_now = moment.weekday() == 2 and moment.hour == 14
+            analytics.update([make_location(1, days=30)] if open_now else [], now=moment)
+            moment += timedelta(minutes=30)
+        self.assertEqual(analytics.predicted_windows(), [(2, 14)])
+        self.assertFalse(analytics.is_predicted(3, 14))
+
+    def test_from_history_matches_live(self):
+        """Replaying a history database gives the same release statistics as watching the polls live"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "history.db")
+            store = HistoryStore(path, max_queue=1000)
+            live = ReleaseAnalytics()
+            moment = MONDAY
+            while moment < MONDAY + timedelta(days=3):
+                locations = [make_location(1, days=30)] if moment.hour == 8 and moment.minute < 45 else []
+                store.record(locations, observed_at=moment)
+                live.update(locations, now=moment)
+                moment += timedelta(minutes=15)
+            store.close()
+            replayed = ReleaseAnalytics.from_history(path)
+
+        self.assertEqual(replayed.predicted_windows(), live.predicted_windows())
+        self.assertEqual(replayed.mean_duration(1, 8), live.mean_duration(1, 8))
+        self.assertEqual(replayed.days_observed, live.days_observed)
+
+    def test_predictive_scheduler_cuts_requests(self):
+        """Once trained, a day of polling costs an order of magnitude fewer requests and still polls fast at 08:00"""
+        analytics = ReleaseAnalytics()
+        simulate(analytics, days=7)
+        scheduler = PollScheduler(10, max_interval=600, jitter=0, rng=random.Random(0), analytics=analytics)
+
+        moment, end, polls, fast_at_release = MONDAY + timedelta(days=7), MONDAY + timedelta(days=8), 0, False
+        while moment < end:
+            delay = scheduler.next_delay(moment)
+            fast_at_release |= moment.hour == 8 and delay <= scheduler.interval
+            moment += timedelta(seconds=delay)
+            polls += 1
+        self.assertLess(polls, 24 * 3600 / 10 / 10)
+        self.assertTrue(fast_at_release)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import random
+import unittest
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+from scheduler import PollScheduler, parse_retry_after
+
+
+def make_scheduler(**kwargs):
+    return PollScheduler(10, jitter=0, rng=random.Random(0), **kwargs)
+
+
+class TestPollScheduler(unittest.TestCase):
+    def test_base_interval(self):
+        scheduler = make_scheduler()
+        scheduler.record_success(changed=True)
+        scheduler.burst_remaining = 0
+        self.assertEqual(scheduler.next_delay(datetime(2024, 3, 15, 12, 0)), 10)
+
+    def test_failures_back_off_exponentially(self):
+        """Consecutive failures grow the (jittered) delay up to max_interval and a success resets it"""
+        scheduler = make_scheduler(max_interval=100)
+        delays = []
+        for _ in range(6):
+            scheduler.record_failure(status=503)
+            delays.append(scheduler.next_delay())
+        for failures, delay in enumerate(delays, start=1):
+            upper = min(100, 10 * 2 ** failures)
+            self.assertTrue(upper / 2 <= delay <= upper, (failures, delay))
+        scheduler.record_success(changed=True)
+        self.assertLessEqual(scheduler.next_delay(), 10)
+
+    def test_retry_after_is_honored(self):
+        scheduler = make_scheduler()
+        scheduler.record_failure(status=429, retry_after=300)
+        self.assertEqual(scheduler.next_delay(), 300)
+
+    def test_relaxes_when_nothing_changes(self):
+        scheduler = make_scheduler(relax_after=2, relax_factor=2, max_interval=60)
+        now = datetime(2024, 3, 15, 12, 0)
+        delays = []
+        for _ in range(6):
+            scheduler.record_success(changed=False)
+            delays.append(scheduler.next_delay(now))
+        self.assertEqual(delays, [10, 10, 20, 40, 60, 60])
+
+    def test_burst_after_changes(self):
+        """Seeing slots switches to burst_interval for burst_cycles polls"""
+        scheduler = make_scheduler(burst_interval=2, burst_cycles=3)
+        now = datetime(2024, 3, 15, 12, 0)
+        scheduler.record_success(found=True)
+        self.assertEqual([scheduler.next_delay(now) for _ in range(4)], [2, 2, 2, 10])
+
+    def test_burst_around_release_times(self):
+        scheduler = make_scheduler(burst_interval=2, burst_times=["08:00", "23:58"], burst_window=5)
+        self.assertEqual(scheduler.next_delay(datetime(2024, 3, 15, 7, 57)), 2)
+        self.assertEqual(scheduler.next_delay(datetime(2024, 3, 15, 8, 10)), 10)
+        self.assertEqual(scheduler.next_delay(datetime(2024, 3, 16, 0, 1)), 2)  # window crossing midnight
+
+    def test_wait_counts_from_poll_start(self):
+        """The time spent polling is taken off the wait, so polls start every interval however long a fetch takes"""
+        clock = [100.0]
+        scheduler = make_scheduler(clock=lambda: clock[0])
+        starts = []
+        for fetch_time in (3.0, 0.5, 12.0):
+            starts.append(scheduler.start_poll())
+            clock[0] += fetch_time
+            wait = scheduler.next_wait(datetime(2024, 3, 15, 12, 0))
+            self.assertAlmostEqual(clock[0] + wait, max(starts[-1] + 10, clock[0]))
+            clock[0] += wait + 0.01  # the sleep overshoots a little
+        self.assertEqual(starts, [100.0, 110.0, 120.0])  # on schedule despite the overshoot
+        self.assertAlmostEqual(scheduler.start_poll(), 132.02)  # an overrun poll isn't caught up with a burst
+
+
+class TestParseRetryAfter(unittest.TestCase):
+    def test_seconds(self):
+        self.assertEqual(parse_retry_after("120"), 120)
+
+    def test_http_date(self):
+        date = datetime.now(timezone.utc) + timedelta(seconds=60)
+        self.assertAlmostEqual(parse_retry_after(format_datetime(date, usegmt=True)), 60, delta=2)
+
+    def test_invalid(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from unittest.mock import patch
+
+from benchmarks.synthetic import build_page
+from locationRetriever import LocationRetriever
+from scriptExtractor import ScriptDataExtractor, extract_script_data
+
+PAGE = """
+<html><head><script>var other = [1, 2];</script></head>
+<body>
+<script>
+var locationData = [{"Name": "Edison", "LocAppointments": [{"LocationId": 101}], "Note": "a ] and a \\" inside"}];
+var timeData = [{"LocationId": 101, "FirstOpenSlot": "5 Appointments Available <br/> Next Available: 03/15/2024 09:00 AM"}];
+</script>
+</body></html>
+"""
+LOCATION_DATA = '[{"Name": "Edison", "LocAppointments": [{"LocationId": 101}], "Note": "a ] and a \\" inside"}]'
+TIME_DATA = '[{"LocationId": 101, "FirstOpenSlot": "5 Appointments Available <br/> Next Available: 03/15/2024 09:00 AM"}]'
+
+
+class TestScriptDataExtractor(unittest.TestCase):
+    def test_extract_whole_page(self):
+        """Both array literals are captured, including nested arrays and brackets/quotes inside strings."""
+        location_data, time_data = extract_script_data(PAGE)
+        self.assertEqual(location_data, LOCATION_DATA)
+        self.assertEqual(time_data, TIME_DATA)
+
+    def test_extract_chunked(self):
+        """Feeding the page in arbitrary small chunks gives the same result as feeding it at once."""
+        for size in (1, 2, 7, 64):
+            extractor = ScriptDataExtractor()
+            for start in range(0, len(PAGE), size):
+                extractor.feed(PAGE[start:start + size])
+            self.assertEqual(extractor.get("locationData"), LOCATION_DATA)
+            self.assertEqual(extractor.get("timeData"), TIME_DATA)
+
+    def test_stops_when_done(self):
+        """feed() reports completion as soon as both variables are found and ignores later chunks."""
+        extractor = ScriptDataExtractor()
+        end = PAGE.index("</script>\n</body>")
+        self.assertTrue(extractor.feed(PAGE[:end]))
+        self.assertTrue(extractor.feed('var timeData = [{"LocationId": 999}];'))
+        self.assertEqual(extractor.get("timeData"), TIME_DATA)
+
+    def test_missing_variable(self):
+        """Variables that never show up come back as None."""
+        location_data, time_data = extract_script_data("<script>var timeData = [];</script>")
+        self.assertIsNone(location_data)
+        self.assertEqual(time_data, "[]")
+        self.assertFalse(ScriptDataExtractor().feed("<html></html>"))
+
+    def test_payload_limit(self):
+        """An unterminated array raises instead of buffering forever."""
+        extractor = ScriptDataExtractor(max_payload=100)
+        with self.assertRaises(ValueError):
+            extractor.feed("var locationData = [" + "1, " * 100)
+
+    def test_matches_soup_path(self):
+        """The fast scanner returns exactly what the soup + regex path returns on a generated page."""
+        page = build_page(locations=200, filler_kb=50)
+        retriever = LocationRetriever()
+        with patch.object(LocationRetriever, "get_page", return_value=page):
+            script_tags = retriever.get_tags("Doesn't matter!")
+        self.assertEqual(extract_script_data(page), (retriever.find_location(script_tags), retriever.find_time(script_tags)))
+
+    def test_fetch_locations_fast_mode(self):
+        """fetch_locations(mode="fast") produces the same locations as the default soup mode."""
+        page = build_page(locations=50, filler_kb=10)
+        with patch.object(LocationRetriever, "get_page", return_value=page):
+            soup_retriever = LocationRetriever()
+            soup_retriever.fetch_locations()
+            fast_retriever = LocationRetriever()
+            fast_retriever.fetch_locations(mode="fast")
+        self.assertEqual([str(loc) for loc in soup_retriever.locations], [str(loc) for loc in fast_retriever.locations])
+        self.assertTrue(fast_retriever.locations)
+
+
+if __name__ == "__main__":
+    unittest.main()
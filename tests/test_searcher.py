@@ -0,0 +1,63 @@
+import unittest
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock
+
+from geoIndex import GeoFilter, OrderedIndex
+from metrics import DISABLED
+from model import Location
+from scheduler import PollScheduler
+from searcher import poll_loop
+
+NOW = datetime(2024, 3, 4, 8, 0)
+
+
+class SnapshotRetriever:
+    """Serves the same snapshot list on every poll, then a changed one with a slot inside the window"""
+    def __init__(self, polls):
+        self.snapshot = [Location("Newark", "1 Main St", "Newark", "NJ", "07102", "N/A", 3, NOW + timedelta(days=30), 1)]
+        self.locations = self.snapshot
+        self.fetched_at = None
+        self.polls = polls
+        self.fetches = 0
+
+    def fetch_locations(self):
+        self.fetches += 1
+        self.fetched_at = NOW
+        if self.fetches == self.polls:
+            self.locations = self.snapshot + [
+                Location("Rahway", "1 Main St", "Rahway", "NJ", "07065", "N/A", 1, NOW + timedelta(days=1), 2)]
+        return self.fetches in (1, self.polls)
+
+
+class RecordingDispatcher:
+    def __init__(self):
+        self.alerts = []
+
+    def submit(self, alerts):
+        self.alerts.extend(alerts)
+
+
+class TestPollLoop(unittest.TestCase):
+    def test_filter_is_reused_across_polls(self):
+        """The GeoFilter is built once, so its OrderedIndex is only rebuilt when the snapshot changes"""
+        retriever = SnapshotRetriever(polls=3)
+        filters = []
+
+        def make_filter():
+            filters.append(GeoFilter(7, retriever, origin="08817", order="score", clock=lambda: NOW))
+            return filters[-1]
+
+        dispatcher = RecordingDispatcher()
+        with redirect_stdout(StringIO()), mock.patch("searcher.time.sleep"), \
+                mock.patch("geoIndex.OrderedIndex", wraps=OrderedIndex) as built:
+            poll_loop(7, retriever, None, PollScheduler(1), DISABLED, None, None, dispatcher, make_filter)
+        self.assertEqual(retriever.fetches, 3)
+        self.assertEqual(len(filters), 1)
+        self.assertEqual(built.call_count, 2)  # first snapshot and the changed one
+        self.assertEqual([alert.location.name for alert in dispatcher.alerts], ["Rahway"])
+
+
+if __name__ == "__main__":
+    unittest.main()
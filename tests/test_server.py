@@ -0,0 +1,113 @@
+import json
+import threading
+import unittest
+import urllib.request
+from datetime import datetime
+
+from slotParser import portal_now
+from server import AppointmentHTTPServer, AppointmentService, run_server
+from snapshotCache import SnapshotCache
+from tests.helpers import make_location
+
+
+class StaticRetriever:
+    """Retriever returning the snapshots it's given, one per fetch"""
+    def __init__(self, snapshots):
+        self.snapshots = list(snapshots)
+        self.locations = []
+        self.fetched_at = None
+
+    def fetch_locations(self):
+        if self.snapshots:
+            self.locations = self.snapshots.pop(0)
+        self.fetched_at = datetime.now()
+        return True
+
+
+class TestAppointmentService(unittest.TestCase):
+    def setUp(self):
+        now = portal_now()
+        newark = dict(city="Newark", zip_code="07102", now=now)
+        self.first = [make_location(1, days=1, now=now), make_location(2, days=5, **newark), make_location(3, days=20, now=now)]
+        self.second = [make_location(1, days=0.5, now=now), make_location(2, days=5, **newark)]
+        self.service = AppointmentService(SnapshotCache(StaticRetriever([self.first, self.second])))
+
+    def test_query(self):
+        self.service.poll()
+        self.assertEqual([loc["location_id"] for loc in self.service.query()], [1, 2, 3])
+        self.assertEqual([loc["location_id"] for loc in self.service.query(days=7)], [1, 2])
+        self.assertEqual([loc["location_id"] for loc in self.service.query(city="edison")], [1, 3])
+        self.assertEqual([loc["location_id"] for loc in self.service.query(zip_code="07102")], [2])
+
+    def test_events(self):
+        self.service.poll()
+        last_id, events = self.service.events_since(0)
+        self.assertEqual(last_id, 3)
+        self.assertEqual([event.kind for _, event in events], ["new"] * 3)
+
+        self.service.poll()
+        last_id, events = self.service.events_since(3)
+        self.assertEqual([(event.kind, event.key) for _, event in events], [("earlier", 1), ("gone", 3)])
+
+    def test_failed_poll_keeps_last_snapshot(self):
+        self.service.poll()
+        self.service.cache.retriever.fetch_locations = lambda: (_ for _ in ()).throw(ValueError("portal down"))
+        self.service.poll()
+        self.assertEqual(str(self.service.last_error), "portal down")
+        self.assertEqual([loc["location_id"] for loc in self.service.query()], [1, 2, 3])
+
+    def test_long_poll_wakes_on_new_events(self):
+        self.service.poll()
+        timer = threading.Timer(0.05, self.service.poll)
+        timer.start()
+        last_id, events = self.service.events_since(3, timeout=5)
+        timer.join()
+        self.assertEqual(len(events), 2)
+
+
+class TestAppointmentHTTPServer(unittest.TestCase):
+    def setUp(self):
+        now = portal_now()
+        retriever = StaticRetriever([[make_location(1, days=1, now=now),
+                                      make_location(2, days=5, city="Newark", zip_code="07102", now=now)]])
+        self.service = AppointmentService(SnapshotCache(retriever))
+        self.service.poll()
+        self.server = AppointmentHTTPServer(("127.0.0.1", 0), self.service)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_port}"
+
+    def tearDown(self):
+        self.service.stop()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get(self, path):
+        with urllib.request.urlopen(self.base + path, timeout=5) as response:
+            return json.loads(response.read())
+
+    def test_appointments_endpoint(self):
+        body = self.get("/appointments?days=2&city=Edison")
+        self.assertEqual(body["count"], 1)
+        self.assertEqual(body["locations"][0]["name"], "Edison 1")
+
+    def test_bad_parameter(self):
+        with self.assertRaises(urllib.error.HTTPError) as context:
+            self.get("/appointments?days=abc")
+        self.assertEqual(context.exception.code, 400)
+
+    def test_events_endpoint(self):
+        body = self.get("/events?since=0&timeout=0")
+        self.assertEqual(body["last_id"], 2)
+        self.assertEqual([event["kind"] for event in body["events"]], ["new", "new"])
+        self.assertEqual(self.get("/events")["events"], [])
+
+
+class TestRunServer(unittest.TestCase):
+    def test_record_with_workers_is_rejected(self):
+        """Workers fetch in other processes, so a capture would silently stay empty"""
+        with self.assertRaises(ValueError):
+            run_server(port=0, record_path="capture.jsonl.gz", workers=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,249 @@
+import math
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+
+from benchmarks.synthetic import build_page
+from errors import FetchError
+from metrics import Metrics
+from model import Location
+from pageCapture import ReplayRetriever
+from scheduler import PollScheduler
+from shardedPoller import HEADER, NO_STATUS, UNKNOWN_ERROR, ShardedPoller, SnapshotArray, poll_worker
+
+START = datetime(2024, 3, 4, 8, 0)
+CRASH_MARKER = os.path.join(tempfile.gettempdir(), "sharded-poller-crash-marker")  # same path in spawned workers
+
+
+class CrashOnWrite(Location):
+    """Location that kills its worker while SnapshotArray.write is packing it, i.e. with the sequence left odd."""
+    __slots__ = ()
+
+    @property
+    def next_appointment_date(self):
+        open(CRASH_MARKER, "w").close()
+        os._exit(1)
+
+    @next_appointment_date.setter
+    def next_appointment_date(self, value):
+        pass
+
+
+class CrashMidWriteRetriever(ReplayRetriever):
+    def fetch_locations(self, mode=None):
+        changed = super().fetch_locations(mode)
+        if not os.path.exists(CRASH_MARKER):
+            self.locations = self.locations[:1] + [CrashOnWrite("Crash", "St", "Town", "NJ", "07001", "N/A", 1, None, 0)]
+        return changed
+
+
+def replay_retriever(service_id):
+    """Picklable retriever factory for the workers: every service serves a synthetic page of service_id locations."""
+    return ReplayRetriever(page=build_page(locations=service_id, seed=service_id, available_ratio=1.0, filler_kb=1,
+                                        start=START))
+
+
+def crash_mid_write_retriever(service_id):
+    return CrashMidWriteRetriever(page=build_page(locations=service_id, seed=service_id, available_ratio=1.0, filler_kb=1,
+                                                  start=START))
+
+
+def failing_retriever(service_id):
+    return ReplayRetriever(page=None)  # every fetch fails without an HTTP status, like a connection error
+
+
+def crash_once_retriever(service_id):
+    """Kills its worker the first time, like a segfault or the OOM killer would, then behaves."""
+    if not os.path.exists(CRASH_MARKER):
+        open(CRASH_MARKER, "w").close()
+        os._exit(1)
+    return replay_retriever(service_id)
+
+
+def wait_for(condition, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def published(poller):
+    poller.fetch_locations()
+    return all(poller.locations.values())
+
+
+class TestSnapshotArray(unittest.TestCase):
+    def setUp(self):
+        self.array = SnapshotArray(capacity=4, create=True)
+
+    def tearDown(self):
+        self.array.close()
+
+    def test_round_trip(self):
+        locations = [
+            Location("Edison", "1 Main St", "Edison", "NJ", "08817", "732-555-0100", 3, datetime(2024, 3, 5, 9, 20), 101),
+            Location("Lodi", "N/A", "Lodi", "NJ", "N/A", "N/A", None, "Unknown", None),
+        ]
+        self.assertEqual(self.array.write(locations, START), 2)
+        sequence, fetched_at, read = self.array.read()
+        self.assertEqual(sequence, 2)
+        self.assertEqual(fetched_at, START)
+        self.assertEqual([location.to_dict() for location in read], [location.to_dict() for location in locations])
+
+    def test_other_process_view_and_capacity(self):
+        """A second attachment by name sees the writes without any copy being sent to it"""
+        reader = SnapshotArray(self.array.name)
+        locations = [Location(f"Loc {i}", "St", "Town", "NJ", "07001", "N/A", i, START, i) for i in range(6)]
+        self.assertEqual(self.array.write(locations), 4)
+        self.assertEqual([location.name for location in reader.read()[2]], ["Loc 0", "Loc 1", "Loc 2", "Loc 3"])
+        reader.memory.close()
+
+    def test_error_keeps_locations(self):
+        self.array.write([Location("Edison", "St", "Edison", "NJ", "08817", "N/A", 1, START, 1)], START)
+        self.array.write_error(503, 30.0)
+        sequence, _, count, status, retry_after = self.array.header()
+        self.assertEqual((sequence, count, status, retry_after), (2, 1, 503, 30.0))
+        self.assertEqual(len(self.array.read()[2]), 1)
+
+    def test_clear_error(self):
+        self.array.write([Location("Edison", "St", "Edison", "NJ", "08817", "N/A", 1, START, 1)], START)
+        self.array.write_error(503, 30.0)
+        self.array.clear_error()
+        sequence, _, count, status, retry_after = self.array.header()
+        self.assertEqual((sequence, count, status), (2, 1, NO_STATUS))
+        self.assertTrue(math.isnan(retry_after))
+
+    def read_with_timeout(self, timeout=2):
+        result = []
+        reader = threading.Thread(target=lambda: result.append(self.array.read()), daemon=True)
+        reader.start()
+        reader.join(timeout)
+        self.assertTrue(result, "read() didn't return")
+        return result[0]
+
+    def test_write_after_crash_mid_write(self):
+        """A writer that died with the sequence odd doesn't invert the seqlock for the next one"""
+        HEADER.pack_into(self.array.memory.buf, 0, 1, 0.0, 0, 0, 0.0)
+        self.array.write([Location("Edison", "St", "Edison", "NJ", "08817", "N/A", 1, START, 1)], START)
+        sequence, _, locations = self.read_with_timeout()
+        self.assertEqual(sequence % 2, 0)
+        self.assertEqual([location.name for location in locations], ["Edison"])
+
+    def test_recover(self):
+        self.array.write([Location("Edison", "St", "Edison", "NJ", "08817", "N/A", 1, START, 1)], START)
+        self.assertFalse(self.array.recover())
+        HEADER.pack_into(self.array.memory.buf, 0, 3, 0.0, 1, 0, 0.0)  # died while rewriting the record
+        self.assertTrue(self.array.recover())
+        self.assertEqual(self.read_with_timeout(), (4, None, []))
+
+
+class FlakyRetriever(ReplayRetriever):
+    """Succeeds, fails once, then serves the same page again; stops the worker after its third fetch."""
+    def __init__(self, stop):
+        super().__init__(page=build_page(locations=2, seed=2, available_ratio=1.0, filler_kb=1, start=START))
+        self.stop = stop
+        self.fetches = 0
+
+    def fetch_locations(self, mode=None):
+        self.fetches += 1
+        if self.fetches == 2:
+            raise FetchError("Service unavailable", status=503)
+        if self.fetches == 3:
+            self.stop.set()
+        return super().fetch_locations(mode)
+
+
+class TestPollWorker(unittest.TestCase):
+    def test_unchanged_success_clears_error(self):
+        """A fetch that succeeds after a failure clears the status even when the page didn't change"""
+        array = SnapshotArray(capacity=4, create=True)
+        stop = threading.Event()
+        retriever = FlakyRetriever(stop)
+        try:
+            poll_worker({2: array.name}, PollScheduler(0), "fast", stop, retriever_factory=lambda service_id: retriever)
+            self.assertEqual(retriever.fetches, 3)
+            sequence, _, count, status, _ = array.header()
+            self.assertEqual((sequence, count, status), (2, 2, NO_STATUS))
+        finally:
+            array.close()
+
+
+class TestShardedPoller(unittest.TestCase):
+    def test_workers_publish_snapshots(self):
+        poller = ShardedPoller([5, 7, 9], workers=2, interval=60, mode="fast", retriever_factory=replay_retriever).start()
+        try:
+            self.assertEqual([sorted(shard) for shard in poller.shards], [[5, 9], [7]])
+            self.assertTrue(wait_for(lambda: published(poller)))
+            self.assertEqual({service: len(locations) for service, locations in poller.locations.items()},
+                             {5: 5, 7: 7, 9: 9})
+            snapshot = poller.locations
+            self.assertFalse(poller.fetch_locations())
+            self.assertIs(poller.locations, snapshot)  # unchanged arrays aren't decoded again
+            self.assertIsNone(poller.last_status)
+        finally:
+            poller.close()
+
+    def test_nothing_published_yet_is_not_a_failure(self):
+        poller = ShardedPoller([5], interval=60, retriever_factory=replay_retriever)  # workers not started
+        try:
+            self.assertFalse(poller.fetch_locations())
+            self.assertEqual(poller.errors, {})
+            self.assertEqual(poller.locations, {5: []})
+        finally:
+            poller.close()
+
+    def test_crashed_worker_is_restarted(self):
+        if os.path.exists(CRASH_MARKER):
+            os.remove(CRASH_MARKER)
+        metrics = Metrics()
+        poller = ShardedPoller([3], interval=60, restart_delay=0.1, retriever_factory=crash_once_retriever,
+                               metrics=metrics)
+        try:
+            poller.start()
+            self.assertTrue(wait_for(lambda: published(poller)))
+            self.assertEqual(poller.restarts, 1)
+            self.assertEqual(metrics.snapshot()["counters"]["worker_restarts"], 1)
+        finally:
+            poller.close()
+            if os.path.exists(CRASH_MARKER):
+                os.remove(CRASH_MARKER)
+
+    def test_worker_crashed_mid_write_is_recovered(self):
+        if os.path.exists(CRASH_MARKER):
+            os.remove(CRASH_MARKER)
+        poller = ShardedPoller([3], interval=60, restart_delay=0.1, retriever_factory=crash_mid_write_retriever)
+        try:
+            poller.start()
+            self.assertTrue(wait_for(lambda: published(poller)))
+            self.assertEqual(poller.restarts, 1)
+            self.assertEqual(len(poller.locations[3]), 3)
+        finally:
+            poller.close()
+            if os.path.exists(CRASH_MARKER):
+                os.remove(CRASH_MARKER)
+
+    def test_worker_failures_are_reported(self):
+        """Failures without an HTTP status still reach the supervisor"""
+        scheduler = PollScheduler(60, max_interval=120)
+        poller = ShardedPoller([3], retriever_factory=failing_retriever, scheduler=scheduler).start()
+        try:
+            def failed():
+                try:
+                    poller.fetch_locations()
+                except FetchError:
+                    return True
+                return False
+            self.assertTrue(wait_for(failed))
+            self.assertEqual(poller.errors, {3: UNKNOWN_ERROR})
+            self.assertIsNone(poller.last_status)
+        finally:
+            poller.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import random
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from slotParser import SLOT_FORMAT, parse_slot_date, parse_slot_dates, parse_time_data, portal_now, portal_zone
+
+
+def strptime_outcome(text):
+    try:
+        return datetime.strptime(text, SLOT_FORMAT)
+    except Exception as e:
+        return type(e), str(e)
+
+
+def fast_outcome(text):
+    try:
+        return parse_slot_date(text)
+    except Exception as e:
+        return type(e), str(e)
+
+
+def random_slot_string(rng):
+    """Portal-formatted date, sometimes mutated into something strptime may or may not accept."""
+    date = datetime(2000, 1, 1) + timedelta(minutes=rng.randrange(60 * 24 * 366 * 40))
+    text = date.strftime(SLOT_FORMAT)
+    mutation = rng.randrange(8)
+    if mutation == 0:  # random character replacement
+        index = rng.randrange(len(text))
+        text = text[:index] + rng.choice("0123456789/: APMapmx1٣") + text[index + 1:]
+    elif mutation == 1:  # lowercase meridiem / unpadded fields
+        text = text.lower().replace("/0", "/").lstrip("0")
+    elif mutation == 2:  # out of range fields
+        text = f"{rng.randrange(0, 14):02d}/{rng.randrange(0, 33):02d}/{rng.randrange(1, 9999):04d} " \
+               f"{rng.randrange(0, 14):02d}:{rng.randrange(0, 62):02d} {rng.choice(['AM', 'PM', 'XM'])}"
+    elif mutation == 3:  # truncated or padded
+        text = text[:rng.randrange(len(text))] if rng.random() < 0.5 else text + rng.choice([" ", "x", "0"])
+    return text
+
+
+class TestSlotParser(unittest.TestCase):
+    def test_equivalent_to_strptime(self):
+        """
+        Property-style check: for thousands of generated strings (valid, mutated and invalid) the fast parser
+        returns the same datetime, or raises the same error type and message, as datetime.strptime.
+        """
+        rng = random.Random(1234)
+        for _ in range(20000):
+            text = random_slot_string(rng)
+            self.assertEqual(fast_outcome(text), strptime_outcome(text), text)
+
+    def test_known_values(self):
+        self.assertEqual(parse_slot_date("03/15/2024 09:00 AM"), datetime(2024, 3, 15, 9, 0))
+        self.assertEqual(parse_slot_date("03/15/2024 12:05 AM"), datetime(2024, 3, 15, 0, 5))
+        self.assertEqual(parse_slot_date("03/15/2024 12:05 PM"), datetime(2024, 3, 15, 12, 5))
+        self.assertEqual(parse_slot_date("03/15/2024 01:30 pm"), datetime(2024, 3, 15, 13, 30))
+        with self.assertRaises(ValueError):
+            parse_slot_date("02/30/2024 09:00 AM")
+
+    def test_parse_slot_dates(self):
+        texts = ["03/15/2024 09:00 AM", "garbage", "03/15/2024 09:00 AM"]
+        self.assertEqual(parse_slot_dates(texts), [datetime(2024, 3, 15, 9, 0), None, datetime(2024, 3, 15, 9, 0)])
+
+    def test_parse_time_data(self):
+        time_data = [
+            {"LocationId": 1, "FirstOpenSlot": "5 Appointments Available <br/> Next Available: 03/15/2024 09:00 AM"},
+            {"LocationId": 2, "FirstOpenSlot": "No Appointments Available"},
+            {"LocationId": 3},
+        ]
+        self.assertEqual(parse_time_data(time_data), {1: datetime(2024, 3, 15, 9, 0), 2: None, 3: None})
+
+
+class TestPortalClock(unittest.TestCase):
+    def test_portal_now(self):
+        """The portal's wall-clock time, whatever the machine's zone, with daylight saving time"""
+        if portal_zone() is None:
+            self.skipTest("no time zone database")
+        self.assertIs(portal_zone(), portal_zone())
+        self.assertEqual(portal_now(datetime(2024, 1, 15, 17, 0, tzinfo=timezone.utc)), datetime(2024, 1, 15, 12, 0))
+        self.assertEqual(portal_now(datetime(2024, 7, 15, 17, 0, tzinfo=timezone.utc)), datetime(2024, 7, 15, 13, 0))
+        self.assertIsNone(portal_now().tzinfo)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from locationRetriever import Filter
+from snapshotCache import SnapshotCache
+
+
+class FakeRetriever:
+    """Counts fetches and optionally blocks in them, like a slow portal"""
+    def __init__(self, delay=0.0, fail=False):
+        self.locations = []
+        self.fetched_at = None
+        self.delay = delay
+        self.fail = fail
+        self.fetches = 0
+
+    def fetch_locations(self):
+        self.fetches += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise ValueError("Couldn't find data.")
+        self.locations = [f"snapshot {self.fetches}"]
+        self.fetched_at = time.time()
+        return True
+
+
+class TestSnapshotCache(unittest.TestCase):
+    def test_fresh_snapshot_served_from_memory(self):
+        retriever = FakeRetriever()
+        cache = SnapshotCache(retriever, ttl=60)
+        self.assertEqual(cache.get(), ["snapshot 1"])
+        self.assertEqual(cache.get(), ["snapshot 1"])
+        self.assertEqual(retriever.fetches, 1)
+        self.assertEqual(cache.hits, 1)
+
+    def test_concurrent_callers_share_one_fetch(self):
+        """N threads hitting an empty cache trigger exactly one request"""
+        retriever = FakeRetriever(delay=0.1)
+        cache = SnapshotCache(retriever, ttl=60)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get())) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(retriever.fetches, 1)
+        self.assertEqual(results, [["snapshot 1"]] * 10)
+
+    def test_stale_while_revalidate(self):
+        """A stale snapshot is returned immediately while a single background refresh replaces it"""
+        retriever = FakeRetriever(delay=0.05)
+        cache = SnapshotCache(retriever, ttl=0, stale_ttl=60)
+        cache.get()
+        start = time.perf_counter()
+        self.assertEqual(cache.get(), ["snapshot 1"])
+        self.assertEqual(cache.get(), ["snapshot 1"])
+        self.assertLess(time.perf_counter() - start, 0.05)
+        time.sleep(0.2)
+        self.assertEqual(retriever.fetches, 2)
+        self.assertEqual(retriever.locations, ["snapshot 2"])
+
+    def test_expired_refresh_error_is_raised(self):
+        cache = SnapshotCache(FakeRetriever(fail=True), ttl=0, stale_ttl=0)
+        with self.assertRaises(ValueError):
+            cache.get()
+
+    def test_last_good_snapshot_after_failure(self):
+        """Once a snapshot was fetched, a failed refresh serves it again (flagged stale) instead of raising"""
+        retriever = FakeRetriever()
+        cache = SnapshotCache(retriever, ttl=0, stale_ttl=0)
+        self.assertEqual(cache.get(), ["snapshot 1"])
+        retriever.fail = True
+        self.assertEqual(cache.get(), ["snapshot 1"])
+        self.assertTrue(cache.stale)
+        self.assertEqual(cache.fallbacks, 1)
+        with self.assertRaises(ValueError):
+            cache.fetch_locations()
+
+        retriever.fail = False
+        self.assertEqual(cache.get(), ["snapshot 4"])
+        self.assertFalse(cache.stale)
+
+    def test_filters_share_cache(self):
+        """Filters built on the cache don't fetch on their own"""
+        retriever = MagicMock()
+        retriever.locations = []
+        retriever.fetched_at = None
+
+        def fetch():
+            retriever.fetched_at = time.time()
+        retriever.fetch_locations.side_effect = fetch
+
+        cache = SnapshotCache(retriever, ttl=60)
+        for days in (1, 3, 7):
+            self.assertEqual(Filter(days, cache).filter(), [])
+        retriever.fetch_locations.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
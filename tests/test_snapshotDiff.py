@@ -0,0 +1,53 @@
+import unittest
+from datetime import timedelta
+
+from snapshotDiff import SnapshotDiffer, NEW, EARLIER, MORE_SLOTS, GONE
+from tests.helpers import NOW, make_location
+
+
+class TestSnapshotDiffer(unittest.TestCase):
+    def test_first_snapshot_is_all_new(self):
+        differ = SnapshotDiffer()
+        events = differ.update([make_location(1), make_location(2)])
+        self.assertEqual([(event.kind, event.key) for event in events], [(NEW, 1), (NEW, 2)])
+
+    def test_unchanged_snapshot_has_no_events(self):
+        """Equal values in freshly built objects don't trigger anything"""
+        differ = SnapshotDiffer()
+        differ.update([make_location(1), make_location(2)])
+        self.assertEqual(differ.update([make_location(1), make_location(2)]), [])
+
+    def test_changes(self):
+        """Earlier dates, more slots, new and disappeared locations are each reported once"""
+        differ = SnapshotDiffer()
+        differ.update([make_location(1, days=3), make_location(2, appointments=2), make_location(3), make_location(4)])
+        events = differ.update([
+            make_location(1, days=2),  # earlier
+            make_location(2, appointments=4),  # more slots
+            make_location(3, days=5),  # later: not interesting
+            make_location(5),  # new
+        ])
+        self.assertEqual([(event.kind, event.key) for event in events],
+                         [(EARLIER, 1), (MORE_SLOTS, 2), (NEW, 5), (GONE, 4)])
+        self.assertEqual(events[0].previous.next_appointment_date, NOW + timedelta(days=3))
+
+        # the new snapshot becomes the reference for the next diff
+        events = differ.update([make_location(1, days=2), make_location(5)])
+        self.assertEqual([(event.kind, event.key) for event in events], [(GONE, 2), (GONE, 3)])
+
+    def test_multi_service_keys(self):
+        """The same LocationId in two services is tracked separately"""
+        differ = SnapshotDiffer()
+        differ.update({12: [make_location(1)], 15: [make_location(1)]})
+        events = differ.update({12: [make_location(1)]})
+        self.assertEqual([(event.kind, event.key) for event in events], [(GONE, (15, 1))])
+
+    def test_falls_back_to_name_without_id(self):
+        differ = SnapshotDiffer()
+        differ.update([make_location(None, name="Edison")])
+        events = differ.update([make_location(None, name="Edison", days=0)])
+        self.assertEqual([(event.kind, event.key) for event in events], [(EARLIER, "Edison")])
+
+
+if __name__ == "__main__":
+    unittest.main()
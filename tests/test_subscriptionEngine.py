@@ -0,0 +1,78 @@
+import unittest
+from datetime import datetime
+
+from benchmarks.bench_subscriptions import NOW, build_snapshot, build_subscriptions, per_rule_match
+from metrics import Metrics
+from subscriptionEngine import Subscription, SubscriptionEngine
+from tests.helpers import make_location
+
+
+class TestSubscriptionEngine(unittest.TestCase):
+    def setUp(self):
+        self.edison = make_location(1, 10, days=2, name="Edison")
+        self.newark = make_location(2, 2, days=1, name="Newark", city="Newark", zip_code="07102")
+        self.trenton = make_location(3, days=10, name="Trenton", city="Trenton", zip_code="08611")
+        self.past = make_location(4, days=-1, name="Lodi", city="Lodi", zip_code="07644")
+        self.snapshot = [self.trenton, self.edison, self.past, self.newark]
+
+    def names(self, results):
+        return {subscriber: [location.name for _, location in pairs] for subscriber, pairs in results.items()}
+
+    def test_days_places_and_appointments(self):
+        engine = SubscriptionEngine([
+            Subscription("anywhere-week", 7),
+            Subscription("anywhere-month", 30),
+            Subscription("edison", 30, cities=("EDISON",)),
+            Subscription("trenton-zip", 30, zips=("08611",)),
+            Subscription("busy", 30, min_appointments=5),
+            Subscription("nobody", 0.5),
+        ])
+        self.assertEqual(self.names(engine.match(self.snapshot, NOW)), {
+            "anywhere-week": ["Newark", "Edison"],
+            "anywhere-month": ["Newark", "Edison", "Trenton"],
+            "edison": ["Edison"],
+            "trenton-zip": ["Trenton"],
+            "busy": ["Edison"],
+        })
+
+    def test_city_or_zip_reported_once(self):
+        """A location listed both by city and by zip (or by two subscriptions of one subscriber) appears once"""
+        engine = SubscriptionEngine([
+            Subscription("user", 30, cities=("Edison",), zips=("08817",)),
+            Subscription("user", 7, cities=("Edison", "Newark")),
+        ])
+        self.assertEqual(self.names(engine.match(self.snapshot, NOW)), {"user": ["Newark", "Edison"]})
+
+    def test_services(self):
+        engine = SubscriptionEngine([Subscription("any", 30), Subscription("road-test", 30, service=14)])
+        results = engine.match({12: [self.edison], 14: [self.newark]}, NOW)
+        self.assertEqual(results["any"], [(14, self.newark), (12, self.edison)])
+        self.assertEqual(results["road-test"], [(14, self.newark)])
+
+    def test_add_and_remove_rebuild_index(self):
+        engine = SubscriptionEngine([Subscription("a", 30)])
+        self.assertEqual(set(engine.match(self.snapshot, NOW)), {"a"})
+        engine.add(Subscription("b", 30, cities=("Trenton",)))
+        self.assertEqual(set(engine.match(self.snapshot, NOW)), {"a", "b"})
+        engine.remove("a")
+        self.assertEqual(set(engine.match(self.snapshot, NOW)), {"b"})
+        self.assertEqual(len(engine), 1)
+
+    def test_matches_per_rule_filtering(self):
+        snapshot = build_snapshot(60)
+        subscriptions = build_subscriptions(500, [location.zip_code for location in snapshot])
+        metrics = Metrics()
+        results = SubscriptionEngine(subscriptions, metrics=metrics).match(snapshot, NOW)
+        self.assertEqual(results, per_rule_match(subscriptions, snapshot, NOW))
+        self.assertEqual(metrics.snapshot()["counters"]["subscription_matches"], len(results))
+
+    def test_unknown_dates_and_empty_snapshot(self):
+        unknown = make_location(days=1, name="Wayne", city="Wayne", zip_code="07470")
+        unknown.next_appointment_date = "Unknown"
+        engine = SubscriptionEngine([Subscription("a", 30)])
+        self.assertEqual(engine.match([unknown], NOW), {})
+        self.assertEqual(engine.match([], datetime.now()), {})
+
+
+if __name__ == "__main__":
+    unittest.main()